@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+
+"""bulk.py
+
+Bulk JSONL/CSV import and NDJSON export of conferences, sessions and
+speakers, used by the /admin/import and /admin/export handlers in main.py
+
+Import records carry a "kind" of Speaker, Conference or Session and an
+optional "ref" that later records can use to point at them. Sessions name
+their conference in "conference" and their speaker in "speaker", each as
+a ref from the same import, a websafe key, or (speakers only) the exact
+displayName of an existing Speaker. Records are read as a stream and
+written in chunks of IMPORT_CHUNK_SIZE: each chunk allocates ids with one
+allocate_ids call per (kind, parent) and stores entities with put_multi,
+all running as parallel tasklets. Only the ref -> key map is kept across
+chunks, so a record may only refer to records before it.
+
+Bulk-created conferences and sessions do not send confirmation emails or
+trigger the featured speaker check.
+
+"""
+
+import csv
+import itertools
+import json
+from datetime import date
+from datetime import datetime
+
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import Profile
+from models import Session
+from models import SessionTypes
+from models import Speaker
+from settings import CONFERENCE_DEFAULTS
+from settings import SESSION_DEFAULTS
+
+IMPORT_CHUNK_SIZE = 500
+EXPORT_BATCH_SIZE = 200
+EXPORT_KINDS = ('Conference', 'Session', 'Speaker')
+CSV_LIST_SEPARATOR = ';'
+
+
+class RecordError(Exception):
+    """RecordError -- a record that can not be imported"""
+
+
+def readRecords(stream, fmt='jsonl'):
+    """Yield (line number, record dict) from a JSONL or CSV stream."""
+    if fmt == 'csv':
+        for lineno, row in enumerate(csv.DictReader(stream), 2):
+            record = dict((k, v) for k, v in row.items() if v not in (None, ''))
+            if 'topics' in record:
+                record['topics'] = record['topics'].split(CSV_LIST_SEPARATOR)
+            yield lineno, record
+        return
+    for lineno, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield lineno, json.loads(line)
+        except ValueError as e:
+            yield lineno, {'_error': 'invalid JSON: %s' % e}
+
+
+def _parseDate(value, field):
+    try:
+        return datetime.strptime(value[:10], "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        raise RecordError("'%s' must be YYYY-MM-DD" % field)
+
+
+def _parseInt(value, field):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RecordError("'%s' must be an integer" % field)
+
+
+class Importer(object):
+    """Validate and write import records; see module docstring."""
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.refs = {}              # ref: ndb.Key
+        self.speakerNames = {}      # ref, key or name: (ndb.Key, displayName)
+        self.pendingSpeakerNames = {}   # ndb.Key: displayName, for imported Speakers
+        self.created = dict((kind, 0) for kind in EXPORT_KINDS)
+        self.errors = []
+        self.liveConferences = {}   # ndb.Key: whether it exists and is not deleted
+        self.touchedConferences = set()
+        self.speakerSessions = []   # Sessions written in this chunk that have a speaker
+
+    # - - - validation - - - - - - - - - - - - - - - - - - - - - -
+
+    def _resolveKey(self, value, kind, field):
+        if not value:
+            raise RecordError("'%s' field required" % field)
+        if value in self.refs:
+            key = self.refs[value]
+        else:
+            try:
+                key = ndb.Key(urlsafe=value)
+            except Exception:
+                key = None
+        if key is None or key.kind() != kind:
+            raise RecordError("'%s' is not a %s ref or key: %s" % (field, kind, value))
+        return key
+
+    def _resolveSpeaker(self, value):
+        """Return (speaker key, displayName) for a ref, key or name."""
+        if value in self.speakerNames:
+            return self.speakerNames[value]
+        try:
+            key = self._resolveKey(value, 'Speaker', 'speaker')
+        except RecordError:
+            key = None
+        if key is not None:
+            if value in self.refs:
+                return key, self.pendingSpeakerNames[key]
+            speaker = key.get()
+        else:
+            speaker = Speaker.query(Speaker.displayName==value).get()
+        if speaker is None:
+            raise RecordError("no Speaker found for 'speaker': %s" % value)
+        self.speakerNames[value] = (speaker.key, speaker.displayName)
+        return self.speakerNames[value]
+
+    def _conferenceData(self, record):
+        if not record.get('name'):
+            raise RecordError("Conference 'name' field required")
+        if not record.get('organizerUserId'):
+            raise RecordError("Conference 'organizerUserId' field required")
+        data = dict((name, record.get(name)) for name in (
+            'name', 'description', 'organizerUserId', 'topics', 'city',
+            'startDate', 'endDate', 'maxAttendees'))
+        for df in CONFERENCE_DEFAULTS:
+            if data.get(df) in (None, []):
+                data[df] = CONFERENCE_DEFAULTS[df]
+        data['maxAttendees'] = _parseInt(data['maxAttendees'], 'maxAttendees')
+        data['seatsAvailable'] = data['maxAttendees']
+        data['month'] = 0
+        if data['startDate']:
+            data['startDate'] = _parseDate(data['startDate'], 'startDate')
+            data['month'] = data['startDate'].month
+        if data['endDate']:
+            data['endDate'] = _parseDate(data['endDate'], 'endDate')
+        parent = ndb.Key(Profile, data['organizerUserId'])
+        return parent, data
+
+    def _sessionData(self, record):
+        if not record.get('name'):
+            raise RecordError("Session 'name' field required")
+        parent = self._resolveKey(record.get('conference'), 'Conference', 'conference')
+        if record['conference'] not in self.refs:
+            if parent not in self.liveConferences:
+                conf = parent.get()
+                self.liveConferences[parent] = bool(conf and not conf.deleted)
+            if not self.liveConferences[parent]:
+                raise RecordError("no Conference found for 'conference': %s"
+                                  % record['conference'])
+        data = dict((name, record.get(name)) for name in (
+            'name', 'highlights', 'duration', 'typeOfSession'))
+        for df in SESSION_DEFAULTS:
+            if data.get(df) in (None, []):
+                data[df] = SESSION_DEFAULTS[df]
+        data['duration'] = _parseInt(data['duration'], 'duration')
+        if data['typeOfSession'] is None:
+            del data['typeOfSession']
+        else:
+            try:
+                data['typeOfSession'] = str(SessionTypes(str(data['typeOfSession'])))
+            except TypeError:
+                raise RecordError("unknown 'typeOfSession': %s" % data['typeOfSession'])
+        if record.get('date') and record.get('startTime'):
+            try:
+                data['startDateTime'] = datetime.strptime(
+                    record['date'][:10] + ' ' + record['startTime'][:5], "%Y-%m-%d %H:%M")
+            except ValueError:
+                raise RecordError("'date'/'startTime' must be YYYY-MM-DD and HH:MM")
+        if record.get('speaker'):
+            sp_key, name = self._resolveSpeaker(record['speaker'])
+            data['speakerKey'] = sp_key
+            data['speakerDisplayName'] = name
+        return parent, data
+
+    def _speakerData(self, record):
+        if not record.get('displayName'):
+            raise RecordError("Speaker 'displayName' field required")
+        data = dict((name, record.get(name)) for name in (
+            'displayName', 'profileKey', 'biography'))
+        return None, data
+
+    # - - - writing - - - - - - - - - - - - - - - - - - - - - - - -
+
+    @ndb.tasklet
+    def _allocateKeys(self, model, parent, count):
+        first, last = yield model.allocate_ids_async(size=count, parent=parent)
+        raise ndb.Return([ndb.Key(model, i, parent=parent)
+                          for i in range(first, last + 1)])
+
+    def _writeGroup(self, model, items):
+        """Create one kind's entities from [(ref, parent, data)]; return
+        the put futures.
+        """
+        if not items:
+            return []
+        groups = {}
+        for item in items:
+            groups.setdefault(item[1], []).append(item)
+        futures = dict((parent, self._allocateKeys(model, parent, len(group)))
+                       for parent, group in groups.items())
+        entities = []
+        for parent, group in groups.items():
+            for (ref, _, data), key in zip(group, futures[parent].get_result()):
+                entities.append(model(key=key, **data))
+                if ref:
+                    self.refs[ref] = key
+        if model is Speaker:
+            for entity in entities:
+                self.pendingSpeakerNames[entity.key] = entity.displayName
+        self.created[model._get_kind()] += len(entities)
+        if model is Session:
+            self.touchedConferences.update(groups)
+            self.speakerSessions.extend(e for e in entities if e.speakerKey)
+        if model is Conference:
+            import topicindex
+            entities += [topic for conf in entities for topic in topicindex.entitiesFor(conf)]
+        return ndb.put_multi_async(entities)
+
+    def _writeChunk(self, records):
+        # speakers and conferences first so sessions in the chunk can use
+        # their keys; only the key allocation has to happen in that order
+        puts = []
+        for model, build in ((Speaker, self._speakerData),
+                             (Conference, self._conferenceData),
+                             (Session, self._sessionData)):
+            items = []
+            for lineno, record in records:
+                if record.get('kind') != model._get_kind():
+                    continue
+                try:
+                    parent, data = build(record)
+                except RecordError as e:
+                    self.errors.append({'line': lineno, 'error': str(e)})
+                    continue
+                if self.dry_run:
+                    if record.get('ref'):
+                        self.refs[record['ref']] = ndb.Key(model, 'dry-run', parent=parent)
+                        if model is Speaker:
+                            self.pendingSpeakerNames[self.refs[record['ref']]] = data['displayName']
+                    self.created[model._get_kind()] += 1
+                else:
+                    items.append((record.get('ref'), parent, data))
+            puts.extend(self._writeGroup(model, items))
+        ndb.Future.wait_all(puts)
+        for future in puts:
+            future.check_success()
+        # speakers' session lists once the sessions are written
+        if self.speakerSessions:
+            import speakerindex
+            speakerindex.recordMany(self.speakerSessions)
+            self.speakerSessions = []
+
+    def run(self, records):
+        """Import records from readRecords(); return a summary dict."""
+        records = iter(records)
+        while True:
+            chunk = list(itertools.islice(records, IMPORT_CHUNK_SIZE))
+            if not chunk:
+                break
+            for lineno, record in chunk:
+                if '_error' in record:
+                    self.errors.append({'line': lineno, 'error': record['_error']})
+                elif record.get('kind') not in EXPORT_KINDS:
+                    self.errors.append({'line': lineno,
+                                        'error': 'unknown kind: %s' % record.get('kind')})
+            self._writeChunk(chunk)
+        if not self.dry_run:
+            self._invalidateCaches()
+        return {'created': self.created, 'errors': self.errors, 'dryRun': self.dry_run}
+
+    def _invalidateCaches(self):
+        import tasks
+
+        if self.created['Speaker']:
+            tasks.SPEAKER_LIST.invalidate()
+            tasks.SPEAKER_SEARCH.invalidate()
+        for c_key in self.touchedConferences:
+            tasks.sessionsChanged(c_key.urlsafe())
+
+
+# - - - export - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _jsonValue(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, ndb.Key):
+        return value.urlsafe()
+    if isinstance(value, list):
+        return [_jsonValue(v) for v in value]
+    return value
+
+
+def exportLines(kind):
+    """Yield one NDJSON line per entity of kind, a page at a time."""
+    import models   # registers the model classes for _lookup_model
+
+    query = ndb.Model._lookup_model(kind).query()
+    cursor = None
+    more = True
+    while more:
+        entities, cursor, more = query.fetch_page(
+            EXPORT_BATCH_SIZE, start_cursor=cursor)
+        for entity in entities:
+            record = dict((name, _jsonValue(value))
+                          for name, value in entity.to_dict().items())
+            record['kind'] = kind
+            record['websafeKey'] = entity.key.urlsafe()
+            yield json.dumps(record) + '\n'
+        more = more and cursor is not None
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+"""cascade.py
+
+Background cascade deletion of a conference
+
+start() marks the Conference deleted, so reads hide it at once, takes
+its sessions out of their speakers' session lists in the same
+transaction when few enough speakers are involved, and chains a task that works through PHASES one batch per task run: remove
+the conference and its sessions from attendees' profiles, remove its
+sessions from other users' wishlists, then delete its sessions (and
+their entries in speakers' session lists) and the waitlist, ticket and
+counter entities that refer to it, and finally the Conference itself
+with its topic index entities. Every batch is a page of at most
+BATCH_SIZE entities, fetched keys-only unless the sessions themselves
+are needed, so memory use does not grow with the conference, and every
+step is idempotent, so a retried task only repeats work.
+
+Progress is kept in a ConferenceDeletion entity keyed by the websafe
+conference key. Each step records its counts and enqueues the next task
+in one transaction, which does nothing if the step has already been
+recorded, so a retried task can neither count twice nor fork the chain.
+
+"""
+
+from datetime import datetime
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import ConferenceDeletion
+from models import ConferenceSimilarity
+from models import ConferenceTopic
+from models import Profile
+from models import RegistrationCounter
+from models import RegistrationTicket
+from models import Session
+from models import WaitlistEntry
+
+import singleflight
+import speakerindex
+from tasks import MEMCACHE_CONFERENCE_PREFIX
+from tasks import MEMCACHE_RECOMMENDATIONS_PREFIX
+from tasks import sessionsChanged
+
+BATCH_SIZE = 100
+PHASES = ('attendees', 'wishlists', 'sessions', 'waitlist', 'tickets',
+          'counters', 'conference')
+
+
+def start(c_key):
+    """Mark the conference deleted and start the cascade; False if a
+    deletion has already been started.
+    """
+    wsck = c_key.urlsafe()
+
+    @ndb.transactional(xg=True)
+    def txn():
+        conf = c_key.get()
+        if not conf or conf.deleted:
+            return False
+        conf.deleted = True
+        conf.seatsAvailable = 0     # closes registration and announcements too
+        conf.put()
+        # a keys and speakers projection is all the lists need
+        speakerindex.withdraw(Session.query(ancestor=c_key).fetch(
+            projection=[Session.speakerKey]))
+        ConferenceDeletion(id=wsck, status='RUNNING', phase=PHASES[0],
+                           profilesUpdated=0, entitiesDeleted=0, step=-1,
+                           started=datetime.utcnow()).put()
+        _chain(wsck, PHASES[0], 0)
+        return True
+    started = txn()
+    if started:
+        _dropCaches(wsck)
+    return started
+
+
+def _dropCaches(wsck):
+    singleflight.delete(MEMCACHE_CONFERENCE_PREFIX + wsck)
+    sessionsChanged(wsck)
+
+
+def _chain(wsck, phase, step, cursor=None, outer=None):
+    """Enqueue the task for step; call it in a transaction, which adds
+    the task only if it commits.
+    """
+    params = {'websafeConferenceKey': wsck, 'phase': phase, 'step': step}
+    if cursor:
+        params['cursor'] = cursor
+    if outer:
+        params['outer'] = outer
+    taskqueue.add(url='/tasks/delete_conference', params=params,
+                  transactional=True)
+
+
+@ndb.transactional()
+def _removeReferences(p_key, c_key, s_key=None):
+    """Drop c_key and its sessions (or only s_key) from one Profile."""
+    prof = p_key.get()
+    if not prof:
+        return False
+    attending = [k for k in prof.conferenceKeysToAttend if k != c_key]
+    if s_key:
+        wishlist = [k for k in prof.sessionKeysWishList if k != s_key]
+    else:
+        wishlist = [k for k in prof.sessionKeysWishList if k.parent() != c_key]
+    if (len(attending), len(wishlist)) == (
+            len(prof.conferenceKeysToAttend), len(prof.sessionKeysWishList)):
+        return False
+    prof.conferenceKeysToAttend = attending
+    prof.sessionKeysWishList = wishlist
+    prof.put()
+    return True
+
+
+def _cleanProfiles(query, c_key, cursor, s_key=None):
+    """Clean one page of Profiles; return (count updated, next cursor)."""
+    start = ndb.Cursor(urlsafe=cursor) if cursor else None
+    keys, next_cursor, more = query.fetch_page(
+        BATCH_SIZE, keys_only=True, start_cursor=start)
+    updated = [key for key in keys if _removeReferences(key, c_key, s_key)]
+    if updated:
+        memcache.delete_multi([key.id() for key in updated],
+                              key_prefix=MEMCACHE_RECOMMENDATIONS_PREFIX)
+    return len(updated), (next_cursor.urlsafe() if more and next_cursor else None)
+
+
+def _deleteQuery(phase, c_key):
+    wsck = c_key.urlsafe()
+    if phase == 'sessions':
+        return Session.query(ancestor=c_key)
+    if phase == 'waitlist':
+        return WaitlistEntry.query(WaitlistEntry.conferenceKey==wsck)
+    if phase == 'tickets':
+        return RegistrationTicket.query(RegistrationTicket.conferenceKey==wsck)
+    return RegistrationCounter.query(RegistrationCounter.conferenceKey==wsck)
+
+
+@ndb.transactional()
+def _record(wsck, step, phase, profiles=0, deleted=0, next_cursor=None,
+            next_outer=None, done=False):
+    """Record the counts of step and chain the next step, unless a
+    retried run of step has already done so.
+    """
+    deletion = ConferenceDeletion.get_by_id(wsck)
+    if not deletion or deletion.step >= step:
+        return
+    deletion.step = step
+    deletion.phase = phase
+    deletion.profilesUpdated += profiles
+    deletion.entitiesDeleted += deleted
+    if done:
+        deletion.status = 'DONE'
+        deletion.finished = datetime.utcnow()
+    else:
+        _chain(wsck, phase, step + 1, next_cursor, next_outer)
+    deletion.put()
+
+
+def runStep(wsck, phase, step, cursor=None, outer=None):
+    """Run one batch of phase and chain the next task."""
+    c_key = ndb.Key(urlsafe=wsck)
+    next_cursor, next_outer = None, outer
+    profiles = deleted = 0
+
+    if phase == 'attendees':
+        query = Profile.query(Profile.conferenceKeysToAttend.bothForms(c_key)) \
+            .order(Profile.key)
+        profiles, next_cursor = _cleanProfiles(query, c_key, cursor)
+        advance = not next_cursor
+
+    elif phase == 'wishlists':
+        # one session at a time: outer is the cursor past the current
+        # session, cursor pages through the profiles wishlisting it
+        start = ndb.Cursor(urlsafe=outer) if outer else None
+        s_keys, after, more = Session.query(ancestor=c_key).fetch_page(
+            1, keys_only=True, start_cursor=start)
+        advance = not s_keys
+        if s_keys:
+            # IN queries need key order to be paged with cursors
+            query = Profile.query(Profile.sessionKeysWishList.bothForms(s_keys[0])) \
+                .order(Profile.key)
+            profiles, next_cursor = _cleanProfiles(query, c_key, cursor, s_keys[0])
+            if not next_cursor:
+                advance = not (more and after)
+                next_outer = after.urlsafe() if after else None
+
+    elif phase == 'conference':
+        topics = ConferenceTopic.query(ancestor=c_key).fetch(keys_only=True)
+        ndb.delete_multi([c_key, ndb.Key(ConferenceSimilarity, wsck)] + topics)
+        _dropCaches(wsck)
+        _record(wsck, step, phase, deleted=1, done=True)
+        return
+
+    else:
+        # deleted keys drop out of the query, so every page starts over
+        if phase == 'sessions':
+            sessions = _deleteQuery(phase, c_key).fetch(BATCH_SIZE)
+            speakerindex.forget(sessions)
+            keys = [session.key for session in sessions]
+        else:
+            keys = _deleteQuery(phase, c_key).fetch(BATCH_SIZE, keys_only=True)
+        ndb.delete_multi(keys)
+        deleted = len(keys)
+        advance = len(keys) < BATCH_SIZE
+
+    if advance:
+        phase = PHASES[PHASES.index(phase) + 1]
+        next_cursor = next_outer = None
+    _record(wsck, step, phase, profiles, deleted, next_cursor, next_outer)
@@ -13,58 +13,106 @@ created by wesc on 2014 apr 21
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
 
+import httplib
+import logging
+import operator
+import time
 from datetime import datetime
+from datetime import timedelta
 
 import endpoints
 from protorpc import messages
 from protorpc import message_types
+from protorpc import protojson
 from protorpc import remote
 
 from google.appengine.api import memcache
 from google.appengine.api import taskqueue
 from google.appengine.ext import ndb
 
-from models import ConflictException
 from models import Profile
 from models import ProfileMiniForm
 from models import ProfileForm
 from models import StringMessage
 from models import BooleanMessage
+from models import BatchCallForms, BatchResultForm, BatchResultForms
 from models import Conference
 from models import ConferenceForm
+from models import ConferenceDeletion
+from models import ConferenceDeletionForm
+from models import ConferenceSimilarity
+from models import ConferenceTopic
 from models import ConferenceForms
 from models import ConferenceQueryForm
 from models import ConferenceQueryForms
 from models import TeeShirtSize
+from models import RegistrationBucketForm
+from models import RegistrationStatsForm
+from models import RegistrationTicketForm
 from models import Session, SessionForm, SessionForms, SessionTypes
 from models import Speaker, SpeakerForm, SpeakerForms
+from models import TimetableDayForm, TimetableForm, TimetableSlotForm
 
 from settings import WEB_CLIENT_ID
 from settings import ANDROID_CLIENT_ID
 from settings import IOS_CLIENT_ID
 from settings import ANDROID_AUDIENCE
+from settings import TIME_BUDGETS
+from settings import CONFERENCE_DEFAULTS
+from settings import SESSION_DEFAULTS
 
 from utils import getUserId
 
+import cascade
+import datebuckets
+import deadline
+import idpool
+import lrucache
+import profiler
+import ratelimit
+import regqueue
+import regstats
+
+import singleflight
+import speakerindex
+import tasks
+import topicindex
+import waitlist
+from tasks import MEMCACHE_CONFERENCE_PREFIX
+from tasks import MEMCACHE_RECOMMENDATIONS_PREFIX
+from tasks import MEMCACHE_SESSIONS_PREFIX
+from tasks import MEMCACHE_TIMETABLE_GEN_PREFIX
+from tasks import SPEAKER_LIST
+from tasks import SPEAKER_LIST_PAGE_SIZE
+from tasks import SPEAKER_SEARCH
+
 EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
-MEMCACHE_FEATURED_SPEAKER_KEY = "FEATURED_SPEAKER"
-MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
-ANNOUNCEMENT_TPL = ('Last chance to attend! The following conferences '
-                    'are nearly sold out: %s')
+MEMCACHE_TIMETABLE_PREFIX = "CONFERENCE_TIMETABLE:"
+TIMETABLE_CACHE_TTL = 24 * 3600
+MAX_TIMETABLE_DAYS = 7
+CONFERENCE_CACHE_TTL = 60
+RECOMMENDATIONS_TTL = 6 * 3600
+MAX_RECOMMENDATIONS = 10
+
+ORGANIZER_NAMES = lrucache.TwoTierCache('organizerNames', max_entries=5000)
+SPEAKER_NAMES = lrucache.TwoTierCache('speakerNames', max_entries=5000)
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-CONFERENCE_DEFAULTS = {
-    "city": "Default City",
-    "maxAttendees": 0,
-    "seatsAvailable": 0,
-    "topics": [ "Default", "Topic" ],
-}
+class ConflictException(endpoints.ServiceException):
+    """ConflictException -- exception mapped to HTTP 409 response"""
+    http_status = httplib.CONFLICT
+
+class TooManyRequestsException(endpoints.ServiceException):
+    """TooManyRequestsException -- exception mapped to HTTP 429 response"""
+    http_status = 429
 
-SESSION_DEFAULTS = {
-    'highlights': 'To be announced',
-    'duration': 60,
-}
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_SCAN_RESULTS = 1000     # per call of the endpoints that list everything
+MAX_SPEAKER_SEARCH_RESULTS = 50
+MAX_SPEAKER_PREFIX = 100
+MAX_BATCH_CALLS = 20
 
 OPERATORS = {
             'EQ':   '=',
@@ -75,12 +123,39 @@ OPERATORS = {
             'NE':   '!='
             }
 
+# the OPERATORS applied in memory, for filters a query cannot serve
+COMPARISONS = {
+            '=':  operator.eq,
+            '>':  operator.gt,
+            '>=': operator.ge,
+            '<':  operator.lt,
+            '<=': operator.le,
+            '!=': operator.ne,
+            }
+
 FIELDS =    {
             'CITY': 'city',
             'TOPIC': 'topics',
             'MONTH': 'month',
             'MAX_ATTENDEES': 'maxAttendees',
+            'SEATS_AVAILABLE': 'seatsAvailable',
+            'START_DATE': 'startDate',
+            'END_DATE': 'endDate',
+            }
+
+# date fields and the bucket property that serves their range filters
+DATE_BUCKETS = {
+            'startDate': 'startBuckets',
+            'endDate': 'endBuckets',
             }
+# IN subqueries one queryConferences call may fan out into
+MAX_DATE_SUBQUERIES = 30
+# fields a date or seatsAvailable filter can be combined with, and those
+# an open-ended date range (which takes the inequality) can be; index.yaml
+# has a composite index for every combination these allow
+RANGE_FIELDS = ('seatsAvailable', 'startDate', 'endDate')
+RANGE_COMBINABLE = RANGE_FIELDS + ('city', 'topics')
+OPEN_RANGE_COMBINABLE = ('city', 'topics')
 
 CONF_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
@@ -100,6 +175,8 @@ SESSION_POST_REQUEST = endpoints.ResourceContainer(
 SESSIONS_BY_SPEAKER = endpoints.ResourceContainer(
     message_types.VoidMessage,
     speakerKey=messages.StringField(1),
+    pageToken=messages.StringField(2),
+    limit=messages.IntegerField(3, variant=messages.Variant.INT32),
 )
 
 SESSIONS_BY_TYPE = endpoints.ResourceContainer(
@@ -112,6 +189,38 @@ SESSION_WISH_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeSessionKey=messages.StringField(1),
 )
+
+REGISTRATION_STATS_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    granularity=messages.StringField(2),
+)
+
+SPEAKER_SEARCH_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    prefix=messages.StringField(1),
+    limit=messages.IntegerField(2, variant=messages.Variant.INT32),
+)
+
+TIMETABLE_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    day=messages.StringField(2),
+    days=messages.IntegerField(3, variant=messages.Variant.INT32),
+)
+
+PAGE_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    pageToken=messages.StringField(1),
+    limit=messages.IntegerField(2, variant=messages.Variant.INT32),
+)
+
+CONF_PAGE_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    pageToken=messages.StringField(2),
+    limit=messages.IntegerField(3, variant=messages.Variant.INT32),
+)
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 
@@ -152,6 +261,11 @@ class ConferenceApi(remote.Service):
         if not request.name:
             raise endpoints.BadRequestException("Conference 'name' field required")
 
+        # the Conference id is allocated under the organizer's Profile while
+        # the transaction below begins, not in a round trip of its own
+        p_key = ndb.Key(Profile, user_id)
+        c_ids = Conference.allocate_ids_async(size=1, parent=p_key)
+
         # copy ConferenceForm/ProtoRPC Message into dict
         data = {field.name: getattr(request, field.name) for field in request.all_fields()}
         del data['websafeKey']
@@ -175,17 +289,17 @@ class ConferenceApi(remote.Service):
         # set seatsAvailable to be same as maxAttendees on creation
         if data["maxAttendees"] > 0:
             data["seatsAvailable"] = data["maxAttendees"]
-        # generate Profile Key based on user ID and Conference
-        # ID based on Profile key get Conference key from ID
-        p_key = ndb.Key(Profile, user_id)
-        c_id = Conference.allocate_ids(size=1, parent=p_key)[0]
-        c_key = ndb.Key(Conference, c_id, parent=p_key)
-        data['key'] = c_key
         data['organizerUserId'] = request.organizerUserId = user_id
 
         # create Conference, send email to organizer confirming
         # creation of Conference & return (modified) ConferenceForm
-        Conference(**data).put()
+        conf = Conference(**data)
+
+        @ndb.transactional()
+        def txn():
+            conf.key = ndb.Key(Conference, c_ids.get_result()[0], parent=p_key)
+            ndb.put_multi([conf] + topicindex.entitiesFor(conf))
+        txn()
         taskqueue.add(params={'email': user.email(),
             'conferenceInfo': repr(request)},
             url='/tasks/send_confirmation_email'
@@ -207,7 +321,7 @@ class ConferenceApi(remote.Service):
         conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
 
         # check that conf.key is a Conference key and it exists
-        self._checkKey(conf.key, request.websafeConferenceKey, 'Conference')
+        self._checkConference(conf, request.websafeConferenceKey)
 
         # check that user is owner
         if user_id != conf.organizerUserId:
@@ -228,20 +342,25 @@ class ConferenceApi(remote.Service):
                 # write to Conference object
                 setattr(conf, field.name, data)
         conf.put()
+        topicindex.sync(conf)
+        self._onCommit(singleflight.delete, MEMCACHE_CONFERENCE_PREFIX + conf.key.urlsafe())
         prof = ndb.Key(Profile, user_id).get()
         return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
 
 
     @endpoints.method(ConferenceForm, ConferenceForm, path='conference',
             http_method='POST', name='createConference')
+    @profiler.profiled
     def createConference(self, request):
         """Create new conference."""
+        self._checkRateLimit('create')
         return self._createConferenceObject(request)
 
 
     @endpoints.method(CONF_POST_REQUEST, ConferenceForm,
             path='conference/{websafeConferenceKey}',
             http_method='PUT', name='updateConference')
+    @profiler.profiled
     def updateConference(self, request):
         """Update conference w/provided fields & return w/updated info."""
         return self._updateConferenceObject(request)
@@ -250,22 +369,76 @@ class ConferenceApi(remote.Service):
     @endpoints.method(CONF_GET_REQUEST, ConferenceForm,
             path='conference/{websafeConferenceKey}',
             http_method='GET', name='getConference')
+    @profiler.profiled
     def getConference(self, request):
         """Return requested conference (by websafeConferenceKey)."""
-        # get Conference object from request; bail if not found
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        wsck = request.websafeConferenceKey
 
-        # check that conf.key is a Conference key and it exists
-        self._checkKey(conf.key, request.websafeConferenceKey, 'Conference')
+        def load():
+            # get Conference object from request; bail if not found
+            conf = ndb.Key(urlsafe=wsck).get()
+
+            # check that conf.key is a Conference key and it exists
+            self._checkConference(conf, wsck)
+
+            return conf, self._organizerNames([conf.organizerUserId]).get(conf.organizerUserId)
 
-        prof = conf.key.parent().get()
+        conf, displayName = singleflight.get(
+            MEMCACHE_CONFERENCE_PREFIX + wsck, load, CONFERENCE_CACHE_TTL)
         # return ConferenceForm
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        return self._copyConferenceToForm(conf, displayName)
+
+
+    def _copyDeletionToForm(self, wsck, deletion):
+        """Copy relevant fields from ConferenceDeletion to ConferenceDeletionForm."""
+        return ConferenceDeletionForm(
+            websafeConferenceKey=wsck,
+            status=deletion.status,
+            phase=deletion.phase,
+            profilesUpdated=deletion.profilesUpdated,
+            entitiesDeleted=deletion.entitiesDeleted,
+            started=str(deletion.started),
+            finished=str(deletion.finished) if deletion.finished else None)
+
+    @endpoints.method(CONF_GET_REQUEST, ConferenceDeletionForm,
+            path='conference/{websafeConferenceKey}/deletion',
+            http_method='POST', name='deleteConference')
+    @profiler.profiled
+    def deleteConference(self, request):
+        """Delete a conference with its sessions and every reference to it.
+        The conference is hidden at once; the rest runs in the background,
+        see getConferenceDeletion. Open only to the organizer of the conference."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        wsck = request.websafeConferenceKey
+        conf = self._ndbKey(urlsafe=wsck).get()
+        self._checkConference(conf, wsck)
+        if getUserId(user) != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the owner can delete the conference.')
+        if not cascade.start(conf.key):
+            raise ConflictException('This conference is already being deleted')
+        return self._copyDeletionToForm(wsck, ConferenceDeletion.get_by_id(wsck))
+
+    @endpoints.method(CONF_GET_REQUEST, ConferenceDeletionForm,
+            path='conference/{websafeConferenceKey}/deletion',
+            http_method='GET', name='getConferenceDeletion')
+    @profiler.profiled
+    def getConferenceDeletion(self, request):
+        """Return the progress of a conference deletion."""
+        wsck = request.websafeConferenceKey
+        deletion = ConferenceDeletion.get_by_id(wsck)
+        if not deletion:
+            raise endpoints.NotFoundException(
+                'No deletion found for conference: %s' % wsck)
+        return self._copyDeletionToForm(wsck, deletion)
 
 
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
             path='getConferencesCreated',
             http_method='POST', name='getConferencesCreated')
+    @profiler.profiled
     def getConferencesCreated(self, request):
         """Return conferences created by user."""
         # make sure user is authed
@@ -275,38 +448,87 @@ class ConferenceApi(remote.Service):
         user_id = getUserId(user)
 
         # create ancestor query for all key matches for this user
-        confs = Conference.query(ancestor=ndb.Key(Profile, user_id))
-        prof = ndb.Key(Profile, user_id).get()
+        confs = [conf for conf in Conference.query(ancestor=ndb.Key(Profile, user_id))
+                 if not conf.deleted]
+        displayName = self._organizerNames([user_id]).get(user_id)
         # return set of ConferenceForm objects per Conference
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, getattr(prof, 'displayName')) for conf in confs]
+            items=[self._copyConferenceToForm(conf, displayName) for conf in confs]
         )
 
 
     def _getQuery(self, request):
-        """Return formatted query from the submitted filters."""
-        q = Conference.query()
-        inequality_filter, filters = self._formatFilters(request.filters)
+        """Return formatted query from the submitted filters, the date
+        ranges its results still have to be trimmed to, and the filters
+        left to apply to them in memory."""
+        inequality_filter, filters, date_ranges = self._formatFilters(request.filters)
+        for filtr in filters:
+            if filtr["field"] in ["month", "maxAttendees", "seatsAvailable"]:
+                filtr["value"] = int(filtr["value"])
+
+        # topic filters go to the per-topic index, which carries only some
+        # fields; the first topic filter picks its entities, the rest and
+        # the fields it lacks are checked on the fetched conferences
+        model, queryable, residual = Conference, None, []
+        topic_filters = [f for f in filters if f["field"] == "topics"]
+        if topic_filters:
+            model, queryable = ConferenceTopic, topicindex.QUERYABLE
+            residual = [f for f in filters if f is not topic_filters[0] and
+                        f["field"] not in queryable]
+            filters = [dict(topic_filters[0], field="topic")] + \
+                      [f for f in filters if f["field"] in queryable]
+            if inequality_filter == "topics":
+                inequality_filter = "topic"
+            elif inequality_filter not in queryable:
+                inequality_filter = None
+        q = model.query()
 
         # If exists, sort on inequality filter first
         if not inequality_filter:
-            q = q.order(Conference.name)
+            q = q.order(model.name)
         else:
             q = q.order(ndb.GenericProperty(inequality_filter))
-            q = q.order(Conference.name)
+            q = q.order(model.name)
 
         for filtr in filters:
-            if filtr["field"] in ["month", "maxAttendees"]:
-                filtr["value"] = int(filtr["value"])
             formatted_query = ndb.query.FilterNode(filtr["field"], filtr["operator"], filtr["value"])
             q = q.filter(formatted_query)
-        return q
+
+        # a closed date range becomes an equality IN over calendar buckets;
+        # both bucket lists are repeated, so an index holding both would
+        # write a row per pair of buckets: with both ranges given, only the
+        # startDate range uses its buckets and the other is trimmed in memory
+        trim = dict(date_ranges)
+        for field in sorted(date_ranges, key=lambda f: f != 'startDate')[:1]:
+            if queryable and DATE_BUCKETS[field] not in queryable:
+                continue
+            buckets, exact = datebuckets.cover(date_ranges[field][0], date_ranges[field][1],
+                                               MAX_DATE_SUBQUERIES)
+            if buckets:
+                q = q.filter(ndb.GenericProperty(DATE_BUCKETS[field]).IN(buckets))
+            if exact:
+                del trim[field]
+        return q, trim, residual
+
+
+    def _matchesFilter(self, conf, filtr):
+        """Apply a formatted filter to conf the way the datastore would."""
+        compare = COMPARISONS[filtr["operator"]]
+        target = filtr["value"]
+        if isinstance(target, datetime):
+            target = target.date()      # Conference dates are dates
+        values = getattr(conf, filtr["field"])
+        if not isinstance(values, list):
+            values = [values]
+        return any(value is not None and compare(value, target) for value in values)
 
 
     def _formatFilters(self, filters):
-        """Parse, check validity and format user supplied filters."""
+        """Parse, check validity and format user supplied filters.
+        Range filters on dates are returned separately as {field: [lo, hi]}."""
         formatted_filters = []
         inequality_field = None
+        date_ranges = {}
 
         for f in filters:
             filtr = {field.name: getattr(f, field.name) for field in f.all_fields()}
@@ -317,6 +539,28 @@ class ConferenceApi(remote.Service):
             except KeyError:
                 raise endpoints.BadRequestException("Filter contains invalid field or operator.")
 
+            if filtr["field"] in DATE_BUCKETS:
+                try:
+                    value = datetime.strptime(filtr["value"][:10], "%Y-%m-%d")
+                except (TypeError, ValueError):
+                    raise endpoints.BadRequestException(
+                        "Invalid date, expected YYYY-MM-DD: %s" % filtr["value"])
+                filtr["value"] = value
+                # collect range bounds as inclusive dates; they use no
+                # inequality, and an equality is a one-day range
+                if filtr["operator"] in ('=', '>', '>=', '<', '<='):
+                    bounds = date_ranges.setdefault(filtr["field"], [None, None])
+                    value = value.date()
+                    if filtr["operator"] == '>':
+                        value += timedelta(days=1)
+                    elif filtr["operator"] == '<':
+                        value -= timedelta(days=1)
+                    if filtr["operator"] in ('=', '>', '>='):
+                        bounds[0] = max(bounds[0] or value, value)
+                    if filtr["operator"] in ('=', '<', '<='):
+                        bounds[1] = min(bounds[1] or value, value)
+                    continue
+
             # Every operation except "=" is an inequality
             if filtr["operator"] != "=":
                 # check if inequality operation has been used in previous filters
@@ -328,34 +572,82 @@ class ConferenceApi(remote.Service):
                     inequality_field = filtr["field"]
 
             formatted_filters.append(filtr)
-        return (inequality_field, formatted_filters)
+
+        # an open-ended date range has no bucket cover; it needs the inequality
+        for field, (lo, hi) in date_ranges.items():
+            if lo and hi:
+                if lo > hi:
+                    raise endpoints.BadRequestException(
+                        "The %s range is empty." % field)
+                continue
+            if inequality_field and inequality_field != field:
+                raise endpoints.BadRequestException(
+                    "Give both bounds of a %s range when filtering another "
+                    "field by inequality." % field)
+            inequality_field = field
+            formatted_filters.append({"field": field,
+                                      "operator": '>=' if lo else '<=',
+                                      "value": datetime.combine(lo or hi, datetime.min.time())})
+            del date_ranges[field]
+
+        # reject the combinations no composite index serves
+        fields = set(f["field"] for f in formatted_filters) | set(date_ranges)
+        if fields & set(RANGE_FIELDS) and not fields <= set(RANGE_COMBINABLE):
+            raise endpoints.BadRequestException(
+                "START_DATE, END_DATE and SEATS_AVAILABLE filters can only be "
+                "combined with each other, CITY and TOPIC.")
+        for field in fields & set(DATE_BUCKETS) - set(date_ranges):
+            if not fields - set([field]) <= set(OPEN_RANGE_COMBINABLE):
+                raise endpoints.BadRequestException(
+                    "Give both bounds of a %s range to combine it with filters "
+                    "other than CITY and TOPIC." % field)
+        return (inequality_field, formatted_filters, date_ranges)
 
 
     @endpoints.method(ConferenceQueryForms, ConferenceForms,
             path='queryConferences',
             http_method='POST',
             name='queryConferences')
+    @profiler.profiled
     def queryConferences(self, request):
         """Query for conferences."""
-        conferences = self._getQuery(request)
+        q, trim, residual = self._getQuery(request)
 
         # need to fetch organiser displayName from profiles
-        # get all keys and use get_multi for speed
-        organisers = [(ndb.Key(Profile, conf.organizerUserId)) for conf in conferences]
-        profiles = ndb.get_multi(organisers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        if q.kind == 'ConferenceTopic':
+            conferences = topicindex.fetchConferences(q)
+        else:
+            conferences = q.fetch()
+        conferences = [conf for conf in conferences if not conf.deleted]
+        # drop what coarse date buckets matched outside the requested ranges
+        for field, (lo, hi) in trim.items():
+            conferences = [conf for conf in conferences
+                           if getattr(conf, field) and lo <= getattr(conf, field) <= hi]
+        if residual:
+            conferences = [conf for conf in conferences
+                           if all(self._matchesFilter(conf, f) for f in residual)]
+            # an inequality checked in memory still decides the order
+            inequality = [f["field"] for f in residual
+                          if f["operator"] != "=" and f["field"] != "topics"]
+            if inequality:
+                conferences.sort(key=lambda conf: (getattr(conf, inequality[0]), conf.name))
+        names = self._organizerNames([conf.organizerUserId for conf in conferences])
 
         # return individual ConferenceForm object per Conference
         return ConferenceForms(
-                items=[self._copyConferenceToForm(conf, names[conf.organizerUserId]) for conf in \
+                items=[self._copyConferenceToForm(conf, names.get(conf.organizerUserId)) for conf in \
                 conferences]
         )
 
 
+    def _organizerNames(self, user_ids):
+        """Return {user_id: displayName} of organizer Profiles, cached."""
+        def load(ids):
+            profiles = ndb.get_multi([ndb.Key(Profile, i) for i in ids])
+            return dict((p.key.id(), p.displayName) for p in profiles if p)
+        return ORGANIZER_NAMES.get_multi(user_ids, load)
+
+
 # - - - Profile objects - - - - - - - - - - - - - - - - - - -
 
     def _copyProfileToForm(self, prof):
@@ -364,9 +656,11 @@ class ConferenceApi(remote.Service):
         pf = ProfileForm()
         for field in pf.all_fields():
             if hasattr(prof, field.name):
-                # convert t-shirt string to Enum; just copy others
+                # convert t-shirt string to Enum, keys to websafe strings; just copy others
                 if field.name == 'teeShirtSize':
                     setattr(pf, field.name, getattr(TeeShirtSize, getattr(prof, field.name)))
+                elif field.name == 'conferenceKeysToAttend':
+                    setattr(pf, field.name, [key.urlsafe() for key in prof.conferenceKeysToAttend])
                 else:
                     setattr(pf, field.name, getattr(prof, field.name))
         pf.check_initialized()
@@ -404,16 +698,24 @@ class ConferenceApi(remote.Service):
 
         # if saveProfile(), process user-modifyable fields
         if save_request:
+            renamed = changed = False
             for field in ('displayName', 'teeShirtSize'):
                 if hasattr(save_request, field):
                     val = getattr(save_request, field)
                     if val:
+                        if field == 'displayName' and str(val) != prof.displayName:
+                            renamed = True
                         setattr(prof, field, str(val))
+                        changed = True
                         #if field == 'teeShirtSize':
                         #    setattr(prof, field, str(val).upper())
                         #else:
                         #    setattr(prof, field, val)
-                        prof.put()
+            if changed:
+                prof.put()
+            # drop cached organizer names only once the new name is stored
+            if renamed:
+                self._onCommit(ORGANIZER_NAMES.invalidate)
 
         # return ProfileForm
         return self._copyProfileToForm(prof)
@@ -421,6 +723,7 @@ class ConferenceApi(remote.Service):
 
     @endpoints.method(message_types.VoidMessage, ProfileForm,
             path='profile', http_method='GET', name='getProfile')
+    @profiler.profiled
     def getProfile(self, request):
         """Return user profile."""
         return self._doProfile()
@@ -428,6 +731,7 @@ class ConferenceApi(remote.Service):
 
     @endpoints.method(ProfileMiniForm, ProfileForm,
             path='profile', http_method='POST', name='saveProfile')
+    @profiler.profiled
     def saveProfile(self, request):
         """Update & return user profile."""
         return self._doProfile(request)
@@ -435,37 +739,13 @@ class ConferenceApi(remote.Service):
 
 # - - - Announcements - - - - - - - - - - - - - - - - - - - -
 
-    @staticmethod
-    def _cacheAnnouncement():
-        """Create Announcement & assign to memcache; used by
-        memcache cron job & putAnnouncement().
-        """
-        confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
-            Conference.seatsAvailable > 0)
-        ).fetch(projection=[Conference.name])
-
-        if confs:
-            # If there are almost sold out conferences,
-            # format announcement and set it in memcache
-            announcement = ANNOUNCEMENT_TPL % (
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
-        else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
-            announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
-
-        return announcement
-
-
     @endpoints.method(message_types.VoidMessage, StringMessage,
             path='conference/announcement/get',
             http_method='GET', name='getAnnouncement')
+    @profiler.profiled
     def getAnnouncement(self, request):
         """Return Announcement from memcache."""
-        return StringMessage(data=memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) or "")
+        return StringMessage(data=tasks.getAnnouncement() or "")
 
 
 # - - - Registration - - - - - - - - - - - - - - - - - - - -
@@ -482,33 +762,36 @@ class ConferenceApi(remote.Service):
         conf = ndb.Key(urlsafe=wsck).get()
 
         # check that conf.key is a Conference key and it exists
-        self._checkKey(conf.key, request.websafeConferenceKey, 'Conference')
+        self._checkConference(conf, request.websafeConferenceKey)
 
         # register
         if reg:
             # check if user already registered otherwise add
-            if wsck in prof.conferenceKeysToAttend:
+            if conf.key in prof.conferenceKeysToAttend:
                 raise ConflictException(
                     "You have already registered for this conference")
 
             # check if seats avail
             if conf.seatsAvailable <= 0:
                 raise ConflictException(
-                    "There are no seats available.")
+                    "There are no seats available; join the waitlist instead.")
 
             # register user, take away one seat
-            prof.conferenceKeysToAttend.append(wsck)
+            prof.conferenceKeysToAttend.append(conf.key)
             conf.seatsAvailable -= 1
+            regstats.record(wsck, True)
             retval = True
 
         # unregister
         else:
             # check if user already registered
-            if wsck in prof.conferenceKeysToAttend:
+            if conf.key in prof.conferenceKeysToAttend:
 
                 # unregister user, add back one seat
-                prof.conferenceKeysToAttend.remove(wsck)
+                prof.conferenceKeysToAttend.remove(conf.key)
                 conf.seatsAvailable += 1
+                regstats.record(wsck, False)
+                self._onCommit(waitlist.schedulePromotion, wsck)
                 retval = True
             else:
                 retval = False
@@ -516,65 +799,239 @@ class ConferenceApi(remote.Service):
         # write things back to the datastore & return
         prof.put()
         conf.put()
+        # seat count changed; let one reader refresh the cached copy
+        self._onCommit(singleflight.expire, MEMCACHE_CONFERENCE_PREFIX + conf.key.urlsafe())
+        self._onCommit(memcache.delete, MEMCACHE_RECOMMENDATIONS_PREFIX + prof.key.id())
         return BooleanMessage(data=retval)
 
 
+    @endpoints.method(REGISTRATION_STATS_REQUEST, RegistrationStatsForm,
+            path='conference/{websafeConferenceKey}/registrationStats',
+            http_method='GET', name='getRegistrationStats')
+    @profiler.profiled
+    def getRegistrationStats(self, request):
+        """Return hourly or daily registration counts and a projected
+        sell-out time. Open only to the organizer of the conference."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        granularity = request.granularity or 'day'
+        if granularity not in regstats.GRANULARITIES:
+            raise endpoints.BadRequestException(
+                "granularity must be one of: %s" % ', '.join(regstats.GRANULARITIES))
+
+        wsck = request.websafeConferenceKey
+        conf = self._ndbKey(urlsafe=wsck).get()
+        self._checkConference(conf, wsck)
+        if getUserId(user) != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the owner can see registration stats.')
+
+        now = datetime.utcnow()
+        counters = regstats.series(wsck, granularity)
+        if granularity == 'hour':
+            hourly = counters
+        else:
+            hourly = regstats.series(wsck, 'hour', since=now - regstats.PROJECTION_WINDOW)
+        sellOut = regstats.projectSellOut(hourly, conf.seatsAvailable, now)
+
+        return RegistrationStatsForm(
+            granularity=granularity,
+            buckets=[RegistrationBucketForm(start=c.start.isoformat(),
+                                            registrations=c.registrations,
+                                            unregistrations=c.unregistrations)
+                     for c in counters],
+            seatsAvailable=conf.seatsAvailable,
+            projectedSellOut=sellOut.isoformat() if sellOut else None)
+
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
             path='conferences/attending',
             http_method='GET', name='getConferencesToAttend')
+    @profiler.profiled
     def getConferencesToAttend(self, request):
         """Get list of conferences that user has registered for."""
         prof = self._getProfileFromUser() # get user Profile
-        conf_keys = [ndb.Key(urlsafe=wsck) for wsck in prof.conferenceKeysToAttend]
-        conferences = ndb.get_multi(conf_keys)
+        conferences = [conf for conf in ndb.get_multi(prof.conferenceKeysToAttend)
+                       if conf and not conf.deleted]
 
         # get organizers
-        organisers = [ndb.Key(Profile, conf.organizerUserId) for conf in conferences]
-        profiles = ndb.get_multi(organisers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        names = self._organizerNames([conf.organizerUserId for conf in conferences])
 
         # return set of ConferenceForm objects per Conference
-        return ConferenceForms(items=[self._copyConferenceToForm(conf, names[conf.organizerUserId])\
+        return ConferenceForms(items=[self._copyConferenceToForm(conf, names.get(conf.organizerUserId))\
          for conf in conferences]
         )
 
-    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+    def _recommendConferences(self, prof):
+        """Return [(Conference, organizer displayName)] most similar to
+        the conferences prof attends, from the precomputed tables."""
+        attending = set(c_key.urlsafe() for c_key in prof.conferenceKeysToAttend)
+        similarities = ndb.get_multi(
+            [ndb.Key(ConferenceSimilarity, wsck) for wsck in attending])
+        scores = {}
+        for similarity in similarities:
+            for wsck, score in (similarity.similar if similarity else []):
+                if wsck not in attending:
+                    scores[wsck] = scores.get(wsck, 0) + score
+        best = sorted(scores, key=scores.get, reverse=True)[:MAX_RECOMMENDATIONS]
+
+        confs = [conf for conf in ndb.get_multi([ndb.Key(urlsafe=wsck) for wsck in best])
+                 if conf and conf.seatsAvailable > 0 and not conf.deleted]
+        names = self._organizerNames([conf.organizerUserId for conf in confs])
+        return [(conf, names.get(conf.organizerUserId)) for conf in confs]
+
+    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+            path='conferences/recommended',
+            http_method='GET', name='getRecommendedConferences')
+    @profiler.profiled
+    def getRecommendedConferences(self, request):
+        """Get conferences similar to the ones the user attends."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        cache_key = MEMCACHE_RECOMMENDATIONS_PREFIX + getUserId(user)
+
+        recommended = memcache.get(cache_key)
+        if recommended is None:
+            recommended = self._recommendConferences(self._getProfileFromUser())
+            memcache.set(cache_key, recommended, time=RECOMMENDATIONS_TTL)
+
+        return ConferenceForms(items=[self._copyConferenceToForm(conf, displayName)
+                                      for conf, displayName in recommended])
+
+    @endpoints.method(CONF_GET_REQUEST, RegistrationTicketForm,
             path='conference/{websafeConferenceKey}',
             http_method='POST', name='registerForConference')
+    @profiler.profiled
     def registerForConference(self, request):
-        """Register user for selected conference."""
-        return self._conferenceRegistration(request)
+        """Register user for selected conference. For a high-demand
+        conference the registration is queued and a PENDING ticket is
+        returned at once; poll getRegistrationTicket for the outcome."""
+        self._checkRateLimit('registration')
+        # turn sold-out retries away before they reach the transaction
+        conf = self._ndbKey(urlsafe=request.websafeConferenceKey).get()
+        self._checkConference(conf, request.websafeConferenceKey)
+        if conf.seatsAvailable <= 0:
+            raise ConflictException(
+                "There are no seats available; join the waitlist instead.")
+        if conf.highDemand:
+            return self._copyTicketToForm(self._enqueueRegistration(conf))
+        self._conferenceRegistration(request)
+        return RegistrationTicketForm(websafeConferenceKey=request.websafeConferenceKey,
+                                      status=regqueue.REGISTERED)
+
+    def _enqueueRegistration(self, conf):
+        """Queue the current user's registration; return the ticket."""
+        prof = self._getProfileFromUser()
+        if conf.key in prof.conferenceKeysToAttend:
+            raise ConflictException(
+                "You have already registered for this conference")
+        return regqueue.enqueue(conf.key.urlsafe(), prof.key.id())
+
+    def _copyTicketToForm(self, ticket):
+        """Copy relevant fields from RegistrationTicket to RegistrationTicketForm."""
+        return RegistrationTicketForm(
+            websafeKey=ticket.key.urlsafe(),
+            websafeConferenceKey=ticket.conferenceKey,
+            status=ticket.status,
+            reason=ticket.reason,
+            created=str(ticket.created))
+
+    @endpoints.method(CONF_GET_REQUEST, RegistrationTicketForm,
+            path='conference/{websafeConferenceKey}/registrationTicket',
+            http_method='POST', name='requestRegistration')
+    @profiler.profiled
+    def requestRegistration(self, request):
+        """Queue registration for a conference, high-demand or not, and
+        return a ticket to poll with getRegistrationTicket."""
+        self._checkRateLimit('registration')
+        wsck = request.websafeConferenceKey
+        conf = self._ndbKey(urlsafe=wsck).get()
+        self._checkConference(conf, wsck)
+        if conf.seatsAvailable <= 0:
+            raise ConflictException(
+                "There are no seats available; join the waitlist instead.")
+        return self._copyTicketToForm(self._enqueueRegistration(conf))
+
+    @endpoints.method(CONF_GET_REQUEST, RegistrationTicketForm,
+            path='conference/{websafeConferenceKey}/registrationTicket',
+            http_method='GET', name='getRegistrationTicket')
+    @profiler.profiled
+    def getRegistrationTicket(self, request):
+        """Return the current user's queued registration for a conference."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        wsck = request.websafeConferenceKey
+        ticket = regqueue.getTicket(wsck, getUserId(user))
+        if not ticket:
+            raise endpoints.NotFoundException(
+                'No registration queued for conference: %s' % wsck)
+        return self._copyTicketToForm(ticket)
 
 
     @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
             path='conference/{websafeConferenceKey}',
             http_method='DELETE', name='unregisterFromConference')
+    @profiler.profiled
     def unregisterFromConference(self, request):
         """Unregister user for selected conference."""
+        self._checkRateLimit('registration')
         return self._conferenceRegistration(request, reg=False)
 
 
+    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+            path='conference/{websafeConferenceKey}/waitlist',
+            http_method='POST', name='joinWaitlist')
+    @profiler.profiled
+    def joinWaitlist(self, request):
+        """Join the waitlist of a sold-out conference; seats freed later
+        are given to waitlisted users in the order they joined."""
+        self._checkRateLimit('registration')
+        prof = self._getProfileFromUser()
+        wsck = request.websafeConferenceKey
+        conf = self._ndbKey(urlsafe=wsck).get()
+        self._checkConference(conf, wsck)
+
+        if conf.key in prof.conferenceKeysToAttend:
+            raise ConflictException(
+                "You have already registered for this conference")
+        if conf.seatsAvailable > 0:
+            raise ConflictException(
+                "There are seats available; register instead.")
+        return BooleanMessage(data=waitlist.join(wsck, prof.key.id()))
+
+    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+            path='conference/{websafeConferenceKey}/waitlist',
+            http_method='DELETE', name='leaveWaitlist')
+    @profiler.profiled
+    def leaveWaitlist(self, request):
+        """Leave the waitlist of a conference."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        return BooleanMessage(data=waitlist.leave(
+            request.websafeConferenceKey, getUserId(user)))
+
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
             path='filterPlayground',
             http_method='GET', name='filterPlayground')
+    @profiler.profiled
     def filterPlayground(self, request):
         """Filter Playground"""
-        q = Conference.query()
+        q = ConferenceTopic.query()
         # field = "city"
         # operator = "="
         # value = "London"
         # f = ndb.query.FilterNode(field, operator, value)
         # q = q.filter(f)
-        q = q.filter(Conference.city=="London")
-        q = q.filter(Conference.topics=="Medical Innovations")
-        q = q.filter(Conference.month==6)
+        q = q.filter(ConferenceTopic.city=="London")
+        q = q.filter(ConferenceTopic.topic=="Medical Innovations")
+        q = q.filter(ConferenceTopic.month==6)
 
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, "") for conf in q]
+            items=[self._copyConferenceToForm(conf, "")
+                   for conf in topicindex.fetchConferences(q)]
         )
 
 # - - - Task 1: Add Sessions to a Conference - - - - - - - - - - - - - - - - - - - -
@@ -603,14 +1060,44 @@ class ConferenceApi(remote.Service):
             raise endpoints.NotFoundException(
                 'Not a key of the %s Kind: %s' % (kind, websafeKey))
 
+    def _checkConference(self, conf, websafeKey):
+        """Check that conf exists, is a Conference and is not deleted."""
+        self._checkKey(conf and conf.key, websafeKey, 'Conference')
+        if conf.deleted:
+            raise endpoints.NotFoundException(
+                'No Conference found with key: %s' % websafeKey)
+
+    def _liveConferenceKey(self, websafeKey):
+        """Return the key of a Conference that exists and is not deleted."""
+        c_key = self._ndbKey(urlsafe=websafeKey)
+        self._checkKey(c_key, websafeKey, 'Conference')
+        self._checkConference(c_key.get(), websafeKey)
+        return c_key
+
+    def _onCommit(self, callback, *args):
+        """Run callback(*args) once the current transaction (if any) commits."""
+        ndb.get_context().call_on_commit(lambda: callback(*args))
+
+    def _checkRateLimit(self, bucket):
+        """Reject the call with a 429 if the user has used up the bucket."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        user_id = getUserId(user)
+        if not ratelimit.consume(bucket, user_id):
+            raise TooManyRequestsException('Too many requests, retry in %d seconds.'
+                                           % ratelimit.retryAfter(bucket, user_id))
+
     def _copySessionToForm(self, session, name=None):
         """Copy relevant fields from Session to SessionForm."""
         sf = SessionForm()
         for field in sf.all_fields():
             if hasattr(session, field.name):
-                # convert typeOfSession to enum SessionTypes; just copy others
+                # convert typeOfSession to enum SessionTypes, speakerKey to websafe; just copy others
                 if field.name == 'typeOfSession':
                     setattr(sf, field.name, getattr(SessionTypes, str(getattr(session,field.name))))
+                elif field.name == 'speakerKey':
+                    setattr(sf, field.name, session.speakerKey and session.speakerKey.urlsafe())
                 else:
                     setattr(sf, field.name, getattr(session,field.name))
             elif field.name == "websafeKey":
@@ -664,43 +1151,53 @@ class ConferenceApi(remote.Service):
         conf = self._ndbKey(urlsafe=request.websafeConferenceKey).get()
 
         # check that conf.key is a Conference key and it exists
-        self._checkKey(conf.key, request.websafeConferenceKey, 'Conference')
+        self._checkConference(conf, request.websafeConferenceKey)
 
         # check that user is owner
         if user_id != conf.organizerUserId:
             raise endpoints.ForbiddenException(
                 'Only the owner can update the conference.')
 
-        # generate Session key as child of Conference
-        s_id = Session.allocate_ids(size=1, parent=conf.key)[0]
-        s_key = ndb.Key(Session, s_id, parent=conf.key)
-        data['key'] = s_key
+        # Session is a child of Conference; it gets its id from the put
+        data['parent'] = conf.key
 
         # get the speakerDisplayName from Speaker entity if a speakerKey was provided
         if data['speakerKey']:
-            speaker = self._ndbKey(urlsafe=request.speakerKey).get()
+            sp_key = self._ndbKey(urlsafe=request.speakerKey)
+
+            # check that sp_key is a speaker key and it exists
+            self._checkKey(sp_key, request.speakerKey, 'Speaker')
+            names = self._speakerNames([sp_key])
+            if sp_key not in names:
+                raise endpoints.NotFoundException(
+                    'No Speaker found with key: %s' % request.speakerKey)
 
-            # check that speaker.key is a speaker key and it exists
-            self._checkKey(speaker.key, request.speakerKey, 'Speaker')
+            data['speakerKey'] = sp_key
+            data['speakerDisplayName'] = names[sp_key]
 
-            data['speakerDisplayName'] = speaker.displayName
+        # create Session; its speaker's session list is updated in the
+        # same transaction, so the featured speaker task sees it
+        s = Session(**data)
 
+        @ndb.transactional(xg=True)
+        def txn():
+            s.put()
+            if s.speakerKey:
+                speakerindex.record(s)
 # - - - Task 4: Add a Task - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-        # The task will check if there is more than one session by this speaker at this conference,
-        # also add a new Memcache entry that features the speaker and session names.
-            taskqueue.add(
-                params={
-                    'sessionKey': s_key.urlsafe(),
-                    'speakerKey': data['speakerKey'],
-                    'speakerDisplayName': data['speakerDisplayName']
-                    },
-                url='/tasks/check_featuredSpeaker'
-                )
+                # The task will check if there is more than one session by this speaker,
+                # also add a new Memcache entry that features the speaker and session names.
+                taskqueue.add(
+                    params={
+                        'speakerKey': request.speakerKey,
+                        'speakerDisplayName': data['speakerDisplayName']
+                        },
+                    url='/tasks/check_featuredSpeaker',
+                    transactional=True
+                    )
 # - - - End Task 4 - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-
-        # create Session
-        s = Session(**data)
-        s.put()
+        txn()
+        self._sessionsChanged(conf.key)
 
         return self._copySessionToForm(s)
 
@@ -708,36 +1205,108 @@ class ConferenceApi(remote.Service):
     @endpoints.method(SESSION_POST_REQUEST, SessionForm,
             path='conference/{websafeConferenceKey}/sessions',
             http_method='POST', name='createSession')
+    @profiler.profiled
     def createSession(self, request):
         """Create a new session for a conference. Open only to the organizer of the conference"""
+        self._checkRateLimit('create')
         return self._createSessionObject(request)
 
     #getConferenceSessions(websafeConferenceKey) -- Given a conference, return all sessions    
     @endpoints.method(CONF_GET_REQUEST, SessionForms,
             path='conference/{websafeConferenceKey}/sessions',
             http_method='GET', name='getConferenceSessions')
+    @profiler.profiled
     def getConferenceSessions(self, request):
         """Get list of all sessions for a conference."""
 
-        c_key = self._ndbKey(urlsafe=request.websafeConferenceKey)
+        # check that the conference exists and is not being deleted
+        c_key = self._liveConferenceKey(request.websafeConferenceKey)
 
-        # check that c_key is a Conference key and it exists
-        self._checkKey(c_key, request.websafeConferenceKey, 'Conference')
-
-        sessions = Session.query(ancestor=c_key)
+        sessions = singleflight.get(
+            MEMCACHE_SESSIONS_PREFIX + c_key.urlsafe(),
+            Session.query(ancestor=c_key).fetch, CONFERENCE_CACHE_TTL)
         return SessionForms(items=[self._copySessionToForm(session) for session in sessions])
 
+    def _sessionsChanged(self, c_key):
+        """Drop the cached session list and timetable of a conference."""
+        tasks.sessionsChanged(c_key.urlsafe())
+
+    def _timetableGeneration(self, wsck):
+        """Return the conference's timetable generation, which is part of
+        every cached timetable key and bumped whenever its sessions change.
+        """
+        key = MEMCACHE_TIMETABLE_GEN_PREFIX + wsck
+        gen = memcache.get(key)
+        if gen is None:
+            # start from the clock so an evicted generation is never reused
+            memcache.add(key, int(time.time() * 1000))
+            gen = memcache.get(key)
+        return gen
+
+    def _timetableDays(self, c_key, day, days):
+        """Return ([(date, [Session])] for up to days days starting at day,
+        in start time order, and the date of the following day with sessions).
+        Sessions without a start time are not on the timetable.
+        """
+        start = datetime.combine(day, datetime.min.time()) if day else datetime.min
+        q = Session.query(Session.startDateTime >= start, ancestor=c_key) \
+            .order(Session.startDateTime)
+        result = []
+        for session in q.iter(batch_size=50):
+            date = session.startDateTime.date()
+            if not result or result[-1][0] != date:
+                if len(result) == days:
+                    return result, date
+                result.append((date, []))
+            result[-1][1].append(session)
+        return result, None
+
+    @endpoints.method(TIMETABLE_REQUEST, TimetableForm,
+            path='conference/{websafeConferenceKey}/timetable',
+            http_method='GET', name='getConferenceTimetable')
+    @profiler.profiled
+    def getConferenceTimetable(self, request):
+        """Get a conference's sessions by day and start time, `days` days
+        (default 1) per page starting at `day` (YYYY-MM-DD; default first day)."""
+        wsck = request.websafeConferenceKey
+        # check that the conference exists and is not being deleted
+        c_key = self._liveConferenceKey(wsck)
+
+        day = None
+        if request.day:
+            try:
+                day = datetime.strptime(request.day[:10], "%Y-%m-%d").date()
+            except ValueError:
+                raise endpoints.BadRequestException(
+                    'Invalid day, expected YYYY-MM-DD: %s' % request.day)
+        days = min(max(request.days or 1, 1), MAX_TIMETABLE_DAYS)
+
+        key = '%s%s:%s:%s:%d' % (MEMCACHE_TIMETABLE_PREFIX, wsck,
+            self._timetableGeneration(wsck), day or '', days)
+        timetable, next_day = singleflight.get(
+            key, lambda: self._timetableDays(c_key, day, days), TIMETABLE_CACHE_TTL)
+
+        tf = TimetableForm(nextDay=str(next_day) if next_day else None)
+        for date, sessions in timetable:
+            df = TimetableDayForm(date=str(date))
+            for session in sessions:
+                startTime = session.startDateTime.strftime('%H:%M')
+                if not df.slots or df.slots[-1].startTime != startTime:
+                    df.slots.append(TimetableSlotForm(startTime=startTime))
+                df.slots[-1].sessions.append(self._copySessionToForm(session))
+            tf.days.append(df)
+        return tf
+
     #getConferenceSessionsByType(websafeConferenceKey, typeOfSession) Given a conference, return all sessions of a specified type (eg lecture, keynote, workshop)
     @endpoints.method(SESSIONS_BY_TYPE, SessionForms,
             path='conference/{websafeConferenceKey}/sessions/{type}',
             http_method='GET', name='getConferenceSessionsByType')
+    @profiler.profiled
     def getConferenceSessionsByType(self, request):
         """Get list of all sessions for a conference by type."""
 
-        c_key = self._ndbKey(urlsafe=request.websafeConferenceKey)
-
-        # check that c_key is a Conference key and it exists
-        self._checkKey(c_key, request.websafeConferenceKey, 'Conference')
+        # check that the conference exists and is not being deleted
+        c_key = self._liveConferenceKey(request.websafeConferenceKey)
         
         sessions = Session.query(ancestor=c_key).filter(Session.typeOfSession==str(getattr(SessionTypes, request.type)))
 
@@ -748,17 +1317,66 @@ class ConferenceApi(remote.Service):
     @endpoints.method(SESSIONS_BY_SPEAKER, SessionForms,
             path='sessions/bySpeaker',
             http_method='GET', name='getSessionsBySpeaker')
+    @profiler.profiled
     def getSessionsBySpeaker(self, request):
         """Get list of all sessions for a speaker accross all conferences.
            If no speakerKey is provided, all sessions are returned"""
-
-        sessions = Session.query()
+        budget = deadline.Budget(TIME_BUDGETS['getSessionsBySpeaker'])
         if request.speakerKey:
-            sessions = sessions.filter(Session.speakerKey==request.speakerKey) 
-        return SessionForms(items=[self._copySessionToForm(session) for session in sessions])
+            sp_key = self._ndbKey(urlsafe=request.speakerKey)
+            self._checkKey(sp_key, request.speakerKey, 'Speaker')
+            # one strongly consistent get of the speaker's session list
+            index = speakerindex.sessionsOf(sp_key)
+            summaries = [(ndb.Key(urlsafe=summary['key']).parent(), summary)
+                         for summary in (index.sessions if index else [])]
+            # the list can outlive a conference being deleted
+            live = self._liveConferenceKeys([c_key for c_key, _ in summaries])
+            return SessionForms(items=[
+                self._copySummaryToForm(summary, request.speakerKey, index.speakerDisplayName)
+                for c_key, summary in summaries if c_key in live])
+
+        # look each conference up once, when its first session comes by
+        live = {}
+        def keep(session):
+            c_key = session.key.parent()
+            if c_key not in live:
+                live[c_key] = bool(self._liveConferenceKeys([c_key]))
+            return live[c_key]
+        sessions, token, partial = self._scanPage(Session.query(), request, budget, keep)
+        return SessionForms(items=[self._copySessionToForm(session) for session in sessions],
+                            nextPageToken=token, partial=partial)
+
+    def _liveConferenceKeys(self, c_keys):
+        """Return the set of c_keys whose Conference exists and is not deleted."""
+        c_keys = list(set(c_keys))
+        return set(key for key, conf in zip(c_keys, ndb.get_multi(c_keys))
+                   if conf and not conf.deleted)
+
+    def _copySummaryToForm(self, summary, speakerKey, speakerDisplayName):
+        """Copy a speakerindex session summary to SessionForm."""
+        sf = SessionForm(
+            name=summary['name'],
+            highlights=summary['highlights'],
+            speakerKey=speakerKey,
+            speakerDisplayName=speakerDisplayName,
+            duration=summary['duration'],
+            typeOfSession=getattr(SessionTypes, str(summary['type'])),
+            websafeKey=summary['key'])
+        if summary['start']:
+            sf.date, sf.startTime = summary['start'].split('T')
+        sf.check_initialized()
+        return sf
 
 # - - - Task 1: Speaker entity creation - - - - - - - - - - - - - - - - - - - -
 
+    def _speakerNames(self, speakerKeys):
+        """Return {Speaker key: displayName} of Speakers, cached by id."""
+        def load(ids):
+            speakers = ndb.get_multi([ndb.Key(Speaker, i) for i in ids])
+            return dict((i, sp.displayName) for i, sp in zip(ids, speakers) if sp)
+        names = SPEAKER_NAMES.get_multi([key.id() for key in speakerKeys], load)
+        return dict((key, names[key.id()]) for key in speakerKeys if key.id() in names)
+
     def _copySpeakerToForm(self, speaker):
         """Copy relevant fields from Speaker to SpeakerForm."""
         sf = SpeakerForm()
@@ -784,21 +1402,25 @@ class ConferenceApi(remote.Service):
         del data['websafeKey']
 
         # generate Speaker key
-        sp_id = Speaker.allocate_ids(size=1)[0]
-        sp_key = ndb.Key(Speaker, sp_id)
+        sp_key = idpool.POOL.key(Speaker)
         data['key'] = sp_key
 
         # create Speaker
         sp = Speaker(**data)
         sp.put()
+        idpool.POOL.wait()
+        SPEAKER_LIST.invalidate()
+        SPEAKER_SEARCH.invalidate()
 
         return self._copySpeakerToForm(sp)
 
     @endpoints.method(SpeakerForm, SpeakerForm,
             path='speaker',
             http_method='POST', name='addSpeaker')
+    @profiler.profiled
     def addSpeaker(self, request):
         """Create a new speaker.  Anyone can add a speaker, speaker does not need to be a user"""
+        self._checkRateLimit('create')
         return self._createSpeakerObject(request)
 
 # - - - Task 2: Add Sessions to User Wishlist - - - - - - - - - - - - - - - - - - - -
@@ -815,14 +1437,20 @@ class ConferenceApi(remote.Service):
 
         # check that session is a Session key and it exists
         self._checkKey(s_key, wssk, 'Session')
+        # a session of a deleted conference would be left dangling
+        c_key = s_key.parent()
+        self._checkConference(c_key and c_key.get(), c_key and c_key.urlsafe())
+        if not s_key.get():
+            raise endpoints.NotFoundException(
+                'No Session found with key: %s' % wssk)
 
         # check if user already added session otherwise add
-        if wssk in prof.sessionKeysWishList:
+        if s_key in prof.sessionKeysWishList:
             raise ConflictException(
                 "This session is already in your wishlist")
 
         # add the session to the users session wish list
-        prof.sessionKeysWishList.append(wssk)
+        prof.sessionKeysWishList.append(s_key)
 
         # write Profile back to the datastore & return
         prof.put()
@@ -831,107 +1459,272 @@ class ConferenceApi(remote.Service):
     @endpoints.method(SESSION_WISH_REQUEST, BooleanMessage,
             path='sessions/wishList/{websafeSessionKey}',
             http_method='POST', name='addSessionToWishlist')
+    @profiler.profiled
     def addSessionToWishlist(self, request):
         """Register user for selected conference."""
+        self._checkRateLimit('wishlist')
         return self._sessionAddIt(request)
 
     #getSessionsInWishlist() -- query for all the sessions in a conference that the user is interested in
     @endpoints.method(message_types.VoidMessage, SessionForms,
             path='sessions/wishList',
             http_method='GET', name='getSessionsInWishlist')
+    @profiler.profiled
     def getSessionsInWishlist(self, request):
         """Get list of sesions that user wishes to attend."""
         prof = self._getProfileFromUser() # get user Profile
-        session_keys = [ndb.Key(urlsafe=wssk) for wssk in prof.sessionKeysWishList]
-        sessions = ndb.get_multi(session_keys)
-
-        # get speakers
-        speakerKeys = [ndb.Key(urlsafe=session.speakerKey)  for session in sessions]
-        speakers = ndb.get_multi(speakerKeys)
+        # sessions of a conference being deleted may already be gone
+        sessions = [s for s in ndb.get_multi(prof.sessionKeysWishList) if s]
 
-        # put display names in a dict for easier fetching
-        names = {}
-        for speaker in speakers:
-            names[speaker.key.id()] = speaker.displayName
+        # get speaker display names
+        names = self._speakerNames([session.speakerKey for session in sessions
+                                    if session.speakerKey])
 
         # return set of SessionForm objects per Session
-        return SessionForms(items=[self._copySessionToForm(session, names[speaker.key.id()])\
+        return SessionForms(items=[self._copySessionToForm(session, names.get(session.speakerKey))\
          for session in sessions]
         )
 
 # - - - Task 3: Come up with 2 additional queries - - - - - - - - - - - - - - - - - - - - -
-    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+    def _pageCursor(self, pageToken):
+        try:
+            return ndb.Cursor(urlsafe=pageToken) if pageToken else None
+        except Exception:
+            raise endpoints.BadRequestException(
+                'Invalid pageToken: %s' % pageToken)
+
+    def _fetchPage(self, query, request):
+        """Fetch one page of query; return (results, nextPageToken)."""
+        limit = min(request.limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+        cursor = self._pageCursor(request.pageToken)
+        results, next_cursor, more = query.fetch_page(limit, start_cursor=cursor)
+        return results, (next_cursor.urlsafe() if more and next_cursor else None)
+
+    def _scanPage(self, query, request, budget, keep=None, default_limit=MAX_SCAN_RESULTS):
+        """Scan query from request.pageToken, keeping what keep accepts,
+        until there are limit results or budget runs out; return
+        (results, nextPageToken, partial)."""
+        limit = min(request.limit or default_limit, MAX_SCAN_RESULTS)
+        results, cursor, partial = deadline.scan(
+            query, budget, limit, self._pageCursor(request.pageToken), keep)
+        return results, (cursor.urlsafe() if cursor else None), partial
+
+    @endpoints.method(PAGE_REQUEST, ConferenceForms,
             path='conferences/incomplete',
             http_method='GET', name='getIncompleteConferences')
+    @profiler.profiled
     def getIncompleteConferences(self, request):
         """Get list of all conferences that need additional information"""
-        q = Conference.query(ndb.OR(
-                Conference.description==None,
-                Conference.startDate==None,
-                Conference.endDate==None))
-        items = [self._copyConferenceToForm(conf, getattr(conf.key.parent().get(), 'displayName')) for conf in q]
+        budget = deadline.Budget(TIME_BUDGETS['getIncompleteConferences'])
+        q = Conference.query(Conference.isComplete==False)
+        confs, token, partial = self._scanPage(q, request, budget,
+                                               keep=lambda conf: not conf.deleted,
+                                               default_limit=DEFAULT_PAGE_SIZE)
 
-        return ConferenceForms(items=items)
+        names = self._organizerNames([conf.organizerUserId for conf in confs])
+        items = [self._copyConferenceToForm(conf, names.get(conf.organizerUserId))
+                 for conf in confs]
 
-    @endpoints.method(CONF_GET_REQUEST, SessionForms,
+        return ConferenceForms(items=items, nextPageToken=token, partial=partial)
+
+    @endpoints.method(CONF_PAGE_REQUEST, SessionForms,
             path='conference/{websafeConferenceKey}/incompleteSessions',
             http_method='GET', name='getIncompleteConferenceSessions')
+    @profiler.profiled
     def getIncompleteConferenceSessions(self, request):
         """Get list of all sessions for a conference that have incomplete information."""
 
-        c_key = self._ndbKey(urlsafe=request.websafeConferenceKey)
+        # check that the conference exists and is not being deleted
+        c_key = self._liveConferenceKey(request.websafeConferenceKey)
 
-        # check that c_key is a Conference key and it exists
-        self._checkKey(c_key, request.websafeConferenceKey, 'Conference')
-
-        sessions = Session.query(ndb.OR(
-                Session.highlights=='To be announced',
-                Session.speakerKey==None,
-                Session.typeOfSession=='TBA'), ancestor=c_key)
-        return SessionForms(items=[self._copySessionToForm(session) for session in sessions])
+        q = Session.query(Session.isComplete==False, ancestor=c_key)
+        sessions, token = self._fetchPage(q, request)
+        return SessionForms(items=[self._copySessionToForm(session) for session in sessions],
+                            nextPageToken=token)
 
-    @endpoints.method(message_types.VoidMessage, SpeakerForms,
+    @endpoints.method(PAGE_REQUEST, SpeakerForms,
             path='speakers',
             http_method='GET', name='getSpeakers')
+    @profiler.profiled
     def getSpeakers(self, request):
         """Get list of all speakers"""
-        speakers = Speaker.query()
+        budget = deadline.Budget(TIME_BUDGETS['getSpeakers'])
+        if request.pageToken or request.limit:
+            speakers, token, partial = self._scanPage(Speaker.query(), request, budget)
+        else:
+            speakers, token, partial = self._allSpeakers(budget)
+        return SpeakerForms(items=[self._copySpeakerToForm(speaker) for speaker in speakers],
+                            nextPageToken=token, partial=partial)
+
+    def _allSpeakers(self, budget):
+        """Return (speakers, nextPageToken, partial) for the full speaker
+        list, read from SPEAKER_LIST pages; pages the scan does not find
+        there are cached once the scan has finished them."""
+        speakers = []
+        token = None
+        while True:
+            page = SPEAKER_LIST.get(token or '')
+            if page is None:
+                found, cursor, partial = deadline.scan(
+                    Speaker.query(), budget, SPEAKER_LIST_PAGE_SIZE, self._pageCursor(token))
+                cursor = cursor.urlsafe() if cursor else None
+                if partial:
+                    return speakers + found, cursor, True
+                page = (found, cursor)
+                SPEAKER_LIST.set(token or '', page)
+            speakers.extend(page[0])
+            token = page[1]
+            if not token:
+                return speakers, None, False
+
+    def _searchSpeakers(self, prefix, limit):
+        """Return up to limit Speakers whose name, or a word of it, starts with prefix."""
+        if ' ' in prefix:
+            prop = Speaker.nameLower
+        else:
+            prop = Speaker.nameWords
+        q = Speaker.query(prop >= prefix, prop < prefix + u'\ufffd').order(prop)
+
+        # a name can match on several words; keep the first hit of each
+        speakers = []
+        seen = set()
+        for speaker in q.iter(batch_size=limit):
+            if speaker.key not in seen:
+                seen.add(speaker.key)
+                speakers.append(speaker)
+                if len(speakers) == limit:
+                    break
+        return speakers
+
+    @endpoints.method(SPEAKER_SEARCH_REQUEST, SpeakerForms,
+            path='speakers/search',
+            http_method='GET', name='searchSpeakers')
+    @profiler.profiled
+    def searchSpeakers(self, request):
+        """Get speakers whose name starts with prefix, for autocomplete."""
+        prefix = u' '.join((request.prefix or u'').lower().split())[:MAX_SPEAKER_PREFIX]
+        if not prefix:
+            return SpeakerForms(items=[])
+        limit = min(request.limit or DEFAULT_PAGE_SIZE, MAX_SPEAKER_SEARCH_RESULTS)
+
+        speakers = SPEAKER_SEARCH.get(u'%d:%s' % (limit, prefix),
+                                      lambda key: self._searchSpeakers(prefix, limit))
         return SpeakerForms(items=[self._copySpeakerToForm(speaker) for speaker in speakers])
 
 # - - - Task 3: Work on indexes and queries - - - - - - - - - - - - - - - - - - - - -
 
-    @endpoints.method(CONF_GET_REQUEST, SessionForms,
+    @endpoints.method(CONF_PAGE_REQUEST, SessionForms,
             path='conference/{websafeConferenceKey}/NotWorkshopSessionsBefore7pm',
             http_method='GET', name='getNotWorkshopSessionsBefore7pm')
+    @profiler.profiled
     def getNotWorkshopSessionsBefore7pm(self, request):
         """Returns all conference non-workshop sessions before 7pm."""
+        budget = deadline.Budget(TIME_BUDGETS['getNotWorkshopSessionsBefore7pm'])
 
-        c_key = self._ndbKey(urlsafe=request.websafeConferenceKey)
-
-        # check that c_key is a Conference key and it exists
-        self._checkKey(c_key, request.websafeConferenceKey, 'Conference')
+        # check that the conference exists and is not being deleted
+        c_key = self._liveConferenceKey(request.websafeConferenceKey)
 
+        # the != filters run as several queries; ending the order on the
+        # key lets the merged results be paged with cursors
         sessions = Session.query(ndb.AND(
                 Session.typeOfSession!='WORKSHOP',
-                Session.typeOfSession!='TBA'), ancestor=c_key)
+                Session.typeOfSession!='TBA'), ancestor=c_key) \
+            .order(Session.typeOfSession, Session.key)
 
         #Fix for BadRequestError: Only one inequality filter per query is supported. Encountered both typeOfSession and startDateTime
-        items = []
-        for session in sessions:
-            if session.startDateTime and \
-            session.startDateTime.hour + session.startDateTime.minute/60.0 <= 19:
-                items += [self._copySessionToForm(session)]
-        return SessionForms(items=items)
+        def before7pm(session):
+            return session.startDateTime and \
+                session.startDateTime.hour + session.startDateTime.minute/60.0 <= 19
+        sessions, token, partial = self._scanPage(sessions, request, budget, keep=before7pm)
+        return SessionForms(items=[self._copySessionToForm(session) for session in sessions],
+                            nextPageToken=token, partial=partial)
 
 # - - - Task 4: Featured Speaker get handler - - - - - - - - - - - - - - - - - - - -
 
     @endpoints.method(message_types.VoidMessage, StringMessage,
             path='featuredSpeaker',
             http_method='GET', name='getFeaturedSpeaker')
+    @profiler.profiled
     def getFeaturedSpeaker(self, request):
         """Return Announcement from memcache."""
-        return StringMessage(data=memcache.get(MEMCACHE_FEATURED_SPEAKER_KEY) or "")
+        return StringMessage(data=tasks.getFeaturedSpeaker() or "")
+
 
+# - - - Batch - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def _runBatchCall(self, call, methods):
+        """Run one batch call; return its BatchResultForm."""
+        result = BatchResultForm(method=call.method)
+        method = methods.get(call.method)
+        if not method or call.method == 'batch':
+            result.status = httplib.NOT_FOUND
+            result.error = 'Unknown method: %s' % call.method
+            return result
+        try:
+            request = protojson.decode_message(
+                method.remote.request_type, call.params or '{}')
+            response = getattr(self, call.method)(request)
+        except endpoints.ServiceException as e:
+            result.status = e.http_status
+            result.error = str(e)
+        except messages.Error as e:
+            result.status = httplib.BAD_REQUEST
+            result.error = str(e)
+        except Exception:
+            logging.exception('batch call %s failed', call.method)
+            result.status = httplib.INTERNAL_SERVER_ERROR
+            result.error = 'Internal error'
+        else:
+            result.status = httplib.OK
+            result.body = protojson.encode_message(response)
+        return result
+
+    def _batchKeys(self, calls, methods):
+        """Return the keys of the Conferences, Sessions and Speakers that
+        calls name by websafe key in their params."""
+        app = ndb.Key(Conference, 1).app()
+        keys = set()
+        for call in calls:
+            method = methods.get(call.method)
+            if not method:
+                continue
+            try:
+                request = protojson.decode_message(
+                    method.remote.request_type, call.params or '{}')
+            except messages.Error:
+                continue
+            for field in request.all_fields():
+                value = request.get_assigned_value(field.name)
+                if not (isinstance(value, basestring) and
+                        (field.name.startswith('websafe') or field.name == 'speakerKey')):
+                    continue
+                try:
+                    key = ndb.Key(urlsafe=value)
+                except Exception:
+                    continue    # the call itself reports the bad key
+                if key.app() == app and key.kind() in ('Conference', 'Session', 'Speaker'):
+                    keys.add(key)
+        return list(keys)
+
+    @endpoints.method(BatchCallForms, BatchResultForms,
+            path='batch',
+            http_method='POST', name='batch')
+    @profiler.profiled
+    def batch(self, request):
+        """Run several ConferenceApi methods in one round trip. Calls run in
+        order in this request, so the token is checked once and each call
+        sees the writes of those before it. The entities the calls name by
+        key are fetched in one async batch get started before the first
+        call, which serves the calls' own gets from the request's cache."""
+        if len(request.calls) > MAX_BATCH_CALLS:
+            raise endpoints.BadRequestException(
+                'At most %d calls per batch' % MAX_BATCH_CALLS)
+        methods = self.all_remote_methods()
+        prefetch = ndb.get_multi_async(self._batchKeys(request.calls, methods))
+        results = [self._runBatchCall(call, methods) for call in request.calls]
+        # only warms the cache: errors are the calls' to report
+        ndb.Future.wait_all(prefetch)
+        return BatchResultForms(results=results)
 
 
 api = endpoints.api_server([ConferenceApi]) # register API
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+"""datebuckets.py
+
+Calendar buckets that turn a date range into an equality IN filter
+
+Every date is stored with the four buckets that contain it: its year,
+month, ISO week (named by its Monday) and day. A range [lo, hi] is then
+covered by a short list of whole buckets, largest first, and matched
+with IN on the repeated bucket property, which leaves the query's one
+inequality free for another field. When the exact cover needs more than
+the allowed number of buckets, the finest level is dropped and the ends
+are widened to whole weeks, months or years; the caller trims the extra
+results in memory.
+
+"""
+
+from datetime import timedelta
+
+LEVELS = ('day', 'week', 'month', 'year')
+ONE_DAY = timedelta(days=1)
+
+
+def _start(level, d):
+    """Return the first day of the level bucket holding d."""
+    if level == 'week':
+        return d - timedelta(days=d.weekday())
+    if level == 'month':
+        return d.replace(day=1)
+    if level == 'year':
+        return d.replace(month=1, day=1)
+    return d
+
+
+def _end(level, d):
+    """Return the last day of the level bucket holding d."""
+    if level == 'week':
+        return _start('week', d) + timedelta(days=6)
+    if level == 'month':
+        following = (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return following - ONE_DAY
+    if level == 'year':
+        return d.replace(month=12, day=31)
+    return d
+
+
+def bucket(level, d):
+    """Return the name of the level bucket holding d."""
+    if level == 'week':
+        return 'w:' + _start('week', d).isoformat()
+    if level == 'month':
+        return 'm:' + d.strftime('%Y-%m')
+    if level == 'year':
+        return 'y:%d' % d.year
+    return 'd:' + d.isoformat()
+
+
+def bucketsFor(d):
+    """Return every bucket holding date d, for a repeated property."""
+    if d is None:
+        return []
+    return [bucket(level, d) for level in LEVELS]
+
+
+def _cover(lo, hi, finest):
+    """Cover [lo, hi] with whole buckets no finer than finest, largest
+    first; return (buckets, first day covered, last day covered).
+    """
+    # weeks do not nest in months, so above days they are used alone
+    levels = {'day': LEVELS, 'week': ('week',),
+              'month': ('month', 'year'), 'year': ('year',)}[finest]
+    lo, hi = _start(finest, lo), _end(finest, hi)
+    buckets = []
+    d = lo
+    while d <= hi:
+        for level in reversed(levels):
+            if _start(level, d) == d and _end(level, d) <= hi:
+                buckets.append(bucket(level, d))
+                d = _end(level, d) + ONE_DAY
+                break
+    return buckets, lo, hi
+
+
+def cover(lo, hi, max_buckets):
+    """Return (buckets, exact) covering dates lo..hi inclusive in at most
+    max_buckets buckets; exact is False when the cover also holds dates
+    outside the range, which the caller must then filter out. buckets is
+    None when even whole years take too many.
+    """
+    for finest in LEVELS:
+        buckets, first, last = _cover(lo, hi, finest)
+        if len(buckets) <= max_buckets:
+            return buckets, (first, last) == (lo, hi)
+    return None, False
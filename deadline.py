@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""deadline.py
+
+Time budgets for endpoints that scan
+
+An endpoint that may scan far more entities than it returns creates a
+Budget when it starts. scan() pages through the query, giving each
+fetch an RPC deadline from what is left of the budget, and stops early
+when it runs out, returning what it has found with the cursor to carry
+on from. A slow scan then answers in time with partial results instead
+of running into the request deadline and failing outright.
+
+"""
+
+import time
+
+from google.appengine.api import datastore_errors
+from google.appengine.runtime import apiproxy_errors
+
+MIN_RPC_DEADLINE = 0.2      # seconds; with less left the scan stops
+SCAN_BATCH_SIZE = 100
+
+
+class Budget(object):
+    """Seconds a request may spend, counted from creation."""
+
+    def __init__(self, seconds):
+        self.expires = time.time() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - time.time())
+
+    def exhausted(self):
+        return self.remaining() < MIN_RPC_DEADLINE
+
+
+def scan(query, budget, limit, cursor=None, keep=None):
+    """Page through query from cursor while budget lasts; return
+    (results, next cursor, partial). keep, if given, filters entities in
+    memory; at most limit results are returned. The next cursor is None
+    once the query is done; partial is True if the budget stopped the
+    scan, in which case the cursor is where it stopped, and is still
+    None if the scan started at the beginning and fetched nothing.
+    """
+    results = []
+    while len(results) < limit:
+        if budget.exhausted():
+            return results, cursor, True
+        try:
+            page, next_cursor, more = query.fetch_page(
+                min(SCAN_BATCH_SIZE, limit - len(results)), start_cursor=cursor,
+                deadline=budget.remaining())
+        except (datastore_errors.Timeout, apiproxy_errors.DeadlineExceededError):
+            # nothing of this page was used; carry on from its start
+            return results, cursor, True
+        results.extend(entity for entity in page if keep is None or keep(entity))
+        if not (more and next_cursor):
+            return results, None, False
+        cursor = next_cursor
+    return results, cursor, False
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""idpool.py
+
+Instance-level pool of datastore ids, so that creating an entity does not
+pay a blocking allocate_ids round trip before its put.
+
+Ids are reserved from the datastore in blocks of BLOCK_SIZE per kind
+and handed out from memory under a lock; allocate_ids guarantees that no
+other instance is given the same range. Only root entities are pooled:
+ids of child entities are allocated per parent, and a parent rarely gets
+enough new children on one instance for a block to pay off. Instead
+createSession puts its Session with an incomplete key and takes the id
+the put assigns, and createConference, whose topic entities need the key
+before the put, allocates the id asynchronously while its transaction
+begins.
+
+When a pool drops to LOW_WATER ids, the next block is requested with
+allocate_ids_async and taken in by a callback while the caller's own put
+is in flight. The refill belongs to the request's event loop, so the
+caller must call wait() before the request ends, or the block may never
+arrive. Ids left over when the instance shuts down are simply never used.
+
+Stats report how many ids came from memory and the average cost of a
+blocking allocation, which is the latency saved per pool hit.
+
+"""
+
+import collections
+import threading
+import time
+
+from google.appengine.ext import ndb
+
+BLOCK_SIZE = 50
+LOW_WATER = 10
+PENDING_TIMEOUT = 10        # seconds before an unfinished refill is given up on
+
+
+class _Pool(object):
+    def __init__(self):
+        self.ranges = collections.deque()   # [next id, last id]
+        self.pending = None                 # (future, started)
+
+    def remaining(self):
+        return sum(last - first + 1 for first, last in self.ranges)
+
+    def take(self):
+        while self.ranges:
+            block = self.ranges[0]
+            if block[0] <= block[1]:
+                block[0] += 1
+                return block[0] - 1
+            self.ranges.popleft()
+        return None
+
+
+class IdPool(object):
+    """Thread-safe per-kind id pools for root entities; see module
+    docstring."""
+
+    def __init__(self, block_size=BLOCK_SIZE, low_water=LOW_WATER):
+        self.block_size = block_size
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self._pools = {}
+        self._local = threading.local()     # refills started by this request
+        self._counts = collections.Counter()
+        self._sync_seconds = 0.0
+
+    def _refilled(self, pool, future):
+        """Callback: add an asynchronously allocated block to pool."""
+        try:
+            first, last = future.get_result()
+        except Exception:
+            first = last = None
+        with self._lock:
+            if pool.pending and pool.pending[0] is future:
+                pool.pending = None
+            if first is not None:
+                pool.ranges.append([first, last])
+                self._counts['asyncRefills'] += 1
+
+    def key(self, model):
+        """Return a new, unused root ndb.Key for model."""
+        now = time.time()
+        with self._lock:
+            pool = self._pools.setdefault(model._get_kind(), _Pool())
+            if pool.pending and now - pool.pending[1] > PENDING_TIMEOUT:
+                pool.pending = None
+            new_id = pool.take()
+            refill = False
+            if new_id is not None:
+                self._counts['hits'] += 1
+                refill = pool.remaining() < self.low_water and not pool.pending
+                if refill:
+                    pool.pending = (None, now)
+
+        if new_id is None:
+            start = time.time()
+            first, last = model.allocate_ids(size=self.block_size)
+            with self._lock:
+                self._sync_seconds += time.time() - start
+                self._counts['syncAllocations'] += 1
+                pool.ranges.append([first + 1, last])
+            new_id = first
+        if refill:
+            future = model.allocate_ids_async(size=self.block_size)
+            with self._lock:
+                pool.pending = (future, now)
+            future.add_immediate_callback(self._refilled, pool, future)
+            self._refills().append(future)
+        return ndb.Key(model, new_id)
+
+    def _refills(self):
+        if not hasattr(self._local, 'refills'):
+            self._local.refills = []
+        return self._local.refills
+
+    def wait(self):
+        """Wait for the refills started by this request; call it once
+        the request's own RPCs are done."""
+        refills, self._local.refills = self._refills(), []
+        for future in refills:
+            future.wait()
+
+    def stats(self):
+        """Return pool hit and allocation counts and the average seconds a
+        blocking allocation took."""
+        with self._lock:
+            stats = dict(self._counts)
+            syncs = stats.get('syncAllocations', 0)
+            stats['avgSyncSeconds'] = self._sync_seconds / syncs if syncs else None
+            stats['pools'] = len(self._pools)
+        return stats
+
+
+POOL = IdPool()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+"""lrucache.py
+
+Two-tier cache for slow-changing reference data: a thread-safe,
+size-bounded in-process LRU in front of memcache, in front of the
+datastore.
+
+The app runs threadsafe, so one instance serves many requests and an
+in-process hit costs no RPC at all. Entries live for a short TTL in
+process. Every cache also has a generation counter in memcache that
+writers bump through invalidate(); instances re-read it at most every
+GENERATION_CHECK_INTERVAL seconds and drop their local entries when it
+has moved. Memcache keys include the generation, so old values there
+are never read again either.
+
+"""
+
+import collections
+import cPickle as pickle
+import logging
+import threading
+import time
+
+from google.appengine.api import memcache
+
+GENERATION_PREFIX = 'lrucache:gen:'
+GENERATION_CHECK_INTERVAL = 5   # seconds
+
+_caches = {}
+
+
+class TwoTierCache(object):
+    """Named LRU cache backed by memcache; see module docstring."""
+
+    def __init__(self, name, max_entries=1000, ttl=60, memcache_ttl=3600):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.memcache_ttl = memcache_ttl
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()   # key: (value, expires, bytes)
+        self._bytes = 0
+        self._generation = None
+        self._generation_checked = 0
+        self._counts = collections.Counter()
+        _caches[name] = self
+
+    def _generationKey(self):
+        return GENERATION_PREFIX + self.name
+
+    def _memcacheKey(self, key, generation):
+        return '%s:%s:%s' % (self.name, generation, key)
+
+    def _currentGeneration(self, now):
+        """Return the memcache generation, refreshed at most every few seconds."""
+        if now - self._generation_checked < GENERATION_CHECK_INTERVAL:
+            return self._generation
+        gen_key = self._generationKey()
+        generation = memcache.get(gen_key)
+        if generation is None:
+            # start from the clock so an evicted counter never goes backwards
+            memcache.add(gen_key, int(now * 1000))
+            generation = memcache.get(gen_key) or int(now * 1000)
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+                self._bytes = 0
+                self._generation = generation
+            self._generation_checked = now
+        return generation
+
+    def _count(self, name, n):
+        with self._lock:
+            self._counts[name] += n
+
+    def _getLocal(self, key, now):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            if entry[1] < now:
+                self._bytes -= entry[2]
+                return None
+            self._entries[key] = entry      # most recently used goes last
+            return entry
+
+    def _putLocal(self, key, value, now, size=None):
+        if size is None:
+            size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (value, now + self.ttl, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+                self._counts['evictions'] += 1
+
+    def get_multi(self, keys, loader=None):
+        """Return {key: value} for keys, calling loader(missing_keys) for
+        those in neither tier; loader returns a dict and may omit keys
+        that do not exist, which are then left out of the result. Without
+        a loader, keys in neither tier are left out.
+        """
+        now = time.time()
+        generation = self._currentGeneration(now)
+        results = {}
+        missing = []
+        for key in keys:
+            entry = self._getLocal(key, now)
+            if entry is not None:
+                results[key] = entry[0]
+            elif key not in missing:
+                missing.append(key)
+        self._count('local_hits', len(results))
+        if not missing:
+            return results
+
+        cached = memcache.get_multi(
+            [self._memcacheKey(key, generation) for key in missing])
+        still_missing = []
+        for key in missing:
+            mkey = self._memcacheKey(key, generation)
+            if mkey in cached:
+                results[key] = cached[mkey]
+                self._putLocal(key, cached[mkey], now)
+            else:
+                still_missing.append(key)
+        self._count('memcache_hits', len(missing) - len(still_missing))
+        if not still_missing:
+            return results
+
+        self._count('misses', len(still_missing))
+        loaded = loader(still_missing) if loader else None
+        if loaded:
+            memcache.set_multi(
+                dict((self._memcacheKey(key, generation), value)
+                     for key, value in loaded.items()),
+                time=self.memcache_ttl)
+            for key, value in loaded.items():
+                self._putLocal(key, value, now)
+            results.update(loaded)
+        return results
+
+    def get(self, key, loader=None):
+        """Return the value for key, or None; loader(key) loads one value."""
+        def load(keys):
+            value = loader(keys[0])
+            return {keys[0]: value} if value is not None else {}
+        return self.get_multi([key], load if loader else None).get(key)
+
+    def set(self, key, value):
+        """Store value for key in both tiers, for callers that load it
+        themselves and decide whether it may be cached. A value too big
+        for memcache, which would drop it silently, is kept locally only."""
+        now = time.time()
+        generation = self._currentGeneration(now)
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if size < memcache.MAX_VALUE_SIZE:
+            memcache.set(self._memcacheKey(key, generation), value,
+                         time=self.memcache_ttl)
+        else:
+            logging.warning('%s: %d bytes for %r is too big for memcache',
+                            self.name, size, key)
+        self._putLocal(key, value, now, size)
+
+    def invalidate(self):
+        """Drop every entry on every instance (within the check interval)."""
+        now = time.time()
+        if memcache.incr(self._generationKey()) is None:
+            memcache.set(self._generationKey(), int(now * 1000))
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._generation_checked = 0
+
+    def stats(self):
+        """Return hit counts and memory use of this instance's local tier."""
+        with self._lock:
+            counts = dict(self._counts)
+            entries, size = len(self._entries), self._bytes
+        lookups = sum(counts.get(c, 0) for c in ('local_hits', 'memcache_hits', 'misses'))
+        counts.update({
+            'entries': entries,
+            'bytes': size,
+            'local_hit_rate': counts.get('local_hits', 0) / float(lookups or 1),
+        })
+        return counts
+
+
+def stats():
+    """Return stats() of every cache created in this instance."""
+    return dict((name, cache.stats()) for name, cache in _caches.items())
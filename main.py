@@ -12,35 +12,76 @@ created by wesc on 2014 may 24
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
+import json
+
 import webapp2
-from google.appengine.api import app_identity
-from google.appengine.api import mail
-from conference import ConferenceApi
 
-from google.appengine.api import memcache
-from google.appengine.ext import ndb
-from models import Session
+import idpool
+import lrucache
+import singleflight
+import tasks
 
-from conference import MEMCACHE_FEATURED_SPEAKER_KEY
 
 class SetAnnouncementHandler(webapp2.RequestHandler):
     def get(self):
         """Set Announcement in Memcache."""
-        ConferenceApi._cacheAnnouncement()
+        tasks.cacheAnnouncement()
         self.response.set_status(204)
 
+class ComputeRecommendationsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Rebuild conference similarity tables for recommendations."""
+        tasks.computeRecommendations()
+        self.response.set_status(204)
+
+class FlushRegistrationStatsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Add queued registration events to the hourly/daily counters."""
+        import regstats
+        regstats.flush()
+        self.response.set_status(204)
+
+class PromoteWaitlistHandler(webapp2.RequestHandler):
+    def post(self):
+        """Move waitlisted users into freed seats of a conference."""
+        import waitlist
+        waitlist.promote(self.request.get('websafeConferenceKey'))
+
+class DrainRegistrationsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Apply queued registrations of a high-demand conference."""
+        import regqueue
+        regqueue.drain(self.request.get('websafeConferenceKey'))
+
+class RebuildSpeakerSessionsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start rebuilding every speaker's session list."""
+        from google.appengine.api import taskqueue
+        taskqueue.add(url='/tasks/rebuild_speaker_sessions')
+        self.response.write('Rebuild of speaker session lists started')
+
+    def post(self):
+        """Rebuild one batch of speakers' lists and chain the next."""
+        import speakerindex
+        speakerindex.rebuild(self.request.get('cursor') or None)
+
+class DeleteConferenceHandler(webapp2.RequestHandler):
+    def post(self):
+        """Run one batch of a conference's cascade deletion."""
+        import cascade
+        cascade.runStep(
+            self.request.get('websafeConferenceKey'),
+            self.request.get('phase'),
+            int(self.request.get('step')),
+            self.request.get('cursor') or None,
+            self.request.get('outer') or None)
+
 class SendConfirmationEmailHandler(webapp2.RequestHandler):
     def post(self):
         """Send email confirming Conference creation."""
-        mail.send_mail(
-            'noreply@%s.appspotmail.com' % (
-                app_identity.get_application_id()),     # from
-            self.request.get('email'),                  # to
-            'You created a new Conference!',            # subj
-            'Hi, you have created a following '         # body
-            'conference:\r\n\r\n%s' % self.request.get(
-                'conferenceInfo')
-        )
+        tasks.sendConfirmationEmail(
+            self.request.get('email'),
+            self.request.get('conferenceInfo'))
 
 # - - - Task 4: Add a Task - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # The task will check if there is more than one session by this speaker at this conference,
@@ -48,16 +89,103 @@ class SendConfirmationEmailHandler(webapp2.RequestHandler):
 class CheckFeaturedSpeakerHandler(webapp2.RequestHandler):
     def post(self):
         """set memcache entry if speaker has more than one session"""
-        sessions = Session.query().filter(Session.speakerKey==self.request.get('speakerKey'))
-        # Add one if the session key just added can not yet be found in the queried sessions
-        not_found = not any(s.key.urlsafe() == self.request.get('sessionKey') for s in sessions)
-        if sessions.count() + not_found > 1:
-            memcache.set(MEMCACHE_FEATURED_SPEAKER_KEY, 
-                '%s is our latest Featured Speaker' % self.request.get(
-                'speakerDisplayName'))
+        tasks.checkFeaturedSpeaker(
+            self.request.get('speakerKey'),
+            self.request.get('speakerDisplayName'))
+
+class WarmupHandler(webapp2.RequestHandler):
+    def get(self):
+        """Pre-load the Endpoints API modules on a new instance."""
+        tasks.warmup()
+        self.response.set_status(200)
+
+class ResaveHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start re-saving every entity of ?kind=, e.g. to backfill isComplete."""
+        from google.appengine.api import taskqueue
+        kind = self.request.get('kind')
+        taskqueue.add(url='/tasks/resave', params={'kind': kind})
+        self.response.write('Re-save of %s started' % kind)
+
+    def post(self):
+        """Re-save one batch and chain the next."""
+        tasks.resaveKind(self.request.get('kind'),
+                         self.request.get('cursor') or None)
+
+class ImportHandler(webapp2.RequestHandler):
+    def post(self):
+        """Bulk import a JSONL (or ?format=csv) body; see bulk.py."""
+        import bulk
+        importer = bulk.Importer(dry_run=bool(self.request.get('dryRun')))
+        records = bulk.readRecords(self.request.body_file,
+                                   self.request.get('format') or 'jsonl')
+        summary = importer.run(records)
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(summary))
+
+class ExportHandler(webapp2.RequestHandler):
+    def get(self):
+        """Export every entity of ?kind= as NDJSON, a page at a time."""
+        import bulk
+        kind = self.request.get('kind')
+        if kind not in bulk.EXPORT_KINDS:
+            self.abort(400, 'kind must be one of %s' % ', '.join(bulk.EXPORT_KINDS))
+        self.response.headers['Content-Type'] = 'application/x-ndjson'
+        self.response.app_iter = bulk.exportLines(kind)
+
+class ProfilerHandler(webapp2.RequestHandler):
+    def get(self):
+        """Return profiler settings, or ?method='s hottest functions, as JSON."""
+        import profiler
+        method = self.request.get('method')
+        self.response.headers['Content-Type'] = 'application/json'
+        if method:
+            self.response.write(json.dumps(profiler.results(method)))
+        else:
+            self.response.write(json.dumps(profiler.config()))
+
+    def post(self):
+        """Enable profiling of method for rate of calls and minutes, or
+        disable it with disable=1."""
+        import profiler
+        method = self.request.get('method') or None
+        if self.request.get('disable'):
+            profiler.disable(method)
+        elif method:
+            profiler.enable(method,
+                            float(self.request.get('rate') or 0.1),
+                            60 * int(self.request.get('minutes') or 10))
+        else:
+            self.abort(400, 'method required')
+        self.response.set_status(204)
+
+class CacheStatsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Report cache counters as JSON; lrucache figures are for
+        the instance that served this request only."""
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps({
+            'singleflight': singleflight.stats(),
+            'lrucache': lrucache.stats(),
+            'idpool': idpool.POOL.stats(),
+        }))
 
 app = webapp2.WSGIApplication([
+    ('/_ah/warmup', WarmupHandler),
     ('/crons/set_announcement', SetAnnouncementHandler),
+    ('/crons/compute_recommendations', ComputeRecommendationsHandler),
+    ('/crons/flush_registration_stats', FlushRegistrationStatsHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
     ('/tasks/check_featuredSpeaker', CheckFeaturedSpeakerHandler),
+    ('/tasks/resave', ResaveHandler),
+    ('/tasks/promote_waitlist', PromoteWaitlistHandler),
+    ('/tasks/drain_registrations', DrainRegistrationsHandler),
+    ('/tasks/delete_conference', DeleteConferenceHandler),
+    ('/tasks/rebuild_speaker_sessions', RebuildSpeakerSessionsHandler),
+    ('/admin/resave', ResaveHandler),
+    ('/admin/rebuild_speaker_sessions', RebuildSpeakerSessionsHandler),
+    ('/admin/cache_stats', CacheStatsHandler),
+    ('/admin/profiler', ProfilerHandler),
+    ('/admin/import', ImportHandler),
+    ('/admin/export', ExportHandler),
 ], debug=True)
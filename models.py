@@ -12,22 +12,41 @@ created/forked from conferences.py by wesc on 2014 may 24
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
-import httplib
-import endpoints
 from protorpc import messages
 from google.appengine.ext import ndb
 
-class ConflictException(endpoints.ServiceException):
-    """ConflictException -- exception mapped to HTTP 409 response"""
-    http_status = httplib.CONFLICT
+import datebuckets
+
+class WebsafeKeyProperty(ndb.KeyProperty):
+    """KeyProperty that also reads keys stored as websafe strings.
+
+    Lets a StringProperty of websafe keys become a native key property
+    without a stop-the-world migration: old values load as Keys and are
+    written back natively on the entity's next put. Until every entity
+    has been re-saved, queries on the property must match both forms
+    (see bothForms).
+    """
+    def _db_get_value(self, v, unused_p):
+        if not v.has_referencevalue() and v.has_stringvalue():
+            return ndb.Key(urlsafe=v.stringvalue())
+        return super(WebsafeKeyProperty, self)._db_get_value(v, unused_p)
+
+    def bothForms(self, key):
+        """Return a filter matching key stored natively or as a string."""
+        return ndb.GenericProperty(self._name).IN([key, key.urlsafe()])
 
 class Profile(ndb.Model):
     """Profile -- User profile object"""
     displayName = ndb.StringProperty()
     mainEmail = ndb.StringProperty()
     teeShirtSize = ndb.StringProperty(default='NOT_SPECIFIED')
-    conferenceKeysToAttend = ndb.StringProperty(repeated=True)
-    sessionKeysWishList = ndb.StringProperty(repeated=True)
+    conferenceKeysToAttend = WebsafeKeyProperty(kind='Conference', repeated=True)
+    sessionKeysWishList = WebsafeKeyProperty(kind='Session', repeated=True)
+
+class UserIdMapping(ndb.Model):
+    """UserIdMapping -- user id of an email for the custom id_type,
+    keyed by lowercased email; never changes once created"""
+    userId = ndb.StringProperty(indexed=False)
 
 class ProfileMiniForm(messages.Message):
     """ProfileMiniForm -- update Profile form message"""
@@ -57,13 +76,92 @@ class Conference(ndb.Model):
     name            = ndb.StringProperty(required=True)
     description     = ndb.StringProperty()
     organizerUserId = ndb.StringProperty()
-    topics          = ndb.StringProperty(repeated=True)
+    # queried through ConferenceTopic; indexing it here multiplied every
+    # composite index holding it by the number of topics
+    topics          = ndb.StringProperty(repeated=True, indexed=False)
     city            = ndb.StringProperty()
     startDate       = ndb.DateProperty()
     month           = ndb.IntegerProperty() # TODO: do we need for indexing like Java?
     endDate         = ndb.DateProperty()
     maxAttendees    = ndb.IntegerProperty()
     seatsAvailable  = ndb.IntegerProperty()
+    # year/month/week/day buckets of each date, for date range IN filters
+    startBuckets    = ndb.ComputedProperty(
+                          lambda self: datebuckets.bucketsFor(self.startDate), repeated=True)
+    endBuckets      = ndb.ComputedProperty(
+                          lambda self: datebuckets.bucketsFor(self.endDate), repeated=True)
+    # registrations go through the group-commit queue in regqueue.py
+    highDemand      = ndb.BooleanProperty(default=False, indexed=False)
+    # set by deleteConference; reads hide the conference until cascade.py removes it
+    deleted         = ndb.BooleanProperty(default=False, indexed=False)
+    # recomputed on every put; lets getIncompleteConferences use one equality filter
+    isComplete      = ndb.ComputedProperty(lambda self: bool(
+                          self.description and self.startDate and self.endDate))
+
+class ConferenceTopic(ndb.Model):
+    """ConferenceTopic -- one per topic of a Conference, its child, carrying
+    the filterable fields that only change on create and update; written
+    by topicindex.py"""
+    topic           = ndb.StringProperty()
+    name            = ndb.StringProperty()
+    city            = ndb.StringProperty()
+    month           = ndb.IntegerProperty()
+    maxAttendees    = ndb.IntegerProperty()
+    startDate       = ndb.DateProperty(indexed=False)
+    startBuckets    = ndb.ComputedProperty(
+                          lambda self: datebuckets.bucketsFor(self.startDate), repeated=True)
+
+class ConferenceSimilarity(ndb.Model):
+    """ConferenceSimilarity -- precomputed similar conferences, keyed by
+    websafe Conference key; written by the recommendations batch job"""
+    similar = ndb.JsonProperty(indexed=False)   # [[websafeKey, score], ...]
+    computed = ndb.DateTimeProperty(auto_now=True, indexed=False)
+
+class RegistrationCounter(ndb.Model):
+    """RegistrationCounter -- registrations of one conference in one hour or day"""
+    conferenceKey   = ndb.StringProperty()
+    granularity     = ndb.StringProperty()      # 'hour' or 'day'
+    start           = ndb.DateTimeProperty()
+    registrations   = ndb.IntegerProperty(indexed=False)
+    unregistrations = ndb.IntegerProperty(indexed=False)
+    appliedTasks    = ndb.JsonProperty(indexed=False, compressed=True)  # task name: time counted
+
+    @classmethod
+    def keyFor(cls, wsck, granularity, start):
+        return ndb.Key(cls, '%s:%s:%s' % (granularity, start.strftime('%Y%m%d%H'), wsck))
+
+class WaitlistEntry(ndb.Model):
+    """WaitlistEntry -- user waiting for a seat at a sold-out conference"""
+    conferenceKey   = ndb.StringProperty()
+    userId          = ndb.StringProperty(indexed=False)
+    joined          = ndb.DateTimeProperty()
+
+    @classmethod
+    def keyFor(cls, wsck, user_id):
+        return ndb.Key(cls, '%s:%s' % (wsck, user_id))
+
+class ConferenceDeletion(ndb.Model):
+    """ConferenceDeletion -- progress of a cascade deletion, keyed by
+    websafe Conference key"""
+    status          = ndb.StringProperty(indexed=False)     # RUNNING or DONE
+    phase           = ndb.StringProperty(indexed=False)
+    profilesUpdated = ndb.IntegerProperty(indexed=False)
+    entitiesDeleted = ndb.IntegerProperty(indexed=False)
+    step            = ndb.IntegerProperty(indexed=False)    # last step recorded
+    started         = ndb.DateTimeProperty(indexed=False)
+    finished        = ndb.DateTimeProperty(indexed=False)
+
+class RegistrationTicket(ndb.Model):
+    """RegistrationTicket -- queued registration for a high-demand conference"""
+    conferenceKey   = ndb.StringProperty()
+    userId          = ndb.StringProperty(indexed=False)
+    created         = ndb.DateTimeProperty()
+    status          = ndb.StringProperty()          # PENDING, REGISTERED or REJECTED
+    reason          = ndb.StringProperty(indexed=False)
+
+    @classmethod
+    def keyFor(cls, wsck, user_id):
+        return ndb.Key(cls, '%s:%s' % (wsck, user_id))
 
 class ConferenceForm(messages.Message):
     """ConferenceForm -- Conference outbound form message"""
@@ -79,10 +177,64 @@ class ConferenceForm(messages.Message):
     endDate         = messages.StringField(10) #DateTimeField()
     websafeKey      = messages.StringField(11)
     organizerDisplayName = messages.StringField(12)
+    highDemand      = messages.BooleanField(13)
 
 class ConferenceForms(messages.Message):
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    partial = messages.BooleanField(3)  # time budget ran out; continue from nextPageToken
+
+class RegistrationBucketForm(messages.Message):
+    """RegistrationBucketForm -- registrations in one hour or day"""
+    start           = messages.StringField(1)
+    registrations   = messages.IntegerField(2)
+    unregistrations = messages.IntegerField(3)
+
+class RegistrationStatsForm(messages.Message):
+    """RegistrationStatsForm -- registration time series outbound form message"""
+    granularity     = messages.StringField(1)
+    buckets         = messages.MessageField(RegistrationBucketForm, 2, repeated=True)
+    seatsAvailable  = messages.IntegerField(3)
+    projectedSellOut = messages.StringField(4)
+
+class ConferenceDeletionForm(messages.Message):
+    """ConferenceDeletionForm -- progress of a conference deletion"""
+    websafeConferenceKey = messages.StringField(1)
+    status = messages.StringField(2)
+    phase = messages.StringField(3)
+    profilesUpdated = messages.IntegerField(4)
+    entitiesDeleted = messages.IntegerField(5)
+    started = messages.StringField(6)
+    finished = messages.StringField(7)
+
+class RegistrationTicketForm(messages.Message):
+    """RegistrationTicketForm -- outcome of a queued registration"""
+    websafeConferenceKey = messages.StringField(1)
+    status = messages.StringField(2)
+    reason = messages.StringField(3)
+    created = messages.StringField(4)
+    websafeKey = messages.StringField(5)
+
+class BatchCallForm(messages.Message):
+    """BatchCallForm -- one ConferenceApi call inside a batch request"""
+    method = messages.StringField(1)
+    params = messages.StringField(2)    # JSON object of the method's request fields
+
+class BatchCallForms(messages.Message):
+    """BatchCallForms -- calls to run in one batch request"""
+    calls = messages.MessageField(BatchCallForm, 1, repeated=True)
+
+class BatchResultForm(messages.Message):
+    """BatchResultForm -- outcome of one call in a batch request"""
+    method = messages.StringField(1)
+    status = messages.IntegerField(2)
+    body = messages.StringField(3)      # JSON of the method's response message
+    error = messages.StringField(4)
+
+class BatchResultForms(messages.Message):
+    """BatchResultForms -- outcomes of a batch request, in call order"""
+    results = messages.MessageField(BatchResultForm, 1, repeated=True)
 
 class TeeShirtSize(messages.Enum):
     """TeeShirtSize -- t-shirt size enumeration value"""
@@ -123,11 +275,27 @@ class Session(ndb.Model):
     """Session -- Session object"""
     name                = ndb.StringProperty(required=True)
     highlights          = ndb.StringProperty()
-    speakerKey          = ndb.StringProperty()
+    speakerKey          = WebsafeKeyProperty(kind='Speaker')
     speakerDisplayName  = ndb.StringProperty()
     duration            = ndb.IntegerProperty() #in minutes
     typeOfSession       = ndb.StringProperty(default='TBA')
     startDateTime       = ndb.DateTimeProperty()
+    # recomputed on every put; lets getIncompleteConferenceSessions use one equality filter
+    isComplete          = ndb.ComputedProperty(lambda self: bool(
+                              self.speakerKey and
+                              self.highlights != 'To be announced' and
+                              self.typeOfSession != 'TBA'))
+
+class SpeakerSessions(ndb.Model):
+    """SpeakerSessions -- summaries of one Speaker's sessions across all
+    conferences, keyed by the Speaker's id; written by speakerindex.py"""
+    speakerDisplayName = ndb.StringProperty(indexed=False)
+    # [{key, name, highlights, duration, type, start}, ...] by start time
+    sessions = ndb.JsonProperty(indexed=False)
+
+    @classmethod
+    def keyFor(cls, sp_key):
+        return ndb.Key(cls, sp_key.id())
 
 class SessionForm(messages.Message):
     """SessionForm -- Session query inbound form message"""
@@ -144,12 +312,40 @@ class SessionForm(messages.Message):
 class SessionForms(messages.Message):
     """SessionForms -- multiple Session outbound form message"""
     items = messages.MessageField(SessionForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    partial = messages.BooleanField(3)  # time budget ran out; continue from nextPageToken
+
+class TimetableSlotForm(messages.Message):
+    """TimetableSlotForm -- sessions starting at the same time"""
+    startTime = messages.StringField(1)
+    sessions = messages.MessageField(SessionForm, 2, repeated=True)
+
+class TimetableDayForm(messages.Message):
+    """TimetableDayForm -- one day of a conference timetable"""
+    date = messages.StringField(1)
+    slots = messages.MessageField(TimetableSlotForm, 2, repeated=True)
+
+class TimetableForm(messages.Message):
+    """TimetableForm -- page of a conference timetable, one or more days"""
+    days = messages.MessageField(TimetableDayForm, 1, repeated=True)
+    nextDay = messages.StringField(2)
+
+class FeaturedSpeaker(ndb.Model):
+    """FeaturedSpeaker -- latest featured speaker, backs the memcache entry"""
+    SINGLETON_ID = 'latest'
+    speakerKey = ndb.StringProperty(indexed=False)
+    speakerDisplayName = ndb.StringProperty(indexed=False)
 
 class Speaker(ndb.Model):
     """Speaker -- Speaker object"""    
     displayName = ndb.StringProperty(required=True)
     profileKey = ndb.StringProperty() #if speaker is also an attendee 
     biography = ndb.StringProperty()
+    # lowercase full name and name words, for prefix range queries in searchSpeakers
+    nameLower = ndb.ComputedProperty(
+        lambda self: ' '.join(self.displayName.lower().split()))
+    nameWords = ndb.ComputedProperty(
+        lambda self: sorted(set(self.displayName.lower().split())), repeated=True)
 
 class SpeakerForm(messages.Message):
     """SpeakerForm -- create Speaker form message"""
@@ -161,3 +357,5 @@ class SpeakerForm(messages.Message):
 class SpeakerForms(messages.Message):
     """SpeakerForm -- multiple Speaker outbound form message"""
     items = messages.MessageField(SpeakerForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    partial = messages.BooleanField(3)  # time budget ran out; continue from nextPageToken
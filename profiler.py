@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""profiler.py
+
+On-demand sampling profiler for ConferenceApi endpoints
+
+An admin turns profiling on for one endpoint at a time through
+/admin/profiler, which stores {method: (sample rate, until)} in memcache.
+Each instance re-reads that setting at most every CONFIG_REFRESH seconds,
+so when nothing is enabled a call costs one dict lookup and no RPC. A
+sampled call runs under cProfile (which only sees the calling thread);
+its per-function timings are merged into a per-method summary in
+memcache, keeping the TOP_FUNCTIONS hottest entries. Profiled methods
+called from a sampled one, as batch does, count in its profile and are
+not sampled themselves: a nested cProfile would stop the outer one.
+
+"""
+
+import cProfile
+import functools
+import pstats
+import random
+import threading
+import time
+
+from google.appengine.api import memcache
+
+CONFIG_KEY = 'profiler:config'
+RESULTS_PREFIX = 'profiler:results:'
+CONFIG_REFRESH = 10     # seconds
+TOP_FUNCTIONS = 50
+RESULTS_TTL = 7 * 24 * 3600
+
+_config = {}
+_config_loaded = 0
+_lock = threading.Lock()
+_local = threading.local()     # .profiling: a sampled call is running
+
+
+def enable(method, rate, seconds):
+    """Profile a `rate` fraction of calls to method for the next seconds."""
+    config = memcache.get(CONFIG_KEY) or {}
+    config[method] = (rate, time.time() + seconds)
+    memcache.set(CONFIG_KEY, config)
+
+
+def disable(method=None):
+    """Stop profiling method, or every method."""
+    config = memcache.get(CONFIG_KEY) or {}
+    if method:
+        config.pop(method, None)
+    else:
+        config = {}
+    memcache.set(CONFIG_KEY, config)
+
+
+def _sampleRate(method):
+    global _config, _config_loaded
+    now = time.time()
+    if now - _config_loaded > CONFIG_REFRESH:
+        with _lock:
+            if now - _config_loaded > CONFIG_REFRESH:
+                _config = memcache.get(CONFIG_KEY) or {}
+                _config_loaded = now
+    setting = _config.get(method)
+    if setting and setting[1] > now:
+        return setting[0]
+    return 0
+
+
+def _functionLabel(func):
+    filename, line, name = func
+    return '%s:%d(%s)' % (filename, line, name)
+
+
+def _record(method, profile, wall):
+    """Merge one sampled call into the method's summary in memcache."""
+    stats = pstats.Stats(profile).stats
+    client = memcache.Client()
+    key = RESULTS_PREFIX + method
+    for _ in range(5):
+        summary = client.gets(key)
+        if summary is None:
+            summary = {'samples': 0, 'wall': 0.0, 'functions': {}}
+            if not memcache.add(key, summary, time=RESULTS_TTL):
+                continue
+            summary = client.gets(key)
+            if summary is None:
+                return
+        summary['samples'] += 1
+        summary['wall'] += wall
+        functions = summary['functions']
+        for func, (cc, nc, tottime, cumtime, callers) in stats.items():
+            label = _functionLabel(func)
+            calls, tot, cum = functions.get(label, (0, 0.0, 0.0))
+            functions[label] = (calls + nc, tot + tottime, cum + cumtime)
+        hottest = sorted(functions.items(), key=lambda f: f[1][1], reverse=True)
+        summary['functions'] = dict(hottest[:TOP_FUNCTIONS])
+        if client.cas(key, summary, time=RESULTS_TTL):
+            return
+
+
+def profiled(func):
+    """Decorate an endpoint method so it can be sampled when enabled."""
+    method = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if getattr(_local, 'profiling', False):
+            return func(*args, **kwargs)
+        rate = _sampleRate(method)
+        if not rate or random.random() >= rate:
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        start = time.time()
+        _local.profiling = True
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            _local.profiling = False
+            _record(method, profile, time.time() - start)
+    return wrapper
+
+
+def results(method):
+    """Return the method's summary, hottest functions (by own time) first."""
+    summary = memcache.get(RESULTS_PREFIX + method)
+    if not summary:
+        return None
+    functions = sorted(summary['functions'].items(), key=lambda f: f[1][1], reverse=True)
+    return {
+        'samples': summary['samples'],
+        'wallPerCall': summary['wall'] / summary['samples'],
+        'functions': [{'function': label, 'calls': calls,
+                       'tottime': tot, 'cumtime': cum}
+                      for label, (calls, tot, cum) in functions],
+    }
+
+
+def config():
+    """Return the current {method: (rate, until)} settings."""
+    return memcache.get(CONFIG_KEY) or {}
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""ratelimit.py
+
+Per-user admission control for the write endpoints of the conference API
+
+Each (bucket, user) pair gets a token bucket that holds up to `limit`
+tokens and refills continuously at `limit` tokens per `period` seconds,
+as configured in settings.RATE_LIMITS. A client gets at most `limit`
+calls through in a burst and `limit * t / period` more over any t
+seconds after it, unlike a fixed window, which lets twice the limit
+through around a window boundary. The bucket lives in memcache as
+(tokens, time of last update) and is updated with gets/cas, so no
+datastore RPC is made.
+
+If memcache is unavailable, or the bucket cannot be updated after a few
+cas retries, the call is admitted: the limiter fails open rather than
+turning a memcache outage into an API outage.
+
+"""
+
+import time
+
+from google.appengine.api import memcache
+
+from settings import RATE_LIMITS
+
+MEMCACHE_RATELIMIT_PREFIX = 'ratelimit'
+CAS_RETRIES = 3
+
+
+def _bucketKey(bucket, user_id):
+    return '%s:%s:%s' % (MEMCACHE_RATELIMIT_PREFIX, bucket, user_id)
+
+
+def _tokens(state, limit, period, now):
+    """Return the tokens state holds at now, counting the refill."""
+    tokens, updated = state
+    return min(float(limit), tokens + max(0.0, now - updated) * limit / period)
+
+
+def consume(bucket, user_id, now=None):
+    """Take one token from the user's bucket; return False if it is empty."""
+    if bucket not in RATE_LIMITS:
+        return True
+    limit, period = RATE_LIMITS[bucket]
+    if now is None:
+        now = time.time()
+    key = _bucketKey(bucket, user_id)
+    client = memcache.Client()
+
+    for _ in range(CAS_RETRIES):
+        state = client.gets(key)
+        if state is None:
+            # a full bucket, less this call; an idle bucket is full again
+            # after one period, so it may expire then
+            if client.add(key, (limit - 1.0, now), time=period + 1):
+                return True
+            continue
+        tokens = _tokens(state, limit, period, now)
+        if tokens < 1:
+            return False
+        if client.cas(key, (tokens - 1, now), time=period + 1):
+            return True
+    return True
+
+
+def retryAfter(bucket, user_id, now=None):
+    """Return whole seconds until the user's bucket holds a token."""
+    limit, period = RATE_LIMITS[bucket]
+    if now is None:
+        now = time.time()
+    state = memcache.get(_bucketKey(bucket, user_id))
+    if state is None:
+        return 0
+    missing = 1 - _tokens(state, limit, period, now)
+    return max(0, int(missing * period / limit) + 1)
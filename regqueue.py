@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""regqueue.py
+
+Group-commit registration queue for high-demand conferences
+
+When a conference is marked highDemand, registering only writes a
+RegistrationTicket, a root entity outside the Conference entity group,
+so a flood of registrations does not fight over the conference's
+transaction. A drain task, named per conference and DRAIN_WINDOW-second
+slot so a burst schedules one task, then applies pending tickets oldest
+first, DRAIN_BATCH_SIZE users per transaction: the conference's write
+rate limits batches, not registrations. Clients poll their ticket for
+the outcome.
+
+Ticket statuses are written after each batch commits. If that write is
+lost the ticket stays pending and a later drain finds the user already
+registered, so applying a ticket twice is harmless.
+
+"""
+
+import hashlib
+import time
+from datetime import datetime
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import Profile
+from models import RegistrationTicket
+
+import regstats
+import singleflight
+from tasks import MEMCACHE_CONFERENCE_PREFIX
+from tasks import MEMCACHE_RECOMMENDATIONS_PREFIX
+
+PENDING = 'PENDING'
+REGISTERED = 'REGISTERED'
+REJECTED = 'REJECTED'
+
+DRAIN_WINDOW = 1            # seconds of registrations handled by one task
+DRAIN_BATCH_SIZE = 20       # users per transaction; 1 + 20 entity groups
+MAX_DRAIN_BATCHES = 100
+STALE_TICKET = 10           # seconds pending before a poll reschedules the drain
+
+
+def enqueue(wsck, user_id):
+    """Queue user's registration for the conference; return the ticket.
+    An already pending ticket is returned as is.
+    """
+    key = RegistrationTicket.keyFor(wsck, user_id)
+
+    @ndb.transactional()
+    def txn():
+        ticket = key.get()
+        if ticket and ticket.status == PENDING:
+            return ticket
+        ticket = RegistrationTicket(key=key, conferenceKey=wsck, userId=user_id,
+                                    created=datetime.utcnow(), status=PENDING)
+        ticket.put()
+        return ticket
+    ticket = txn()
+    scheduleDrain(wsck)
+    return ticket
+
+
+def getTicket(wsck, user_id):
+    """Return user's ticket for the conference, or None. Polling a ticket
+    that has been pending for a while makes sure a drain is scheduled.
+    """
+    ticket = RegistrationTicket.keyFor(wsck, user_id).get(use_cache=False)
+    if (ticket and ticket.status == PENDING and
+            (datetime.utcnow() - ticket.created).total_seconds() > STALE_TICKET):
+        scheduleDrain(wsck)
+    return ticket
+
+
+def scheduleDrain(wsck, now=None):
+    """Enqueue the drain task for this conference and time slot."""
+    if now is None:
+        now = time.time()
+    slot = int(now // DRAIN_WINDOW)
+    name = 'drain-%s-%d' % (hashlib.sha1(wsck).hexdigest(), slot)
+    try:
+        taskqueue.add(name=name, url='/tasks/drain_registrations',
+                      params={'websafeConferenceKey': wsck},
+                      countdown=(slot + 1) * DRAIN_WINDOW - now)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass    # a task for this slot is already pending or has run
+
+
+@ndb.transactional(xg=True)
+def _applyBatch(c_key, tickets):
+    """Register tickets' users while seats last; return ({ticket key:
+    (status, reason)}, newly registered Profiles).
+    """
+    conf = c_key.get()
+    if not conf or conf.deleted:
+        return dict((t.key, (REJECTED, 'Conference not found')) for t in tickets), []
+    wsck = c_key.urlsafe()
+    profiles = ndb.get_multi([ndb.Key(Profile, t.userId) for t in tickets])
+
+    outcomes = {}
+    registered = []
+    for ticket, prof in zip(tickets, profiles):
+        if not prof:
+            outcomes[ticket.key] = (REJECTED, 'Profile not found')
+        elif c_key in prof.conferenceKeysToAttend:
+            outcomes[ticket.key] = (REGISTERED, None)
+        elif conf.seatsAvailable <= 0:
+            outcomes[ticket.key] = (REJECTED,
+                'There are no seats available; join the waitlist instead.')
+        else:
+            prof.conferenceKeysToAttend.append(c_key)
+            conf.seatsAvailable -= 1
+            registered.append(prof)
+            outcomes[ticket.key] = (REGISTERED, None)
+
+    if registered:
+        ndb.put_multi([conf] + registered)
+        regstats.record(wsck, True, count=len(registered))
+    return outcomes, registered
+
+
+def drain(wsck):
+    """Apply the conference's pending tickets in batches; return the
+    number of tickets settled.
+    """
+    c_key = ndb.Key(urlsafe=wsck)
+    settled = 0
+    for _ in range(MAX_DRAIN_BATCHES):
+        keys = RegistrationTicket.query(
+            RegistrationTicket.conferenceKey==wsck,
+            RegistrationTicket.status==PENDING) \
+            .order(RegistrationTicket.created).fetch(DRAIN_BATCH_SIZE, keys_only=True)
+        # the query may lag behind; only act on tickets that are still pending
+        tickets = [t for t in ndb.get_multi(keys, use_cache=False)
+                   if t and t.status == PENDING]
+        if not tickets:
+            break
+        outcomes, registered = _applyBatch(c_key, tickets)
+        for ticket in tickets:
+            ticket.status, ticket.reason = outcomes[ticket.key]
+        ndb.put_multi(tickets)
+        settled += len(tickets)
+        if registered:
+            singleflight.expire(MEMCACHE_CONFERENCE_PREFIX + wsck)
+            memcache.delete_multi([prof.key.id() for prof in registered],
+                                  key_prefix=MEMCACHE_RECOMMENDATIONS_PREFIX)
+    else:
+        # more work than one task should do; carry on in a fresh one
+        scheduleDrain(wsck)
+    return settled
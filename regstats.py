@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+"""regstats.py
+
+Time-bucketed registration counters for capacity analytics
+
+Every registration and unregistration adds a small task to the
+registration-stats pull queue, transactionally with the registration
+itself, so counts are neither lost nor made up by failed transactions.
+A cron job leases those tasks in batches, sums them per conference and
+hour, and adds the sums to hourly and daily RegistrationCounter
+entities. Those live outside the Conference entity group, so none of
+this adds contention to registration.
+
+The tasks are only deleted once the counters are written, so a flush
+that fails in between leaves them to be leased again. Each counter
+therefore records the names of the tasks it has counted, for
+APPLIED_RETENTION seconds, in the transaction that adds them, and skips
+any it has already seen.
+
+"""
+
+import collections
+import json
+import time
+from datetime import datetime
+from datetime import timedelta
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import RegistrationCounter
+
+QUEUE_NAME = 'registration-stats'
+LEASE_SECONDS = 120
+LEASE_BATCH_SIZE = 1000
+MAX_LEASE_ROUNDS = 20
+GRANULARITIES = ('hour', 'day')
+PROJECTION_WINDOW = timedelta(days=3)
+# seconds a counter remembers the tasks it has counted; a task left by a
+# failed flush is leased again within LEASE_SECONDS plus the cron interval
+APPLIED_RETENTION = 3600
+
+
+def record(wsck, registered, count=1):
+    """Queue count registrations (or unregistrations) of wsck for
+    counting; call inside the registration transaction.
+    """
+    payload = json.dumps({'c': wsck, 'r': bool(registered), 'n': count,
+                          't': int(time.time())})
+    taskqueue.Queue(QUEUE_NAME).add(
+        taskqueue.Task(payload=payload, method='PULL'), transactional=True)
+
+
+def bucketStart(when, granularity):
+    """Return the start of the hour or day bucket holding datetime when."""
+    if granularity == 'day':
+        return when.replace(hour=0, minute=0, second=0, microsecond=0)
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+@ndb.transactional()
+def _addToCounter(wsck, granularity, start, events, now=None):
+    """Add events, [(task name, registered, count)], to a counter,
+    skipping the tasks it has already counted."""
+    if now is None:
+        now = time.time()
+    key = RegistrationCounter.keyFor(wsck, granularity, start)
+    counter = key.get() or RegistrationCounter(
+        key=key, conferenceKey=wsck, granularity=granularity, start=start,
+        registrations=0, unregistrations=0)
+    applied = dict((name, at) for name, at in (counter.appliedTasks or {}).items()
+                   if at > now - APPLIED_RETENTION)
+    for name, registered, count in events:
+        if name in applied:
+            continue
+        if registered:
+            counter.registrations += count
+        else:
+            counter.unregistrations += count
+        applied[name] = now
+    counter.appliedTasks = applied
+    counter.put()
+
+
+def flush():
+    """Move queued registration events into counters; return how many."""
+    queue = taskqueue.Queue(QUEUE_NAME)
+    flushed = 0
+    for _ in range(MAX_LEASE_ROUNDS):
+        leased = queue.lease_tasks(LEASE_SECONDS, LEASE_BATCH_SIZE)
+        if not leased:
+            break
+        events = collections.defaultdict(list)
+        for task in leased:
+            event = json.loads(task.payload)
+            when = datetime.utcfromtimestamp(event['t'])
+            for granularity in GRANULARITIES:
+                events[(event['c'], granularity, bucketStart(when, granularity))].append(
+                    (task.name, event['r'], event.get('n', 1)))
+        for (wsck, granularity, start), counted in events.items():
+            _addToCounter(wsck, granularity, start, counted)
+        queue.delete_tasks(leased)
+        flushed += len(leased)
+    return flushed
+
+
+def series(wsck, granularity, since=None):
+    """Return the RegistrationCounters of wsck in start order."""
+    q = RegistrationCounter.query(
+        RegistrationCounter.conferenceKey==wsck,
+        RegistrationCounter.granularity==granularity)
+    if since:
+        q = q.filter(RegistrationCounter.start >= since)
+    return q.order(RegistrationCounter.start).fetch()
+
+
+def projectSellOut(hourly, seatsAvailable, now=None):
+    """Project when seatsAvailable runs out at the net registration rate
+    of the last PROJECTION_WINDOW of hourly counters; None if not filling.
+    """
+    if now is None:
+        now = datetime.utcnow()
+    if seatsAvailable <= 0:
+        return now
+    since = now - PROJECTION_WINDOW
+    net = sum(c.registrations - c.unregistrations for c in hourly if c.start >= since)
+    if net <= 0:
+        return None
+    perSecond = net / PROJECTION_WINDOW.total_seconds()
+    return now + timedelta(seconds=seatsAvailable / perSecond)
@@ -16,3 +16,34 @@ WEB_CLIENT_ID = '772667366730-sn1corrrllj45ul2utocivunp6dqh6ua.apps.googleuserco
 ANDROID_CLIENT_ID = 'replace with Android client ID'
 IOS_CLIENT_ID = 'replace with iOS client ID'
 ANDROID_AUDIENCE = WEB_CLIENT_ID
+
+# Values given to fields a new Conference or Session leaves empty, by
+# the endpoints and by bulk imports.
+CONFERENCE_DEFAULTS = {
+    "city": "Default City",
+    "maxAttendees": 0,
+    "seatsAvailable": 0,
+    "topics": [ "Default", "Topic" ],
+}
+
+SESSION_DEFAULTS = {
+    'highlights': 'To be announced',
+    'duration': 60,
+}
+
+# Per-user rate limits for the write endpoints, as
+# bucket: (calls allowed, refill period in seconds).
+RATE_LIMITS = {
+    'registration': (10, 60),   # register/unregisterFromConference
+    'create': (30, 3600),       # createConference, createSession, addSpeaker
+    'wishlist': (30, 60),       # addSessionToWishlist
+}
+
+# Seconds the scanning endpoints may spend before they return what they
+# have found with a nextPageToken, well inside the request deadline.
+TIME_BUDGETS = {
+    'getSessionsBySpeaker': 5,
+    'getSpeakers': 5,
+    'getIncompleteConferences': 5,
+    'getNotWorkshopSessionsBefore7pm': 5,
+}
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""singleflight.py
+
+Request coalescing for hot memcache entries
+
+Values are stored in memcache wrapped with a soft expiry time and kept
+for STALE_GRACE seconds past it. When an entry is missing or soft
+expired, callers race for a short lease taken with memcache.add; the
+winner recomputes the value while the others return the stale value if
+there is one, or poll briefly for the winner's result. Only if the wait
+runs out does a loser compute the value itself, so an expiry storm costs
+one datastore round instead of one per concurrent request.
+
+Miss-path outcomes are counted in memcache (see stats()) so the
+datastore load during an expiry storm can be measured.
+
+"""
+
+import time
+
+from google.appengine.api import memcache
+
+LEASE_SUFFIX = ':lease'
+STATS_PREFIX = 'singleflight:stats:'
+STATS_OUTCOMES = ('compute', 'stale', 'waited', 'fallback')
+LEASE_TIME = 10         # seconds a recompute may take before others retry
+STALE_GRACE = 3600      # seconds a soft-expired value can still be served
+WAIT_TIME = 2.0         # seconds a loser waits for the winner's value
+WAIT_INTERVAL = 0.05
+
+
+def _wrap(value, ttl, now):
+    return {'value': value, 'expires': now + ttl if ttl else None}
+
+
+def _entry(stored):
+    """Return stored if it is a wrapped entry; anything else, such as a
+    bare value written under the key before it was coalesced, is a miss.
+    """
+    if isinstance(stored, dict) and 'expires' in stored and 'value' in stored:
+        return stored
+    return None
+
+
+def _fresh(entry, now):
+    return entry['expires'] is None or entry['expires'] > now
+
+
+def _count(outcome):
+    memcache.incr(STATS_PREFIX + outcome, initial_value=0)
+
+
+def set(key, value, ttl=0):
+    """Store value under key, fresh for ttl seconds (0 means forever)."""
+    now = time.time()
+    memcache.set(key, _wrap(value, ttl, now),
+                 time=ttl + STALE_GRACE if ttl else 0)
+
+
+def expire(key):
+    """Mark key stale, so it is recomputed once but still served meanwhile."""
+    client = memcache.Client()
+    for _ in range(3):
+        entry = _entry(client.gets(key))
+        if entry is None:
+            memcache.delete(key)
+            return
+        entry['expires'] = 0
+        if client.cas(key, entry, time=STALE_GRACE):
+            return
+    memcache.delete(key)
+
+
+def delete(key):
+    """Drop key so the next read recomputes it."""
+    memcache.delete(key)
+
+
+def get(key, compute, ttl=0):
+    """Return the cached value of key, calling compute() at most once
+    across concurrent callers when it is missing or stale.
+    """
+    now = time.time()
+    entry = _entry(memcache.get(key))
+    if entry is not None and _fresh(entry, now):
+        return entry['value']
+
+    lease = key + LEASE_SUFFIX
+    if memcache.add(lease, 1, time=LEASE_TIME):
+        try:
+            value = compute()
+            set(key, value, ttl)
+        finally:
+            memcache.delete(lease)
+        _count('compute')
+        return value
+
+    # someone else is recomputing: serve stale, or wait for their result
+    if entry is not None:
+        _count('stale')
+        return entry['value']
+    deadline = now + WAIT_TIME
+    while time.time() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = _entry(memcache.get(key))
+        if entry is not None:
+            _count('waited')
+            return entry['value']
+    _count('fallback')
+    return compute()
+
+
+def stats():
+    """Return miss-path outcome counts; 'compute' + 'fallback' is the
+    number of times the backing store was actually hit.
+    """
+    counts = memcache.get_multi(STATS_OUTCOMES, key_prefix=STATS_PREFIX)
+    return dict((outcome, counts.get(outcome, 0)) for outcome in STATS_OUTCOMES)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+"""speakerindex.py
+
+Materialized per-speaker session lists
+
+A speaker's sessions belong to many conferences, so listing them took a
+global query on Session.speakerKey, which is eventually consistent: a
+session just created could be missing. Instead each Speaker has one
+SpeakerSessions entity holding a compact summary of every session it
+gives. createSession writes it in the same cross-group transaction as
+the Session (the conference's entity group and the speaker's), so
+getSessionsBySpeaker is one strongly consistent get and
+checkFeaturedSpeaker can count sessions from it.
+
+Bulk imports and the cascade deletion update the lists in their own
+per-speaker transactions once their session writes are done, and
+rebuild() recomputes every list from the sessions, for data written
+before the lists existed or to repair one. Deleting a conference also
+withdraws its sessions in the transaction that marks it deleted, as
+long as that stays within the entity group limit of a cross-group
+transaction; readers skip summaries of deleted conferences either way.
+
+"""
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import Session
+from models import Speaker
+from models import SpeakerSessions
+
+REBUILD_BATCH_SIZE = 20     # speakers per task
+MAX_TXN_SPEAKERS = 20       # lists a cross-group transaction may add; 25 groups in all
+
+
+def summarize(session):
+    """Return the summary of session kept in its speaker's list."""
+    start = session.startDateTime
+    return {'key': session.key.urlsafe(),
+            'name': session.name,
+            'highlights': session.highlights,
+            'duration': session.duration,
+            'type': session.typeOfSession,
+            'start': start.strftime('%Y-%m-%dT%H:%M') if start else None}
+
+
+def _apply(sp_key, sessions=(), removed=(), replace=False):
+    """Put sessions' summaries in sp_key's list and drop removed keys;
+    with replace the list holds sessions only.
+    """
+    key = SpeakerSessions.keyFor(sp_key)
+    index = key.get() or SpeakerSessions(key=key, sessions=[])
+    drop = set(k.urlsafe() for k in removed) | set(s.key.urlsafe() for s in sessions)
+    summaries = [] if replace else [e for e in index.sessions if e['key'] not in drop]
+    summaries.extend(summarize(s) for s in sessions)
+    summaries.sort(key=lambda e: (e['start'] or '', e['key']))
+    index.sessions = summaries
+    names = [s.speakerDisplayName for s in sessions if s.speakerDisplayName]
+    if names:
+        index.speakerDisplayName = names[-1]
+    index.put()
+
+
+@ndb.transactional()
+def _update(sp_key, sessions=(), removed=(), replace=False):
+    _apply(sp_key, sessions, removed, replace)
+
+
+def _bySpeaker(sessions):
+    groups = {}
+    for session in sessions:
+        if session.speakerKey:
+            groups.setdefault(session.speakerKey, []).append(session)
+    return groups
+
+
+def record(session):
+    """Add or refresh session in its speaker's list. Call it in the
+    cross-group transaction that puts session.
+    """
+    if session.speakerKey:
+        _apply(session.speakerKey, [session])
+
+
+def recordMany(sessions):
+    """Add sessions to their speakers' lists, one transaction each."""
+    for sp_key, group in _bySpeaker(sessions).items():
+        _update(sp_key, group)
+
+
+def forget(sessions):
+    """Drop sessions from their speakers' lists, one transaction each."""
+    for sp_key, group in _bySpeaker(sessions).items():
+        _update(sp_key, removed=[s.key for s in group])
+
+
+def withdraw(sessions):
+    """Drop sessions from their speakers' lists in the current cross-group
+    transaction. Return False, changing nothing, if that would write more
+    than MAX_TXN_SPEAKERS lists.
+    """
+    groups = _bySpeaker(sessions)
+    if len(groups) > MAX_TXN_SPEAKERS:
+        return False
+    for sp_key, group in groups.items():
+        _apply(sp_key, removed=[s.key for s in group])
+    return True
+
+
+def sessionsOf(sp_key):
+    """Return the SpeakerSessions of sp_key, or None if it has none."""
+    return SpeakerSessions.keyFor(sp_key).get()
+
+
+def _rebuildSpeaker(sp_key):
+    found = Session.query(Session.speakerKey.bothForms(sp_key)).fetch()
+    # the query may lag behind the list; keep listed sessions that exist
+    index = sessionsOf(sp_key)
+    known = set(s.key.urlsafe() for s in found)
+    listed = [ndb.Key(urlsafe=e['key']) for e in (index.sessions if index else [])
+              if e['key'] not in known]
+    found += [s for s in ndb.get_multi(listed) if s and s.speakerKey == sp_key]
+    _update(sp_key, found, replace=True)
+
+
+def rebuild(cursor=None):
+    """Recompute one batch of speakers' lists and chain a task for the
+    next batch. Return the number of speakers done.
+    """
+    start = ndb.Cursor(urlsafe=cursor) if cursor else None
+    keys, next_cursor, more = Speaker.query().fetch_page(
+        REBUILD_BATCH_SIZE, keys_only=True, start_cursor=start)
+    for sp_key in keys:
+        _rebuildSpeaker(sp_key)
+    if more and next_cursor:
+        taskqueue.add(url='/tasks/rebuild_speaker_sessions',
+                      params={'cursor': next_cursor.urlsafe()})
+    return len(keys)
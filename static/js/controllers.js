@@ -548,25 +548,36 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
  * A controller used for the conference detail page.
  */
 conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $log, $routeParams, HTTP_ERRORS) {
+    var REGISTRATION_POLL_INTERVAL = 1000;  // ms between polls of a queued registration
+
     $scope.conference = {};
 
     $scope.isUserAttending = false;
 
     /**
      * Initializes the conference detail page.
-     * Invokes the conference.getConference method and sets the returned conference in the $scope.
+     * Fetches the conference and the user's profile in one conference.batch call,
+     * sets the returned conference in the $scope and whether the user is attending it.
      *
      */
     $scope.init = function () {
         $scope.loading = true;
-        gapi.client.conference.getConference({
-            websafeConferenceKey: $routeParams.websafeConferenceKey
+        gapi.client.conference.batch({
+            calls: [
+                {
+                    method: 'getConference',
+                    params: JSON.stringify({websafeConferenceKey: $routeParams.websafeConferenceKey})
+                },
+                {method: 'getProfile'}
+            ]
         }).execute(function (resp) {
             $scope.$apply(function () {
                 $scope.loading = false;
-                if (resp.error) {
+                var results = resp.error ? [resp, resp] : resp.result.results;
+                var conferenceResult = results[0], profileResult = results[1];
+                if (conferenceResult.error) {
                     // The request has failed.
-                    var errorMessage = resp.error.message || '';
+                    var errorMessage = conferenceResult.error.message || conferenceResult.error || '';
                     $scope.messages = 'Failed to get the conference : ' + $routeParams.websafeKey
                         + ' ' + errorMessage;
                     $scope.alertStatus = 'warning';
@@ -574,22 +585,17 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                 } else {
                     // The request has succeeded.
                     $scope.alertStatus = 'success';
-                    $scope.conference = resp.result;
+                    $scope.conference = JSON.parse(conferenceResult.body);
                 }
-            });
-        });
 
-        $scope.loading = true;
-        // If the user is attending the conference, updates the status message and available function.
-        gapi.client.conference.getProfile().execute(function (resp) {
-            $scope.$apply(function () {
-                $scope.loading = false;
-                if (resp.error) {
+                // If the user is attending the conference, updates the status message and available function.
+                if (profileResult.error) {
                     // Failed to get a user profile.
                 } else {
-                    var profile = resp.result;
-                    for (var i = 0; i < profile.conferenceKeysToAttend.length; i++) {
-                        if ($routeParams.websafeConferenceKey == profile.conferenceKeysToAttend[i]) {
+                    var profile = JSON.parse(profileResult.body);
+                    var conferenceKeysToAttend = profile.conferenceKeysToAttend || [];
+                    for (var i = 0; i < conferenceKeysToAttend.length; i++) {
+                        if ($routeParams.websafeConferenceKey == conferenceKeysToAttend[i]) {
                             // The user is attending the conference.
                             $scope.alertStatus = 'info';
                             $scope.messages = 'You are attending this conference';
@@ -624,21 +630,41 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                         return;
                     }
                 } else {
-                    if (resp.result) {
-                        // Register succeeded.
-                        $scope.messages = 'Registered for the conference';
-                        $scope.alertStatus = 'success';
-                        $scope.isUserAttending = true;
-                        $scope.conference.seatsAvailable = $scope.conference.seatsAvailable - 1;
-                    } else {
-                        $scope.messages = 'Failed to register for the conference';
-                        $scope.alertStatus = 'warning';
-                    }
+                    $scope.registrationSettled(resp.result);
                 }
             });
         });
     };
 
+    /**
+     * Shows the outcome of a registration; a queued one (high-demand
+     * conferences) is polled with conference.getRegistrationTicket.
+     */
+    $scope.registrationSettled = function (ticket) {
+        if (ticket.status == 'REGISTERED') {
+            $scope.messages = 'Registered for the conference';
+            $scope.alertStatus = 'success';
+            $scope.isUserAttending = true;
+            $scope.conference.seatsAvailable = $scope.conference.seatsAvailable - 1;
+        } else if (ticket.status == 'PENDING') {
+            $scope.messages = 'Registration queued, waiting for a seat...';
+            $scope.alertStatus = 'info';
+            setTimeout(function () {
+                gapi.client.conference.getRegistrationTicket({
+                    websafeConferenceKey: $routeParams.websafeConferenceKey
+                }).execute(function (resp) {
+                    $scope.$apply(function () {
+                        $scope.registrationSettled(resp.error ? {status: 'REJECTED',
+                            reason: resp.error.message} : resp.result);
+                    });
+                });
+            }, REGISTRATION_POLL_INTERVAL);
+        } else {
+            $scope.messages = 'Failed to register for the conference : ' + (ticket.reason || '');
+            $scope.alertStatus = 'warning';
+        }
+    };
+
     /**
      * Invokes the conference.unregisterForConference method.
      */
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+"""tasks.py
+
+Udacity conference server-side Python App Engine background logic
+    used by the cron jobs and task queue handlers in main.py
+
+Kept free of the Endpoints/protorpc stack so task and cron instances
+do not pay for it at import time; heavier modules are imported inside
+the functions that need them.
+
+"""
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+import lrucache
+import singleflight
+
+MEMCACHE_FEATURED_SPEAKER_KEY = "FEATURED_SPEAKER"
+MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
+MEMCACHE_CONFERENCE_PREFIX = "CONFERENCE:"
+MEMCACHE_RECOMMENDATIONS_PREFIX = "RECOMMENDATIONS:"
+MEMCACHE_SESSIONS_PREFIX = "CONFERENCE_SESSIONS:"
+MEMCACHE_TIMETABLE_GEN_PREFIX = "CONFERENCE_TIMETABLE_GEN:"
+# pages of the full speaker list keyed by start cursor, each well under
+# memcache's 1MB value limit
+SPEAKER_LIST = lrucache.TwoTierCache('speakerList', max_entries=100)
+SPEAKER_LIST_PAGE_SIZE = 200
+SPEAKER_SEARCH = lrucache.TwoTierCache('speakerSearch', max_entries=2000)
+ANNOUNCEMENT_TPL = ('Last chance to attend! The following conferences '
+                    'are nearly sold out: %s')
+ANNOUNCEMENT_TTL = 3600     # refreshed hourly by cron
+FEATURED_SPEAKER_TPL = '%s is our latest Featured Speaker'
+FEATURED_SPEAKER_TTL = 3600
+
+
+def buildAnnouncement():
+    """Return Announcement text for nearly sold out conferences, or ""."""
+    from models import Conference
+
+    confs = Conference.query(ndb.AND(
+        Conference.seatsAvailable <= 5,
+        Conference.seatsAvailable > 0)
+    ).fetch(projection=[Conference.name])
+
+    if confs:
+        return ANNOUNCEMENT_TPL % (
+            ', '.join(conf.name for conf in confs))
+    return ""
+
+
+def cacheAnnouncement():
+    """Create Announcement & assign to memcache; used by
+    memcache cron job & putAnnouncement().
+    """
+    announcement = buildAnnouncement()
+    singleflight.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement, ANNOUNCEMENT_TTL)
+    return announcement
+
+
+def getAnnouncement():
+    """Return Announcement from memcache, rebuilding it once on a miss."""
+    return singleflight.get(MEMCACHE_ANNOUNCEMENTS_KEY, buildAnnouncement,
+                            ANNOUNCEMENT_TTL)
+
+
+def sessionsChanged(wsck):
+    """Drop the cached session list and timetable of a conference."""
+    singleflight.delete(MEMCACHE_SESSIONS_PREFIX + wsck)
+    memcache.incr(MEMCACHE_TIMETABLE_GEN_PREFIX + wsck)
+
+
+def buildFeaturedSpeaker():
+    """Return Featured Speaker text from the datastore, or ""."""
+    from models import FeaturedSpeaker
+
+    featured = FeaturedSpeaker.get_by_id(FeaturedSpeaker.SINGLETON_ID)
+    if featured:
+        return FEATURED_SPEAKER_TPL % featured.speakerDisplayName
+    return ""
+
+
+def getFeaturedSpeaker():
+    """Return Featured Speaker from memcache, rebuilding it once on a miss."""
+    return singleflight.get(MEMCACHE_FEATURED_SPEAKER_KEY, buildFeaturedSpeaker,
+                            FEATURED_SPEAKER_TTL)
+
+
+def checkFeaturedSpeaker(speakerKey, speakerDisplayName):
+    """Set memcache entry if speaker has more than one session."""
+    from models import FeaturedSpeaker
+    import speakerindex
+
+    # the list is written with the session that enqueued this task
+    index = speakerindex.sessionsOf(ndb.Key(urlsafe=speakerKey))
+    if index and len(index.sessions) > 1:
+        FeaturedSpeaker(id=FeaturedSpeaker.SINGLETON_ID,
+                        speakerKey=speakerKey,
+                        speakerDisplayName=speakerDisplayName).put()
+        singleflight.set(MEMCACHE_FEATURED_SPEAKER_KEY,
+            FEATURED_SPEAKER_TPL % speakerDisplayName, FEATURED_SPEAKER_TTL)
+
+
+SIMILAR_CONFERENCES = 20           # kept per conference
+CO_ATTENDANCE_MAX_CONFERENCES = 50  # per profile, bounds the pairs counted
+TOPIC_WEIGHT = 2.0                  # score of one shared topic vs one co-attendee
+TOPIC_MAX_CONFERENCES = 200
+BATCH_SIZE = 500
+
+
+def computeRecommendations():
+    """Rebuild the ConferenceSimilarity table.
+
+    Two upcoming conferences are similar when the same users attend both
+    (Profile.conferenceKeysToAttend) and when they share topics. Scores
+    are summed over a full pass of Profiles and Conferences held in
+    memory, so this runs from cron, not from a user request.
+    """
+    import collections
+    import datetime
+    from models import Conference
+    from models import ConferenceSimilarity
+    from models import Profile
+
+    today = datetime.date.today()
+    upcoming = set()
+    byTopic = collections.defaultdict(list)
+    for conf in Conference.query().iter(batch_size=BATCH_SIZE):
+        if conf.deleted or (conf.startDate and conf.startDate < today):
+            continue
+        wsck = conf.key.urlsafe()
+        upcoming.add(wsck)
+        for topic in set(conf.topics):
+            byTopic[topic].append(wsck)
+
+    scores = collections.defaultdict(collections.Counter)
+    for confs in byTopic.values():
+        if len(confs) > TOPIC_MAX_CONFERENCES:
+            continue    # too common to say anything about similarity
+        for a in confs:
+            for b in confs:
+                if a != b:
+                    scores[a][b] += TOPIC_WEIGHT
+
+    for prof in Profile.query().iter(batch_size=BATCH_SIZE):
+        attended = [c_key.urlsafe() for c_key in
+                    prof.conferenceKeysToAttend[:CO_ATTENDANCE_MAX_CONFERENCES]]
+        for a in attended:
+            for b in attended:
+                if a != b and b in upcoming:
+                    scores[a][b] += 1
+
+    similarities = [
+        ConferenceSimilarity(id=wsck, similar=[
+            [other, score] for other, score in similar.most_common(SIMILAR_CONFERENCES)])
+        for wsck, similar in scores.items()]
+    for i in range(0, len(similarities), BATCH_SIZE):
+        ndb.put_multi(similarities[i:i + BATCH_SIZE])
+    return len(similarities)
+
+
+RESAVE_BATCH_SIZE = 50
+
+
+@ndb.transactional(xg=True)
+def _resave(key):
+    entity = key.get()
+    if entity is not None:
+        entity.put()
+        if key.kind() == 'Conference':
+            import topicindex
+            topicindex.sync(entity)
+        elif key.kind() == 'Session':
+            import speakerindex
+            speakerindex.record(entity)
+
+
+def resaveKind(kind, cursor=None):
+    """Re-put one batch of entities of kind so that computed and derived
+    properties, a Conference's topic index entities and a Session's entry
+    in its speaker's list are written for data stored before they
+    existed, then chain a task for the next batch. Return the number of
+    entities done.
+    """
+    from google.appengine.api import taskqueue
+    import models   # registers the model classes for _lookup_model
+
+    model = ndb.Model._lookup_model(kind)
+    start = ndb.Cursor(urlsafe=cursor) if cursor else None
+    keys, next_cursor, more = model.query().fetch_page(
+        RESAVE_BATCH_SIZE, keys_only=True, start_cursor=start)
+    for key in keys:
+        _resave(key)
+    if more and next_cursor:
+        taskqueue.add(url='/tasks/resave',
+                      params={'kind': kind, 'cursor': next_cursor.urlsafe()})
+    return len(keys)
+
+
+def sendConfirmationEmail(email, conferenceInfo):
+    """Send email confirming Conference creation."""
+    from google.appengine.api import app_identity
+    from google.appengine.api import mail
+
+    mail.send_mail(
+        'noreply@%s.appspotmail.com' % (
+            app_identity.get_application_id()),     # from
+        email,                                      # to
+        'You created a new Conference!',            # subj
+        'Hi, you have created a following '         # body
+        'conference:\r\n\r\n%s' % conferenceInfo
+    )
+
+
+def warmup():
+    """Load the modules the API needs so the first real request doesn't."""
+    import conference
+    return conference.api
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+"""runner.py
+
+Run the unit tests in tests/ against the App Engine SDK's local service
+stubs, with the SDK's bundled libraries (endpoints, protorpc, webapp2)
+on the path the way dev_appserver sets it up.
+
+usage: python tests/runner.py [--sdk PATH] [pattern]
+
+PATH defaults to $GAE_SDK, or to the SDK dev_appserver is importable
+from; pattern defaults to test_*.py.
+
+"""
+
+import argparse
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(TESTS_DIR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sdk', default=os.environ.get('GAE_SDK'))
+    parser.add_argument('pattern', nargs='?', default='test_*.py')
+    args = parser.parse_args()
+
+    if args.sdk:
+        sys.path.insert(0, args.sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, APP_DIR)
+
+    suite = unittest.TestLoader().discover(TESTS_DIR, args.pattern, APP_DIR)
+    result = unittest.TextTestRunner(verbosity=1).run(suite)
+    sys.exit(0 if result.wasSuccessful() else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import httplib
+import json
+
+from google.appengine.ext import ndb
+
+import profiler
+from models import BatchCallForm
+from models import BatchCallForms
+from models import Conference
+from models import Profile
+from tests import testutil
+
+
+class BatchTest(testutil.TestCase):
+
+    def setUp(self):
+        super(BatchTest, self).setUp()
+        p_key = ndb.Key(Profile, 'org')
+        self.wscks = [Conference(parent=p_key, organizerUserId='org', name=name).put().urlsafe()
+                      for name in ['A', 'B']]
+
+    def batch(self, *calls):
+        return self.api().batch(BatchCallForms(calls=[
+            BatchCallForm(method=method, params=json.dumps(params))
+            for method, params in calls])).results
+
+    def sessionsOf(self, wsck):
+        return ('getConferenceSessions', {'websafeConferenceKey': wsck})
+
+    def test_a_failing_call_does_not_stop_the_others(self):
+        results = self.batch(self.sessionsOf(self.wscks[0]),
+                             ('getConferenceSessions', {'websafeConferenceKey': 'garbage'}),
+                             ('noSuchMethod', {}),
+                             ('batch', {}),
+                             self.sessionsOf(self.wscks[1]))
+        self.assertEqual([r.status for r in results],
+                         [httplib.OK, httplib.NOT_FOUND, httplib.NOT_FOUND,
+                          httplib.NOT_FOUND, httplib.OK])
+        self.assertTrue(results[1].error)
+
+    def test_named_entities_are_fetched_in_one_get(self):
+        ndb.get_context().set_cache_policy(None)
+        rpcs = self.recordRpcs()
+        results = self.batch(*[self.sessionsOf(wsck) for wsck in self.wscks])
+        self.assertEqual([r.status for r in results], [httplib.OK, httplib.OK])
+        self.assertEqual(rpcs.count('Get'), 1)
+
+    def test_sampled_batch_profiles_its_calls(self):
+        profiler.enable('batch', 1.0, 60)
+        profiler.enable('getConferenceSessions', 1.0, 60)
+        profiler._config_loaded = 0
+        top, profiler.TOP_FUNCTIONS = profiler.TOP_FUNCTIONS, 100000
+        try:
+            self.batch(*[self.sessionsOf(wsck) for wsck in self.wscks])
+        finally:
+            profiler.TOP_FUNCTIONS = top
+            profiler.disable()
+            profiler._config_loaded = 0
+        summary = profiler.results('batch')
+        self.assertEqual(summary['samples'], 1)
+        self.assertTrue([f for f in summary['functions']
+                         if f['function'].endswith('(getConferenceSessions)')])
+        self.assertIsNone(profiler.results('getConferenceSessions'))
@@ -0,0 +1,93 @@
+import json
+from StringIO import StringIO
+
+from google.appengine.ext import ndb
+
+import bulk
+import speakerindex
+from models import Conference
+from models import ConferenceTopic
+from models import Session
+from models import Speaker
+from tests import testutil
+
+RECORDS = [
+    {'kind': 'Speaker', 'ref': 'ada', 'displayName': 'Ada'},
+    {'kind': 'Conference', 'ref': 'pycon', 'name': 'PyCon', 'organizerUserId': 'org',
+     'topics': ['Python'], 'startDate': '2016-03-09', 'maxAttendees': '10'},
+    {'kind': 'Session', 'conference': 'pycon', 'speaker': 'ada', 'name': 'Talk',
+     'date': '2016-03-09', 'startTime': '10:00', 'typeOfSession': 'LECTURE'},
+    {'kind': 'Session', 'conference': 'pycon', 'speaker': 'Grace', 'name': 'Workshop'},
+]
+
+
+def jsonl(records):
+    return StringIO(''.join(json.dumps(r) + '\n' for r in records))
+
+
+class ImportTest(testutil.TestCase):
+
+    def setUp(self):
+        super(ImportTest, self).setUp()
+        self.grace = Speaker(displayName='Grace').put()
+
+    def run_import(self, records, dry_run=False):
+        return bulk.Importer(dry_run).run(bulk.readRecords(jsonl(records)))
+
+    def test_refs_and_speaker_names_resolve(self):
+        summary = self.run_import(RECORDS)
+        self.assertEqual(summary['errors'], [])
+        self.assertEqual(summary['created'], {'Speaker': 1, 'Conference': 1, 'Session': 2})
+        conf = Conference.query().get()
+        self.assertEqual((conf.seatsAvailable, conf.month), (10, 3))
+        self.assertEqual(ConferenceTopic.query(ancestor=conf.key).count(), 1)
+        ada = Speaker.query(Speaker.displayName=='Ada').get(keys_only=True)
+        self.assertEqual(sorted((s.name, s.speakerKey) for s in Session.query(ancestor=conf.key)),
+                         [('Talk', ada), ('Workshop', self.grace)])
+        self.assertEqual(len(speakerindex.sessionsOf(ada).sessions), 1)
+        self.assertEqual(len(speakerindex.sessionsOf(self.grace).sessions), 1)
+
+    def test_refs_reach_across_chunks(self):
+        size, bulk.IMPORT_CHUNK_SIZE = bulk.IMPORT_CHUNK_SIZE, 1
+        try:
+            summary = self.run_import(RECORDS)
+        finally:
+            bulk.IMPORT_CHUNK_SIZE = size
+        self.assertEqual(summary['created'], {'Speaker': 1, 'Conference': 1, 'Session': 2})
+
+    def test_bad_records_are_reported_by_line(self):
+        summary = self.run_import([
+            {'kind': 'Conference', 'name': 'No organizer'},
+            {'kind': 'Session', 'conference': 'missing', 'name': 'Orphan'},
+            {'kind': 'Planet', 'name': 'Mars'},
+            {'kind': 'Speaker', 'displayName': 'Ok'}])
+        self.assertEqual(sorted(e['line'] for e in summary['errors']), [1, 2, 3])
+        self.assertEqual(summary['created']['Speaker'], 1)
+        stream = StringIO('{"kind": "Speaker"\n')
+        summary = bulk.Importer().run(bulk.readRecords(stream))
+        self.assertIn('invalid JSON', summary['errors'][0]['error'])
+
+    def test_dry_run_writes_nothing(self):
+        summary = self.run_import(RECORDS, dry_run=True)
+        self.assertEqual(summary['created'], {'Speaker': 1, 'Conference': 1, 'Session': 2})
+        self.assertEqual(Session.query().count() + Conference.query().count(), 0)
+
+    def test_csv_splits_topics(self):
+        stream = StringIO('kind,name,organizerUserId,topics\n'
+                          'Conference,PyCon,org,Python;Web\n')
+        bulk.Importer().run(bulk.readRecords(stream, 'csv'))
+        self.assertEqual(Conference.query().get().topics, ['Python', 'Web'])
+
+
+class ExportTest(testutil.TestCase):
+
+    def test_export_pages_through_every_entity(self):
+        size, bulk.EXPORT_BATCH_SIZE = bulk.EXPORT_BATCH_SIZE, 2
+        try:
+            ndb.put_multi([Speaker(displayName='S%d' % i) for i in range(5)])
+            records = [json.loads(line) for line in bulk.exportLines('Speaker')]
+        finally:
+            bulk.EXPORT_BATCH_SIZE = size
+        self.assertEqual(sorted(r['displayName'] for r in records),
+                         ['S%d' % i for i in range(5)])
+        self.assertEqual(ndb.Key(urlsafe=records[0]['websafeKey']).kind(), 'Speaker')
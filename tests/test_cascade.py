@@ -0,0 +1,81 @@
+from google.appengine.ext import ndb
+
+import cascade
+import speakerindex
+from conference import SESSIONS_BY_SPEAKER
+from models import Conference
+from models import ConferenceDeletion
+from models import Profile
+from models import Session
+from models import Speaker
+from tests import testutil
+
+
+class CascadeTest(testutil.TestCase):
+
+    def setUp(self):
+        super(CascadeTest, self).setUp()
+        p_key = ndb.Key(Profile, 'org')
+        self.speaker = Speaker(displayName='Ada').put()
+        self.confs = []
+        for name in ['Gone', 'Kept']:
+            conf = Conference(parent=p_key, organizerUserId='org', name=name,
+                              maxAttendees=10, seatsAvailable=10)
+            conf.put()
+            sessions = [Session(parent=conf.key, name='%s %d' % (name, i),
+                                speakerKey=self.speaker, speakerDisplayName='Ada')
+                        for i in range(2)]
+            ndb.put_multi(sessions)
+            speakerindex.recordMany(sessions)
+            self.confs.append(conf.key)
+        self.wsck = self.confs[0].urlsafe()
+
+    def listed(self):
+        index = speakerindex.sessionsOf(self.speaker)
+        return sorted(e['name'] for e in index.sessions)
+
+    def bySpeaker(self, speakerKey=None):
+        request = SESSIONS_BY_SPEAKER.combined_message_class(speakerKey=speakerKey)
+        return sorted(sf.name for sf in self.api().getSessionsBySpeaker(request).items)
+
+    def test_start_withdraws_sessions_from_speaker_lists(self):
+        self.assertTrue(cascade.start(self.confs[0]))
+        self.assertFalse(cascade.start(self.confs[0]))
+        self.assertEqual(self.listed(), ['Kept 0', 'Kept 1'])
+        self.assertEqual(len(self.tasks()), 1)
+
+    def test_too_many_speakers_leave_lists_to_readers(self):
+        limit, speakerindex.MAX_TXN_SPEAKERS = speakerindex.MAX_TXN_SPEAKERS, 0
+        try:
+            self.assertTrue(cascade.start(self.confs[0]))
+        finally:
+            speakerindex.MAX_TXN_SPEAKERS = limit
+        self.assertEqual(self.listed(), ['Gone 0', 'Gone 1', 'Kept 0', 'Kept 1'])
+        self.assertEqual(self.bySpeaker(self.speaker.urlsafe()), ['Kept 0', 'Kept 1'])
+        self.assertEqual(self.bySpeaker(), ['Kept 0', 'Kept 1'])
+
+    def test_retried_step_neither_counts_twice_nor_forks(self):
+        Profile(id='u1', mainEmail='u1', conferenceKeysToAttend=[self.confs[0]]).put()
+        cascade.start(self.confs[0])
+        cascade.runStep(self.wsck, 'attendees', 0)
+        cascade.runStep(self.wsck, 'attendees', 0)
+        deletion = ConferenceDeletion.get_by_id(self.wsck)
+        self.assertEqual((deletion.step, deletion.phase, deletion.profilesUpdated),
+                         (0, 'wishlists', 1))
+        self.assertEqual(len(self.tasks()), 2)
+
+    def test_cascade_runs_to_done(self):
+        cascade.start(self.confs[0])
+        done = set()
+        for _ in range(20):
+            task = [t for t in self.tasks() if t.name not in done][-1]
+            done.add(task.name)
+            params = task.extract_params()
+            cascade.runStep(params['websafeConferenceKey'], params['phase'],
+                            int(params['step']), params.get('cursor'), params.get('outer'))
+            if ConferenceDeletion.get_by_id(self.wsck).status == 'DONE':
+                break
+        self.assertEqual(ConferenceDeletion.get_by_id(self.wsck).status, 'DONE')
+        self.assertIsNone(self.confs[0].get())
+        self.assertEqual(Session.query(ancestor=self.confs[0]).count(), 0)
+        self.assertEqual(self.listed(), ['Kept 0', 'Kept 1'])
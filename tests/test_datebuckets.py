@@ -0,0 +1,68 @@
+import unittest
+from datetime import date
+from datetime import timedelta
+
+import datebuckets
+
+
+def covered(buckets):
+    """Return every day the buckets hold."""
+    days = set()
+    d = date(2015, 1, 1)
+    while d < date(2018, 1, 1):
+        if set(datebuckets.bucketsFor(d)) & set(buckets):
+            days.add(d)
+        d += timedelta(days=1)
+    return days
+
+
+def days(lo, hi):
+    return set(lo + timedelta(days=i) for i in range((hi - lo).days + 1))
+
+
+class CoverTest(unittest.TestCase):
+
+    def test_single_day(self):
+        self.assertEqual(datebuckets.cover(date(2016, 3, 9), date(2016, 3, 9), 30),
+                         (['d:2016-03-09'], True))
+
+    def test_whole_month_and_year_use_one_bucket(self):
+        self.assertEqual(datebuckets.cover(date(2016, 2, 1), date(2016, 2, 29), 30),
+                         (['m:2016-02'], True))
+        self.assertEqual(datebuckets.cover(date(2016, 1, 1), date(2016, 12, 31), 30),
+                         (['y:2016'], True))
+
+    def test_week_named_by_its_monday(self):
+        # 2016-01-04 is a Monday
+        self.assertEqual(datebuckets.cover(date(2016, 1, 4), date(2016, 1, 10), 30),
+                         (['w:2016-01-04'], True))
+
+    def test_exact_cover_holds_exactly_the_range(self):
+        for lo, hi in [(date(2016, 2, 27), date(2016, 3, 2)),       # leap day
+                       (date(2015, 12, 28), date(2016, 1, 3)),      # year boundary
+                       (date(2016, 1, 30), date(2016, 4, 2)),
+                       (date(2016, 12, 31), date(2017, 1, 1))]:
+            buckets, exact = datebuckets.cover(lo, hi, 30)
+            self.assertTrue(exact)
+            self.assertEqual(covered(buckets), days(lo, hi))
+
+    def test_widened_cover_holds_the_range_and_is_not_exact(self):
+        lo, hi = date(2016, 1, 15), date(2016, 11, 17)
+        buckets, exact = datebuckets.cover(lo, hi, 3)
+        self.assertFalse(exact)
+        self.assertLessEqual(len(buckets), 3)
+        self.assertTrue(days(lo, hi) <= covered(buckets))
+
+    def test_max_buckets_is_respected_at_every_level(self):
+        lo, hi = date(2015, 6, 3), date(2017, 8, 20)
+        for limit in range(3, 40):
+            buckets, exact = datebuckets.cover(lo, hi, limit)
+            self.assertLessEqual(len(buckets), limit)
+            self.assertTrue(days(lo, hi) <= covered(buckets))
+
+    def test_too_wide_for_whole_years(self):
+        self.assertEqual(datebuckets.cover(date(2010, 1, 1), date(2016, 1, 1), 3),
+                         (None, False))
+
+    def test_buckets_for_none(self):
+        self.assertEqual(datebuckets.bucketsFor(None), [])
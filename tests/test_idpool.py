@@ -0,0 +1,82 @@
+from google.appengine.ext import ndb
+
+import idpool
+from models import ConferenceForm
+from models import Session
+from models import SpeakerForm
+from tests import testutil
+
+
+class Thing(ndb.Model):
+    pass
+
+
+class IdPoolTest(testutil.TestCase):
+
+    def setUp(self):
+        super(IdPoolTest, self).setUp()
+        self.pool = idpool.IdPool(block_size=5, low_water=2)
+
+    def test_ids_are_unique_across_blocks(self):
+        keys = [self.pool.key(Thing) for _ in range(23)]
+        self.pool.wait()
+        self.assertEqual(len(set(keys)), 23)
+        self.assertTrue(all(key.parent() is None and key.id() for key in keys))
+        # ids handed out by the pool are never allocated again
+        first, last = Thing.allocate_ids(size=100)
+        self.assertFalse(set(k.id() for k in keys) & set(range(first, last + 1)))
+
+    def test_refill_lands_after_wait(self):
+        for _ in range(4):
+            self.pool.key(Thing)
+        self.pool.wait()
+        stats = self.pool.stats()
+        self.assertEqual(stats['syncAllocations'], 1)
+        self.assertEqual(stats['asyncRefills'], 1)
+        # two blocks, less the four ids taken
+        self.assertEqual(self.pool._pools['Thing'].remaining(), 2 * 5 - 4)
+
+    def test_hits_make_no_blocking_allocation(self):
+        self.pool.key(Thing)
+        self.pool.wait()
+        rpcs = self.recordRpcs()
+        self.pool.key(Thing)
+        self.assertEqual(rpcs, [])
+
+
+class CreateIdsTest(testutil.TestCase):
+    """No create path waits on an AllocateIds call of its own."""
+
+    def setUp(self):
+        super(CreateIdsTest, self).setUp()
+        self.login()
+
+    def test_create_conference_and_session(self):
+        api = self.api()
+        rpcs = self.recordRpcs()
+        api.createConference(ConferenceForm(name='PyCon', topics=['Python']))
+        # issued asynchronously, ahead of the transaction it overlaps
+        self.assertEqual(rpcs, ['AllocateIds', 'BeginTransaction', 'Put', 'Commit'])
+
+        from conference import SESSION_POST_REQUEST
+        from models import Conference
+        from models import ConferenceTopic
+        conf = Conference.query().get()
+        self.assertEqual(conf.key.parent().id(), 'user@example.com')
+        self.assertEqual(ConferenceTopic.query(ancestor=conf.key).count(), 1)
+        wsck = conf.key.urlsafe()
+        del rpcs[:]
+        api.createSession(SESSION_POST_REQUEST.combined_message_class(
+            websafeConferenceKey=wsck, name='Keynote'))
+        self.assertNotIn('AllocateIds', rpcs)
+        self.assertEqual(rpcs[-3:], ['BeginTransaction', 'Put', 'Commit'])
+        session = Session.query().get()
+        self.assertEqual(session.key.parent().urlsafe(), wsck)
+        self.assertTrue(session.key.id())
+
+    def test_add_speaker_hits_the_pool(self):
+        api = self.api()
+        api.addSpeaker(SpeakerForm(displayName='Ada'))
+        rpcs = self.recordRpcs()
+        api.addSpeaker(SpeakerForm(displayName='Grace'))
+        self.assertNotIn('AllocateIds', rpcs)
@@ -0,0 +1,81 @@
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+import conference
+import lrucache
+import tasks
+from conference import PAGE_REQUEST
+from models import Speaker
+from models import SpeakerForm
+from tests import testutil
+
+
+class TwoTierCacheTest(testutil.TestCase):
+
+    def setUp(self):
+        super(TwoTierCacheTest, self).setUp()
+        self.now = 1000.0
+        self.patchClock()
+        self.a = lrucache.TwoTierCache('test', ttl=60)
+        self.b = lrucache.TwoTierCache('test', ttl=60)     # another instance
+
+    def patchClock(self):
+        clock, lrucache.time.time = lrucache.time.time, lambda: self.now
+        self.addCleanup(setattr, lrucache.time, 'time', clock)
+
+    def test_loads_once_then_serves_both_tiers(self):
+        loads = []
+        load = lambda key: loads.append(key) or key.upper()
+        self.assertEqual(self.a.get('x', load), 'X')
+        self.assertEqual(self.a.get('x', load), 'X')
+        self.assertEqual(self.b.get('x', load), 'X')
+        self.assertEqual(loads, ['x'])
+        self.assertEqual(self.b.stats()['memcache_hits'], 1)
+
+    def test_invalidate_reaches_other_instances_within_the_check_interval(self):
+        self.a.set('x', 1)
+        self.assertEqual(self.b.get('x'), 1)
+        self.a.invalidate()
+        self.a.set('x', 2)
+        self.assertEqual(self.b.get('x'), 1)    # stale until b rechecks
+        self.now += lrucache.GENERATION_CHECK_INTERVAL + 1
+        self.assertEqual(self.b.get('x'), 2)
+
+    def test_local_entries_expire_after_ttl(self):
+        self.a.set('x', 1)
+        memcache.flush_all()
+        self.now += 61
+        self.assertIsNone(self.a.get('x'))
+
+    def test_values_too_big_for_memcache_stay_local(self):
+        big = 'x' * memcache.MAX_VALUE_SIZE
+        self.a.set('big', big)
+        self.assertTrue(self.a.get('big') == big)
+        self.assertIsNone(self.b.get('big'))
+
+
+class SpeakerListTest(testutil.TestCase):
+
+    def setUp(self):
+        super(SpeakerListTest, self).setUp()
+        size, conference.SPEAKER_LIST_PAGE_SIZE = conference.SPEAKER_LIST_PAGE_SIZE, 2
+        self.addCleanup(setattr, conference, 'SPEAKER_LIST_PAGE_SIZE', size)
+        ndb.put_multi([Speaker(displayName='S%d' % i) for i in range(5)])
+
+    def speakers(self):
+        forms = self.api().getSpeakers(PAGE_REQUEST.combined_message_class())
+        self.assertIsNone(forms.nextPageToken)
+        return sorted(sp.displayName for sp in forms.items)
+
+    def test_list_is_cached_in_pages(self):
+        self.assertEqual(len(self.speakers()), 5)
+        rpcs = self.recordRpcs()
+        self.assertEqual(len(self.speakers()), 5)
+        self.assertEqual(rpcs, [])
+        self.assertEqual(len(tasks.SPEAKER_LIST._entries), 3)
+
+    def test_new_speaker_invalidates_the_pages(self):
+        self.speakers()
+        self.login()
+        self.api().addSpeaker(SpeakerForm(displayName='S5'))
+        self.assertEqual(self.speakers(), ['S%d' % i for i in range(6)])
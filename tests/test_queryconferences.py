@@ -0,0 +1,67 @@
+from datetime import date
+
+import endpoints
+
+from google.appengine.ext import ndb
+
+import topicindex
+from models import Conference
+from models import ConferenceQueryForm
+from models import ConferenceQueryForms
+from models import Profile
+from tests import testutil
+
+
+def query(*filters):
+    return ConferenceQueryForms(filters=[
+        ConferenceQueryForm(field=field, operator=op, value=value)
+        for field, op, value in filters])
+
+
+class QueryConferencesTest(testutil.TestCase):
+
+    def setUp(self):
+        super(QueryConferencesTest, self).setUp()
+        for name, city, start, end, seats in [
+                ('A', 'London', date(2016, 3, 1), date(2016, 3, 3), 10),
+                ('B', 'London', date(2016, 3, 20), date(2016, 4, 2), 0),
+                ('C', 'Paris', date(2016, 3, 10), date(2016, 3, 11), 5),
+                ('D', 'London', date(2016, 5, 1), date(2016, 5, 2), 5)]:
+            conf = Conference(parent=ndb.Key(Profile, 'org'), organizerUserId='org',
+                              name=name, city=city, startDate=start, endDate=end,
+                              seatsAvailable=seats, maxAttendees=10, topics=['Python'])
+            conf.put()
+            ndb.put_multi(topicindex.entitiesFor(conf))
+
+    def names(self, *filters):
+        return [c.name for c in self.api().queryConferences(query(*filters)).items]
+
+    def test_closed_start_range_with_city_and_seats(self):
+        self.assertEqual(self.names(('START_DATE', 'GTEQ', '2016-03-01'),
+                                    ('START_DATE', 'LTEQ', '2016-03-31'),
+                                    ('CITY', 'EQ', 'London'),
+                                    ('SEATS_AVAILABLE', 'GT', '0')), ['A'])
+
+    def test_both_ranges_use_one_bucket_list(self):
+        filters = (('START_DATE', 'GTEQ', '2016-03-01'), ('START_DATE', 'LTEQ', '2016-03-31'),
+                   ('END_DATE', 'GTEQ', '2016-03-05'), ('END_DATE', 'LTEQ', '2016-04-30'))
+        q, trim, residual = self.api()._getQuery(query(*filters))
+        self.assertIn('startBuckets', str(q))
+        self.assertNotIn('endBuckets', str(q))
+        self.assertEqual(trim, {'endDate': [date(2016, 3, 5), date(2016, 4, 30)]})
+        self.assertEqual(self.names(*filters), ['B', 'C'])
+
+    def test_open_ended_and_equality_dates(self):
+        self.assertEqual(self.names(('START_DATE', 'GT', '2016-03-10')), ['B', 'D'])
+        self.assertEqual(self.names(('START_DATE', 'EQ', '2016-03-10')), ['C'])
+
+    def test_unindexed_combinations_are_rejected(self):
+        for filters in [(('START_DATE', 'GT', '2016-03-10'), ('MAX_ATTENDEES', 'EQ', '10')),
+                        (('SEATS_AVAILABLE', 'GT', '0'), ('MONTH', 'EQ', '3')),
+                        (('START_DATE', 'GT', '2016-03-10'), ('END_DATE', 'LT', '2016-06-01'))]:
+            self.assertRaises(endpoints.BadRequestException, self.names, *filters)
+
+    def test_topic_with_date_range(self):
+        self.assertEqual(self.names(('TOPIC', 'EQ', 'Python'),
+                                    ('START_DATE', 'GTEQ', '2016-03-05'),
+                                    ('START_DATE', 'LTEQ', '2016-03-31')), ['B', 'C'])
@@ -0,0 +1,54 @@
+from google.appengine.api import memcache
+
+import ratelimit
+from tests import testutil
+
+LIMIT, PERIOD = ratelimit.RATE_LIMITS['registration']
+
+
+class RateLimitTest(testutil.TestCase):
+
+    def drain(self, now):
+        return sum(ratelimit.consume('registration', 'u1', now)
+                   for _ in range(LIMIT * 3))
+
+    def test_bucket_holds_limit_tokens(self):
+        self.assertEqual(self.drain(1000.0), LIMIT)
+        self.assertFalse(ratelimit.consume('registration', 'u1', 1000.0))
+
+    def test_users_have_separate_buckets(self):
+        self.drain(1000.0)
+        self.assertTrue(ratelimit.consume('registration', 'u2', 1000.0))
+
+    def test_no_double_limit_across_a_boundary(self):
+        # a fixed window would allow LIMIT more just past the boundary
+        self.drain(PERIOD - 0.5)
+        self.assertEqual(self.drain(PERIOD + 0.5), 0)
+
+    def test_refills_at_limit_per_period(self):
+        self.drain(1000.0)
+        self.assertEqual(self.drain(1000.0 + PERIOD / 2.0), LIMIT // 2)
+        self.assertEqual(self.drain(1000.0 + PERIOD * 10), LIMIT)
+
+    def test_retry_after(self):
+        self.assertEqual(ratelimit.retryAfter('registration', 'u1', 1000.0), 0)
+        self.drain(1000.0)
+        wait = ratelimit.retryAfter('registration', 'u1', 1000.0)
+        self.assertEqual(wait, int(PERIOD / LIMIT) + 1)
+        self.assertTrue(ratelimit.consume('registration', 'u1', 1000.0 + wait))
+
+    def test_unknown_bucket_is_not_limited(self):
+        self.assertTrue(all(ratelimit.consume('other', 'u1', 0) for _ in range(100)))
+
+    def test_fails_open_without_memcache(self):
+        # the memcache API answers None/False when the service is down
+        class DownClient(object):
+            def gets(self, key):
+                return None
+            def add(self, key, value, time=0):
+                return False
+        client, memcache.Client = memcache.Client, DownClient
+        try:
+            self.assertEqual(self.drain(1000.0), LIMIT * 3)
+        finally:
+            memcache.Client = client
@@ -0,0 +1,119 @@
+import time
+from datetime import datetime
+from datetime import timedelta
+
+from google.appengine.ext import ndb
+
+import regqueue
+from models import Conference
+from models import Profile
+from models import RegistrationTicket
+from tests import testutil
+
+
+class RegQueueTest(testutil.TestCase):
+
+    def setUp(self):
+        super(RegQueueTest, self).setUp()
+        self.conf = Conference(name='Flash', maxAttendees=2, seatsAvailable=2,
+                               highDemand=True)
+        self.conf.put()
+        self.wsck = self.conf.key.urlsafe()
+        for user_id in ('a', 'b', 'c'):
+            Profile(id=user_id, mainEmail=user_id).put()
+
+    def ticket(self, user_id):
+        return RegistrationTicket.keyFor(self.wsck, user_id).get(use_cache=False)
+
+    def test_enqueue_is_pending_and_schedules_one_drain(self):
+        first = regqueue.enqueue(self.wsck, 'a')
+        regqueue.enqueue(self.wsck, 'b')
+        self.assertEqual(first.status, regqueue.PENDING)
+        self.assertLessEqual(len(self.tasks()), 2)   # one per DRAIN_WINDOW slot
+        # a pending ticket is returned as is
+        self.assertEqual(regqueue.enqueue(self.wsck, 'a').created, first.created)
+
+    def test_drain_registers_while_seats_last(self):
+        for user_id in ('a', 'b', 'c'):
+            regqueue.enqueue(self.wsck, user_id)
+        self.assertEqual(regqueue.drain(self.wsck), 3)
+        self.assertEqual([self.ticket(u).status for u in ('a', 'b', 'c')],
+                         [regqueue.REGISTERED, regqueue.REGISTERED, regqueue.REJECTED])
+        self.assertIn('no seats', self.ticket('c').reason)
+        self.assertEqual(self.conf.key.get().seatsAvailable, 0)
+        self.assertIn(self.conf.key, Profile.get_by_id('a').conferenceKeysToAttend)
+        self.assertEqual(regqueue.drain(self.wsck), 0)
+
+    def test_reapplying_a_ticket_does_not_take_a_second_seat(self):
+        ticket = regqueue.enqueue(self.wsck, 'a')
+        regqueue.drain(self.wsck)
+        # the status write after the batch was lost
+        ticket.status = regqueue.PENDING
+        ticket.put()
+        regqueue.drain(self.wsck)
+        self.assertEqual(self.ticket('a').status, regqueue.REGISTERED)
+        self.assertEqual(self.conf.key.get().seatsAvailable, 1)
+
+    def test_missing_profile_and_deleted_conference_are_rejected(self):
+        regqueue.enqueue(self.wsck, 'nobody')
+        regqueue.drain(self.wsck)
+        self.assertEqual(self.ticket('nobody').reason, 'Profile not found')
+
+        regqueue.enqueue(self.wsck, 'a')
+        self.conf.deleted = True
+        self.conf.put()
+        regqueue.drain(self.wsck)
+        self.assertEqual((self.ticket('a').status, self.ticket('a').reason),
+                         (regqueue.REJECTED, 'Conference not found'))
+
+    def test_rejected_ticket_can_be_requeued(self):
+        self.conf.seatsAvailable = 0
+        self.conf.put()
+        regqueue.enqueue(self.wsck, 'a')
+        regqueue.drain(self.wsck)
+        self.assertEqual(self.ticket('a').status, regqueue.REJECTED)
+        self.assertEqual(regqueue.enqueue(self.wsck, 'a').status, regqueue.PENDING)
+
+    def test_polling_a_stale_ticket_reschedules_the_drain(self):
+        ticket = regqueue.enqueue(self.wsck, 'a')
+        ticket.created = datetime.utcnow() - timedelta(seconds=regqueue.STALE_TICKET + 1)
+        ticket.put()
+        before = len(self.tasks())
+        regqueue.scheduleDrain(self.wsck, now=time.time() + 60)   # later slot
+        self.assertEqual(regqueue.getTicket(self.wsck, 'a').status, regqueue.PENDING)
+        self.assertGreater(len(self.tasks()), before)
+
+
+class RegisterEndpointTest(testutil.TestCase):
+
+    def setUp(self):
+        super(RegisterEndpointTest, self).setUp()
+        self.login('a@example.com')
+        self.conf = Conference(name='Flash', maxAttendees=5, seatsAvailable=5,
+                               highDemand=True)
+        self.conf.put()
+
+    def register(self):
+        from conference import CONF_GET_REQUEST
+        return self.api().registerForConference(CONF_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=self.conf.key.urlsafe()))
+
+    def test_high_demand_returns_the_pending_ticket_at_once(self):
+        start = time.time()
+        form = self.register()
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(form.status, regqueue.PENDING)
+        self.assertEqual(ndb.Key(urlsafe=form.websafeKey),
+                         RegistrationTicket.keyFor(self.conf.key.urlsafe(), 'a@example.com'))
+
+        regqueue.drain(self.conf.key.urlsafe())
+        from conference import CONF_GET_REQUEST
+        polled = self.api().getRegistrationTicket(CONF_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=self.conf.key.urlsafe()))
+        self.assertEqual(polled.status, regqueue.REGISTERED)
+
+    def test_direct_registration_reports_registered(self):
+        self.conf.highDemand = False
+        self.conf.put()
+        self.assertEqual(self.register().status, regqueue.REGISTERED)
+        self.assertEqual(self.conf.key.get().seatsAvailable, 4)
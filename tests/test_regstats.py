@@ -0,0 +1,75 @@
+from datetime import datetime
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+import regstats
+from models import RegistrationCounter
+from tests import testutil
+
+WSCK = 'conference-key'
+
+
+class RegStatsTest(testutil.TestCase):
+
+    def record(self, registered, count=1):
+        ndb.transaction(lambda: regstats.record(WSCK, registered, count))
+
+    def counter(self, granularity='hour'):
+        start = regstats.bucketStart(datetime.utcnow(), granularity)
+        return RegistrationCounter.keyFor(WSCK, granularity, start).get()
+
+    def test_flush_counts_events_per_bucket(self):
+        self.record(True)
+        self.record(True, count=3)
+        self.record(False)
+        self.assertEqual(regstats.flush(), 3)
+        for granularity in regstats.GRANULARITIES:
+            counter = self.counter(granularity)
+            self.assertEqual((counter.registrations, counter.unregistrations), (4, 1))
+        self.assertEqual(regstats.flush(), 0)
+
+    def test_events_of_a_failed_flush_are_not_counted_twice(self):
+        self.record(True)
+        self.record(True)
+        queue = taskqueue.Queue(regstats.QUEUE_NAME)
+        delete_tasks = queue.__class__.delete_tasks
+        leased = []
+
+        def fail(self, tasks):
+            leased.extend(tasks)
+            raise taskqueue.TransientError()
+        queue.__class__.delete_tasks = fail
+        try:
+            self.assertRaises(taskqueue.TransientError, regstats.flush)
+        finally:
+            queue.__class__.delete_tasks = delete_tasks
+        self.assertEqual(self.counter().registrations, 2)
+
+        # the lease runs out and the same tasks are flushed again
+        for task in leased:
+            queue.modify_task_lease(task, 0)
+        self.record(True)
+        self.assertEqual(regstats.flush(), 3)
+        self.assertEqual(self.counter().registrations, 3)
+        self.assertEqual(self.counter('day').registrations, 3)
+
+    def test_applied_tasks_are_forgotten_after_retention(self):
+        regstats._addToCounter(WSCK, 'hour', datetime(2026, 1, 1), [('t1', True, 1)], now=1000)
+        regstats._addToCounter(WSCK, 'hour', datetime(2026, 1, 1), [('t1', True, 1)], now=1001)
+        counter = RegistrationCounter.keyFor(WSCK, 'hour', datetime(2026, 1, 1)).get()
+        self.assertEqual(counter.registrations, 1)
+        regstats._addToCounter(WSCK, 'hour', datetime(2026, 1, 1), [('t2', True, 1)],
+                               now=1001 + regstats.APPLIED_RETENTION)
+        counter = counter.key.get()
+        self.assertEqual(counter.registrations, 2)
+        self.assertEqual(counter.appliedTasks.keys(), ['t2'])
+
+    def test_project_sell_out(self):
+        now = datetime(2026, 1, 10)
+        hourly = [RegistrationCounter(start=datetime(2026, 1, 9), registrations=72,
+                                      unregistrations=0)]
+        self.assertEqual(regstats.projectSellOut(hourly, 1, now),
+                         datetime(2026, 1, 10, 1))
+        self.assertIsNone(regstats.projectSellOut([], 10, now))
+        self.assertEqual(regstats.projectSellOut([], 0, now), now)
@@ -0,0 +1,76 @@
+import time
+
+from google.appengine.api import memcache
+
+import singleflight
+from tests import testutil
+
+
+class SingleflightTest(testutil.TestCase):
+
+    def setUp(self):
+        super(SingleflightTest, self).setUp()
+        self.computed = 0
+
+    def compute(self):
+        self.computed += 1
+        return 'value %d' % self.computed
+
+    def test_miss_computes_and_caches(self):
+        self.assertEqual(singleflight.get('k', self.compute, 60), 'value 1')
+        self.assertEqual(singleflight.get('k', self.compute, 60), 'value 1')
+        self.assertEqual(self.computed, 1)
+        self.assertEqual(singleflight.stats()['compute'], 1)
+
+    def test_legacy_bare_value_is_a_miss(self):
+        # written by the code before coalescing, with no TTL
+        memcache.set('FEATURED_SPEAKER', 'Ada is our latest Featured Speaker')
+        self.assertEqual(singleflight.get('FEATURED_SPEAKER', self.compute, 60), 'value 1')
+        self.assertEqual(singleflight.get('FEATURED_SPEAKER', self.compute, 60), 'value 1')
+        self.assertEqual(self.computed, 1)
+
+    def test_legacy_dict_value_is_a_miss(self):
+        memcache.set('k', {'expires': 'not an entry'})
+        self.assertEqual(singleflight.get('k', self.compute, 60), 'value 1')
+
+    def test_expire_drops_legacy_value(self):
+        memcache.set('k', 'legacy')
+        singleflight.expire('k')
+        self.assertIsNone(memcache.get('k'))
+
+    def test_stale_value_served_while_another_caller_recomputes(self):
+        singleflight.set('k', 'old', 60)
+        singleflight.expire('k')
+        memcache.add('k' + singleflight.LEASE_SUFFIX, 1)
+        self.assertEqual(singleflight.get('k', self.compute, 60), 'old')
+        self.assertEqual(self.computed, 0)
+        self.assertEqual(singleflight.stats()['stale'], 1)
+
+    def test_stale_value_recomputed_by_lease_holder(self):
+        singleflight.set('k', 'old', 60)
+        singleflight.expire('k')
+        self.assertEqual(singleflight.get('k', self.compute, 60), 'value 1')
+        self.assertEqual(singleflight.get('k', self.compute, 60), 'value 1')
+        self.assertIsNone(memcache.get('k' + singleflight.LEASE_SUFFIX))
+
+    def test_soft_expiry(self):
+        singleflight.set('k', 'old', 60)
+        entry = memcache.get('k')
+        self.assertTrue(entry['expires'] > time.time())
+        entry['expires'] = time.time() - 1
+        memcache.set('k', entry)
+        self.assertEqual(singleflight.get('k', self.compute, 60), 'value 1')
+
+    def test_no_ttl_never_goes_stale(self):
+        singleflight.set('k', 'forever')
+        self.assertEqual(singleflight.get('k', self.compute), 'forever')
+        self.assertEqual(self.computed, 0)
+
+    def test_waiter_falls_back_when_no_value_arrives(self):
+        memcache.add('k' + singleflight.LEASE_SUFFIX, 1)
+        wait, singleflight.WAIT_TIME = singleflight.WAIT_TIME, 0.1
+        try:
+            self.assertEqual(singleflight.get('k', self.compute, 60), 'value 1')
+        finally:
+            singleflight.WAIT_TIME = wait
+        self.assertEqual(singleflight.stats()['fallback'], 1)
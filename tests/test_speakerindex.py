@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from google.appengine.ext import ndb
+
+import speakerindex
+from models import Conference
+from models import Profile
+from models import Session
+from models import Speaker
+from models import SpeakerSessions
+from tests import testutil
+
+
+class SpeakerIndexTest(testutil.TestCase):
+
+    def setUp(self):
+        super(SpeakerIndexTest, self).setUp()
+        self.speaker = Speaker(displayName='Ada').put()
+        self.conf = Conference(parent=ndb.Key(Profile, 'org'), name='Conf').put()
+
+    def session(self, name, hour, speaker=None):
+        session = Session(parent=self.conf, name=name, speakerKey=speaker or self.speaker,
+                          speakerDisplayName='Ada', startDateTime=datetime(2016, 3, 1, hour))
+        session.put()
+        return session
+
+    def listed(self):
+        return [e['name'] for e in speakerindex.sessionsOf(self.speaker).sessions]
+
+    def test_record_keeps_start_order_and_replaces_a_changed_session(self):
+        late = self.session('late', 15)
+        speakerindex.recordMany([late, self.session('early', 9)])
+        late.name = 'later'
+        late.startDateTime = datetime(2016, 3, 1, 17)
+        ndb.transaction(lambda: speakerindex.record(late))
+        self.assertEqual(self.listed(), ['early', 'later'])
+
+    def test_forget_and_withdraw(self):
+        sessions = [self.session('a', 9), self.session('b', 10)]
+        speakerindex.recordMany(sessions)
+        speakerindex.forget(sessions[:1])
+        self.assertEqual(self.listed(), ['b'])
+        self.assertTrue(ndb.transaction(lambda: speakerindex.withdraw(sessions[1:])))
+        self.assertEqual(self.listed(), [])
+
+    def test_withdraw_refuses_too_many_speakers(self):
+        speakers = [Speaker(displayName='S%d' % i).put()
+                    for i in range(speakerindex.MAX_TXN_SPEAKERS + 1)]
+        sessions = [self.session('s', 9, sp_key) for sp_key in speakers]
+        self.assertFalse(speakerindex.withdraw(sessions))
+        self.assertEqual(SpeakerSessions.query().count(), 0)
+
+    def test_rebuild_recomputes_lists(self):
+        self.session('a', 9)
+        speakerindex.recordMany([self.session('b', 10)])
+        self.assertEqual(speakerindex.rebuild(), 1)
+        self.assertEqual(self.listed(), ['a', 'b'])
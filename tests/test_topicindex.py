@@ -0,0 +1,49 @@
+from datetime import date
+
+from google.appengine.ext import ndb
+
+import topicindex
+from models import Conference
+from models import ConferenceTopic
+from models import Profile
+from tests import testutil
+
+
+class TopicIndexTest(testutil.TestCase):
+
+    def conference(self, name, topics, city='London'):
+        conf = Conference(parent=ndb.Key(Profile, 'org'), name=name, city=city,
+                          topics=topics, startDate=date(2016, 3, 9), month=3)
+        conf.put()
+        ndb.put_multi(topicindex.entitiesFor(conf))
+        return conf
+
+    def topics(self, conf):
+        return sorted(t.topic for t in ConferenceTopic.query(ancestor=conf.key))
+
+    def test_one_entity_per_topic_carrying_the_fields(self):
+        conf = self.conference('A', ['Web', 'Python', 'Web', ''])
+        entities = ConferenceTopic.query(ancestor=conf.key).fetch()
+        self.assertEqual(sorted(t.topic for t in entities), ['Python', 'Web'])
+        for entity in entities:
+            self.assertEqual((entity.name, entity.city, entity.month), ('A', 'London', 3))
+            self.assertIn('d:2016-03-09', entity.startBuckets)
+
+    def test_sync_replaces_dropped_topics(self):
+        conf = self.conference('A', ['Web', 'Python'])
+        conf.topics = ['Python', 'Go']
+        conf.city = 'Paris'
+        ndb.transaction(lambda: topicindex.sync(conf))
+        self.assertEqual(self.topics(conf), ['Go', 'Python'])
+        self.assertEqual(set(t.city for t in ConferenceTopic.query(ancestor=conf.key)),
+                         set(['Paris']))
+
+    def test_fetch_conferences_once_each_in_query_order(self):
+        a = self.conference('A', ['Python', 'Web'])
+        b = self.conference('B', ['Web'])
+        self.conference('C', ['Go'])
+        q = ConferenceTopic.query(ConferenceTopic.topic.IN(['Python', 'Web'])) \
+            .order(ConferenceTopic.name)
+        self.assertEqual([c.key for c in topicindex.fetchConferences(q)], [a.key, b.key])
+        b.key.delete()
+        self.assertEqual([c.key for c in topicindex.fetchConferences(q)], [a.key])
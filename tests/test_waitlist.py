@@ -0,0 +1,48 @@
+from google.appengine.ext import ndb
+
+import waitlist
+from models import Conference
+from models import Profile
+from models import WaitlistEntry
+from tests import testutil
+
+
+class WaitlistTest(testutil.TestCase):
+
+    def setUp(self):
+        super(WaitlistTest, self).setUp()
+        self.conf = Conference(parent=ndb.Key(Profile, 'org'), organizerUserId='org',
+                               name='Conf', maxAttendees=10, seatsAvailable=2)
+        self.conf.put()
+        self.wsck = self.conf.key.urlsafe()
+        for user_id in ['u1', 'u2', 'u3']:
+            Profile(key=ndb.Key(Profile, user_id), mainEmail=user_id).put()
+            self.assertTrue(waitlist.join(self.wsck, user_id))
+
+    def waiting(self):
+        return sorted(e.userId for e in WaitlistEntry.query())
+
+    def test_join_twice_and_leave(self):
+        self.assertFalse(waitlist.join(self.wsck, 'u1'))
+        self.assertTrue(waitlist.leave(self.wsck, 'u1'))
+        self.assertFalse(waitlist.leave(self.wsck, 'u1'))
+
+    def test_promote_oldest_first_until_full(self):
+        self.assertEqual(waitlist.promote(self.wsck), ['u1', 'u2'])
+        self.assertEqual(self.conf.key.get().seatsAvailable, 0)
+        self.assertEqual(ndb.Key(Profile, 'u1').get().conferenceKeysToAttend, [self.conf.key])
+        self.assertEqual(self.waiting(), ['u3'])
+
+    def test_deleted_conference_promotes_nobody(self):
+        self.conf.deleted = True
+        self.conf.put()
+        self.assertEqual(waitlist.promote(self.wsck), [])
+        self.assertEqual(self.conf.key.get().seatsAvailable, 2)
+        self.assertEqual(ndb.Key(Profile, 'u1').get().conferenceKeysToAttend, [])
+        self.assertEqual(self.waiting(), ['u1', 'u2', 'u3'])
+
+    def test_one_task_per_window(self):
+        waitlist.schedulePromotion(self.wsck, now=100)
+        waitlist.schedulePromotion(self.wsck, now=105)
+        waitlist.schedulePromotion(self.wsck, now=110)
+        self.assertEqual(len(self.tasks()), 2)
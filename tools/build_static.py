@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+"""build_static.py
+
+Bundle the app's own scripts, partials and stylesheets for deployment.
+
+app.js and controllers.js are minified into one script, followed by a
+run block that puts every partial into Angular's $templateCache under
+the templateUrl the routes and modals ask for, so no partial is fetched
+on first load. The local stylesheets are concatenated into one file,
+keeping only rules whose class and id selectors appear in the
+templates, partials or scripts, or in KEEP_CLASSES and KEEP_PREFIXES
+(which bootstrap.js and ui-bootstrap add at run time), and minified.
+Both are written to static/build with a content hash in the name, which
+app.yaml serves with a far-future expiry, and templates/index.html is
+rewritten between its build markers to load them. The last KEEP_BUILDS builds are
+kept so a page cached before a deploy can still load its bundle.
+
+Run it before every deploy and commit the result.
+
+usage: python tools/build_static.py [--check]
+
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(APP_DIR, 'static')
+BUILD_DIR = os.path.join(STATIC_DIR, 'build')
+INDEX = os.path.join(APP_DIR, 'templates', 'index.html')
+
+JS_SOURCES = ['js/app.js', 'js/controllers.js']
+CSS_SOURCES = ['bootstrap/css/bootstrap-cosmo.css', 'bootstrap/css/main.css',
+               'bootstrap/css/offcanvas.css']
+PARTIALS = 'partials/*.html'
+MODULE = 'conferenceApp'
+KEEP_BUILDS = 3
+
+# classes added by bootstrap.js, ui-bootstrap templates and Angular itself
+KEEP_CLASSES = ('active', 'caret', 'close', 'collapse', 'collapsing',
+                'disabled', 'fade', 'in', 'open')
+KEEP_PREFIXES = ('alert', 'btn', 'dropdown', 'has-', 'modal', 'ng-',
+                 'pagination', 'popover', 'tooltip')
+
+BUILD_MARKER = re.compile(
+    r'(<!-- build:(css|js) -->\n)(.*?)(^[ \t]*<!-- endbuild -->)', re.S | re.M)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read().decode('utf-8')
+
+
+def write(path, text):
+    with open(path, 'wb') as f:
+        f.write(text.encode('utf-8'))
+
+
+# - - - scripts - - - - - - - - - - - - - - - - - - - -
+
+def minifyJs(source):
+    """Drop comments and indentation, keeping line breaks so that
+    automatic semicolon insertion still sees the same statements.
+    Strings are copied untouched; the sources have no regex literals.
+    """
+    out = []
+    i, n = 0, len(source)
+    while i < n:
+        c = source[i]
+        if c in '"\'':
+            j = i + 1
+            while source[j] != c:
+                j += 2 if source[j] == '\\' else 1
+            out.append(source[i:j + 1])
+            i = j + 1
+        elif source.startswith('//', i):
+            i = source.find('\n', i)
+            i = n if i < 0 else i
+        elif source.startswith('/*', i):
+            i = source.index('*/', i) + 2
+        else:
+            out.append(c)
+            i += 1
+    lines = (line.strip() for line in ''.join(out).split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+
+def templateCache(partials):
+    """Return a run block putting {url: html} into $templateCache."""
+    puts = ''.join('$templateCache.put(%s,%s);\n' % (json.dumps(url), json.dumps(html))
+                   for url, html in sorted(partials.items()))
+    return ("angular.module('%s').run(['$templateCache',function($templateCache){\n"
+            "%s}]);" % (MODULE, puts))
+
+
+def minifyHtml(html):
+    lines = (line.strip() for line in html.split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+
+# - - - stylesheets - - - - - - - - - - - - - - - - - - - -
+
+def usedNames(texts):
+    """Return (names, prefixes) of classes and ids the markup may use;
+    prefixes come from interpolated classes such as alert-{{status}}.
+    """
+    names, prefixes = set(KEEP_CLASSES), set()
+    for text in texts:
+        names.update(re.findall(r'[\w-]+', text))
+        prefixes.update(re.findall(r'([\w-]+-)\{\{', text))
+    return names, tuple(prefixes) + KEEP_PREFIXES
+
+
+def _blocks(css):
+    """Yield (prelude, body) for each top-level rule; body is None for
+    statements such as @import.
+    """
+    i, n = 0, len(css)
+    while i < n:
+        brace, semi = css.find('{', i), css.find(';', i)
+        if brace < 0 and semi < 0:
+            return
+        if semi >= 0 and (brace < 0 or semi < brace):
+            yield css[i:semi].strip(), None
+            i = semi + 1
+            continue
+        depth, j = 1, brace + 1
+        while depth:
+            depth += {'{': 1, '}': -1}.get(css[j], 0)
+            j += 1
+        yield css[i:brace].strip(), css[brace + 1:j - 1]
+        i = j
+
+
+def _squeeze(text):
+    text = re.sub(r'\s+', ' ', text).strip()
+    return re.sub(r' ?([{};,>]) ?', r'\1', text).replace(';}', '}')
+
+
+def _selectorUsed(selector, names, prefixes):
+    # :not(.x) matches whether or not x is used
+    selector = re.sub(r':not\([^)]*\)', '', selector)
+    for name in re.findall(r'[.#](-?[_a-zA-Z][\w-]*)', selector):
+        if name not in names and not name.startswith(prefixes):
+            return False
+    return True
+
+
+def pruneCss(css, names, prefixes):
+    """Return css without the rules none of whose selectors can match."""
+    out = []
+    for prelude, body in _blocks(css):
+        if body is None:
+            out.append(_squeeze(prelude) + ';')
+        elif prelude.startswith(('@media', '@supports')):
+            inner = pruneCss(body, names, prefixes)
+            if inner:
+                out.append('%s{%s}' % (_squeeze(prelude), inner))
+        elif prelude.startswith('@'):
+            out.append('%s{%s}' % (_squeeze(prelude), _squeeze(body).rstrip(';')))
+        else:
+            kept = [s for s in prelude.split(',') if _selectorUsed(s, names, prefixes)]
+            if kept:
+                body = re.sub(r'\s*:\s*', ':', _squeeze(body)).rstrip(';')
+                out.append('%s{%s}' % (_squeeze(','.join(kept)), body))
+    return '\n'.join(out)
+
+
+# - - - build - - - - - - - - - - - - - - - - - - - -
+
+def _emit(kind, text):
+    name = 'app.%s.%s' % (hashlib.sha1(text.encode('utf-8')).hexdigest()[:10], kind)
+    write(os.path.join(BUILD_DIR, name), text)
+    return '/build/' + name
+
+
+def _prune(kind):
+    builds = sorted(glob.glob(os.path.join(BUILD_DIR, 'app.*.' + kind)),
+                    key=os.path.getmtime, reverse=True)
+    for path in builds[KEEP_BUILDS:]:
+        os.remove(path)
+
+
+def _rewriteIndex(index, urls):
+    tags = {'css': '<link rel="stylesheet" href="%s">',
+            'js': '<script src="%s"></script>'}
+
+    def replace(match):
+        indent = re.match(r'[ \t]*', match.group(4)).group(0)
+        return '%s%s%s\n%s' % (match.group(1), indent,
+                               tags[match.group(2)] % urls[match.group(2)],
+                               match.group(4))
+    return BUILD_MARKER.sub(replace, index)
+
+
+def _firstLoad(paths):
+    return len(paths), sum(os.path.getsize(p) for p in paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--check', action='store_true',
+                        help='only report sizes, write nothing')
+    args = parser.parse_args()
+
+    index = read(INDEX)
+    partials = dict(('/' + os.path.relpath(p, STATIC_DIR).replace(os.sep, '/'),
+                     read(p)) for p in sorted(glob.glob(os.path.join(STATIC_DIR, PARTIALS))))
+    scripts = [read(os.path.join(STATIC_DIR, p)) for p in JS_SOURCES]
+
+    js = '\n'.join([minifyJs(s) for s in scripts] + [templateCache(
+        dict((url, minifyHtml(html)) for url, html in partials.items()))]) + '\n'
+    names, prefixes = usedNames([index] + list(partials.values()) + scripts)
+    css = '\n'.join(pruneCss(re.sub(r'/\*.*?\*/', '', read(os.path.join(STATIC_DIR, p)),
+                                    flags=re.S), names, prefixes)
+                    for p in CSS_SOURCES) + '\n'
+
+    # before: the local assets index.html links, plus the home partial
+    # the default route fetches
+    before = [os.path.join(STATIC_DIR, p) for p in JS_SOURCES + CSS_SOURCES]
+    before.append(os.path.join(STATIC_DIR, 'partials', 'home.html'))
+    count, size = _firstLoad(before)
+    sys.stdout.write('%-8s %3d requests %9d bytes\n' % ('before', count, size))
+    sys.stdout.write('%-8s %3d requests %9d bytes\n' % (
+        'after', 2, len(js.encode('utf-8')) + len(css.encode('utf-8'))))
+    if args.check:
+        return
+
+    if not os.path.isdir(BUILD_DIR):
+        os.makedirs(BUILD_DIR)
+    urls = {'js': _emit('js', js), 'css': _emit('css', css)}
+    _prune('js')
+    _prune('css')
+    write(INDEX, _rewriteIndex(index, urls))
+    sys.stdout.write('wrote %s and %s\n' % (urls['css'], urls['js']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+"""date_range_bench.py
+
+Benchmark date-window conference queries against a local datastore stub.
+
+Seeds --conferences Conferences with random cities and dates, then runs
+--queries random "starting between lo and hi in city C with seats left"
+windows three ways: bucket IN on startBuckets (what queryConferences now
+does), IN on month followed by trimming (the best the month field
+allowed), and an inequality on startDate, which leaves seatsAvailable to
+be filtered in memory. For each it reports time per query and entities
+fetched per matching conference. The stub is in-process, so compare the
+rows rather than read the times as production latency. The App Engine
+SDK must be importable, either already on sys.path or through --sdk.
+
+usage: python tools/date_range_bench.py [--sdk PATH] [--conferences N]
+           [--queries N] [--days N]
+
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BATCH_SIZE = 500
+CITIES = ['London', 'Paris', 'Berlin', 'Tokyo', 'Chicago', 'Sydney']
+FIRST_DAY = date(2016, 1, 1)
+SPAN_DAYS = 3 * 365
+MAX_BUCKETS = 30
+
+
+def seed(n, Conference, ndb):
+    for start in range(0, n, BATCH_SIZE):
+        confs = []
+        for i in range(start, min(start + BATCH_SIZE, n)):
+            startDate = FIRST_DAY + timedelta(days=random.randrange(SPAN_DAYS))
+            confs.append(Conference(
+                name='conf%d' % i, city=random.choice(CITIES),
+                startDate=startDate, month=startDate.month,
+                endDate=startDate + timedelta(days=random.randrange(4)),
+                maxAttendees=100, seatsAvailable=random.choice([0, 10, 50])))
+        ndb.put_multi(confs)
+
+
+def matches(conf, city, lo, hi):
+    return conf.city == city and conf.seatsAvailable > 0 and lo <= conf.startDate <= hi
+
+
+def byBuckets(Conference, datebuckets, city, lo, hi):
+    buckets, exact = datebuckets.cover(lo, hi, MAX_BUCKETS)
+    q = Conference.query(Conference.city == city, Conference.seatsAvailable > 0,
+                         Conference.startBuckets.IN(buckets))
+    return q.order(Conference.seatsAvailable, Conference.name).fetch()
+
+
+def byMonth(Conference, datebuckets, city, lo, hi):
+    months = sorted(set(d.month for d in (lo + timedelta(days=i)
+                                         for i in range((hi - lo).days + 1))))
+    q = Conference.query(Conference.city == city, Conference.seatsAvailable > 0,
+                         Conference.month.IN(months))
+    return q.order(Conference.seatsAvailable, Conference.name).fetch()
+
+
+def byInequality(Conference, datebuckets, city, lo, hi):
+    q = Conference.query(Conference.city == city,
+                         Conference.startDate >= datetime.combine(lo, datetime.min.time()),
+                         Conference.startDate <= datetime.combine(hi, datetime.min.time()))
+    return q.order(Conference.startDate, Conference.name).fetch()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sdk', help='path to the App Engine Python SDK')
+    parser.add_argument('--conferences', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--days', type=int, default=45,
+                        help='maximum length of a query window')
+    args = parser.parse_args()
+
+    sys.path.insert(0, APP_DIR)
+    if args.sdk:
+        sys.path.insert(1, args.sdk)
+        import dev_appserver
+        dev_appserver.fix_sys_path()
+    from google.appengine.ext import ndb
+    from google.appengine.ext import testbed
+    from google.appengine.datastore import datastore_stub_util
+
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_datastore_v3_stub(consistency_policy=
+        datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability=1))
+    bed.init_memcache_stub()
+    ndb.get_context().set_cache_policy(False)
+
+    from models import Conference
+    import datebuckets
+
+    start = time.time()
+    seed(args.conferences, Conference, ndb)
+    sys.stdout.write('seeded %d conferences in %.1fs\n' % (args.conferences, time.time() - start))
+
+    windows = []
+    for _ in range(args.queries):
+        lo = FIRST_DAY + timedelta(days=random.randrange(SPAN_DAYS))
+        windows.append((random.choice(CITIES), lo,
+                        lo + timedelta(days=random.randrange(args.days))))
+
+    sys.stdout.write('%-14s %12s %16s\n' % ('method', 'ms/query', 'fetched/match'))
+    for label, run in (('buckets', byBuckets), ('month', byMonth),
+                       ('inequality', byInequality)):
+        fetched = matched = 0
+        start = time.time()
+        for city, lo, hi in windows:
+            confs = run(Conference, datebuckets, city, lo, hi)
+            fetched += len(confs)
+            matched += len([c for c in confs if matches(c, city, lo, hi)])
+        took = time.time() - start
+        sys.stdout.write('%-14s %12.2f %16.2f\n' % (
+            label, took * 1000 / len(windows), fetched / float(matched or 1)))
+    bed.deactivate()
+
+
+if __name__ == '__main__':
+    main()
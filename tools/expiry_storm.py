@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+"""expiry_storm.py
+
+Fire a burst of concurrent reads at one API endpoint, to measure how
+many of them reach the datastore when the cached value has just expired.
+
+Flush memcache (or wait for the entry to expire), note the counters at
+/admin/cache_stats, run this script, then read the counters again: the
+increase in 'compute' + 'fallback' is the number of datastore rounds the
+burst caused, against the number of requests printed here.
+
+usage: python tools/expiry_storm.py --url URL [--clients 50] [--token T]
+
+"""
+
+import argparse
+import sys
+import threading
+import time
+
+try:
+    import urllib2 as urlrequest
+except ImportError:
+    import urllib.request as urlrequest
+
+
+def fetch(url, token, results):
+    req = urlrequest.Request(url)
+    if token:
+        req.add_header('Authorization', 'Bearer %s' % token)
+    start = time.time()
+    try:
+        status = urlrequest.urlopen(req).getcode()
+    except Exception as e:
+        status = getattr(e, 'code', 0)
+    results.append((status, time.time() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', required=True)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--token')
+    args = parser.parse_args()
+
+    results = []
+    threads = [threading.Thread(target=fetch, args=(args.url, args.token, results))
+               for _ in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    took = sorted(t for _, t in results)
+    ok = len([s for s, _ in results if s == 200])
+    sys.stdout.write('%d requests, %d ok, p50 %.0fms, max %.0fms\n' % (
+        len(results), ok, took[len(took) // 2] * 1000, took[-1] * 1000))
+
+
+if __name__ == '__main__':
+    main()
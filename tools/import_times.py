@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""import_times.py
+
+Report the cold import time of each application module, to track
+instance start-up cost.
+
+Every module is imported in a fresh interpreter so that nothing is
+already cached in sys.modules; the reported time is the median over
+several runs. The App Engine SDK must be importable, either already on
+sys.path or through --sdk.
+
+usage: python tools/import_times.py [--sdk PATH] [--runs N] [module ...]
+
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = [
+    'settings',
+    'models',
+    'utils',
+    'tasks',
+    'main',
+    'conference',
+]
+
+TIMER_SRC = '''
+import sys, time
+sys.path[0:0] = %(path)r
+%(setup)s
+start = time.time()
+__import__(%(module)r)
+sys.stdout.write('%%f' %% (time.time() - start))
+'''
+
+SDK_SETUP = '''
+import dev_appserver
+dev_appserver.fix_sys_path()
+'''
+
+
+def timeImport(module, sdk=None):
+    """Return seconds taken to import module in a new interpreter."""
+    path = [APP_DIR]
+    if sdk:
+        path.append(sdk)
+    src = TIMER_SRC % {
+        'path': path,
+        'setup': SDK_SETUP if sdk else '',
+        'module': module,
+    }
+    out = subprocess.check_output([sys.executable, '-c', src], cwd=APP_DIR)
+    return float(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sdk', help='path to the App Engine Python SDK')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    args = parser.parse_args()
+
+    sys.stdout.write('%-12s %10s\n' % ('module', 'ms'))
+    for module in args.modules:
+        times = sorted(timeImport(module, args.sdk) for _ in range(args.runs))
+        median = times[len(times) // 2]
+        sys.stdout.write('%-12s %10.1f\n' % (module, median * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+
+"""index_analyzer.py
+
+Estimate the index rows written per entity put for each kind in
+models.py and index.yaml, and report which indexed properties and
+composite indexes are never used by the app's queries.
+
+Rows per put of a new entity are counted the way the datastore writes
+them: one row in the kind index, two rows (ascending and descending) per
+value of every indexed property, and for each composite index the
+product of its properties' value counts, times the ancestor path length
+for ancestor indexes. A repeated property is assumed to hold --repeated
+values (default 3; override per property with Kind.prop=N). Updating an
+entity deletes and rewrites the rows of every changed value, so an
+update costs up to twice these figures for the properties it changes.
+
+Queried properties are found by reading the app modules with ast:
+comparisons against Model.prop, .order(Model.prop), Model.prop.IN()
+and .bothForms() filters, projections, Model.prop assigned to a variable
+for later use in a filter, and the field names in DYNAMIC_FIELDS that
+conference.py and topicindex.py use to build queryConferences filters
+at run time. Kinds in DERIVED are written along with another kind, one
+entity per value of one of its properties, and are added to its total.
+
+usage: python tools/index_analyzer.py [--repeated N] [Kind.prop=N ...]
+
+"""
+
+import argparse
+import ast
+import glob
+import os
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# name of a dict, tuple or list of field names: kinds it filters
+DYNAMIC_FIELDS = {'FIELDS': ('Conference', 'ConferenceTopic'),
+                  'DATE_BUCKETS': ('Conference', 'ConferenceTopic'),
+                  'QUERYABLE': ('ConferenceTopic',)}
+# entities in the ancestor path, including the entity itself
+PATH_DEPTH = {'Conference': 2, 'ConferenceTopic': 3, 'Session': 3}
+# kinds written with another kind, one entity per value of its property
+DERIVED = {'ConferenceTopic': ('Conference', 'topics')}
+
+UNINDEXED_TYPES = ('TextProperty', 'BlobProperty', 'JsonProperty',
+                   'PickleProperty', 'LocalStructuredProperty')
+
+
+def _name(node):
+    return getattr(node, 'id', None) or getattr(node, 'attr', None)
+
+
+def _constant(node):
+    if hasattr(ast, 'Constant') and isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Str):
+        return node.s
+    if isinstance(node, ast.Num):
+        return node.n
+    if isinstance(node, ast.Name) and node.id in ('True', 'False', 'None'):
+        return {'True': True, 'False': False, 'None': None}[node.id]
+    return None
+
+
+def readModels(path):
+    """Return {kind: {prop: {'indexed': bool, 'repeated': bool}}}."""
+    tree = ast.parse(open(path).read())
+    kinds = {}
+    for cls in tree.body:
+        if not isinstance(cls, ast.ClassDef):
+            continue
+        if not any(_name(base) == 'Model' for base in cls.bases):
+            continue
+        props = {}
+        for stmt in cls.body:
+            if not (isinstance(stmt, ast.Assign) and isinstance(stmt.value, ast.Call)):
+                continue
+            ptype = _name(stmt.value.func)
+            if not ptype or not ptype.endswith('Property'):
+                continue
+            options = dict((kw.arg, _constant(kw.value)) for kw in stmt.value.keywords)
+            indexed = options.get('indexed', ptype not in UNINDEXED_TYPES)
+            for target in stmt.targets:
+                props[target.id] = {'indexed': indexed is not False,
+                                    'repeated': bool(options.get('repeated'))}
+        kinds[cls.name] = props
+    return kinds
+
+
+def readIndexes(path):
+    """Return [{'kind', 'ancestor', 'properties'}] from index.yaml."""
+    indexes = []
+    current = None
+    for line in open(path):
+        line = line.split('#')[0].rstrip()
+        stripped = line.strip()
+        if stripped.startswith('- kind:'):
+            current = {'kind': stripped.split(':', 1)[1].strip(),
+                       'ancestor': False, 'properties': []}
+            indexes.append(current)
+        elif current and stripped.startswith('ancestor:'):
+            current['ancestor'] = stripped.split(':', 1)[1].strip() in ('yes', 'true')
+        elif current and stripped.startswith('- name:'):
+            current['properties'].append(stripped.split(':', 1)[1].strip())
+    return indexes
+
+
+def readQueriedProperties(paths, kinds):
+    """Return {kind: set(props)} referenced by queries in the modules."""
+    used = dict((kind, set()) for kind in kinds)
+
+    def note(node):
+        if isinstance(node, ast.UnaryOp):
+            node = node.operand
+        if (isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name)
+                and node.value.id in kinds and node.attr in kinds[node.value.id]):
+            used[node.value.id].add(node.attr)
+
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        tree = ast.parse(open(path).read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Compare):
+                note(node.left)
+                for comparator in node.comparators:
+                    note(comparator)
+            elif isinstance(node, ast.Call):
+                if _name(node.func) == 'order':
+                    for arg in node.args:
+                        note(arg)
+                elif _name(node.func) in ('IN', 'bothForms'):
+                    note(node.func.value)
+                for kw in node.keywords:
+                    if kw.arg == 'projection' and isinstance(kw.value, (ast.List, ast.Tuple)):
+                        for elt in kw.value.elts:
+                            note(elt)
+            elif isinstance(node, ast.Assign) and isinstance(node.value, ast.Attribute):
+                note(node.value)
+            elif isinstance(node, ast.Assign) and isinstance(
+                    node.value, (ast.Dict, ast.Tuple, ast.List)):
+                values = (node.value.values if isinstance(node.value, ast.Dict)
+                          else node.value.elts)
+                for target in node.targets:
+                    for kind in DYNAMIC_FIELDS.get(getattr(target, 'id', None), ()):
+                        if kind in used:
+                            used[kind].update(p for p in map(_constant, values)
+                                              if p in kinds[kind])
+    return used
+
+
+def valueCount(kind, prop, props, repeated, overrides):
+    if not props.get(prop, {}).get('repeated'):
+        return 1
+    return overrides.get('%s.%s' % (kind, prop), repeated)
+
+
+def analyze(kinds, indexes, used, repeated, overrides, out):
+    totals = {}
+    for kind in sorted(kinds):
+        props = kinds[kind]
+        out.write('\n%s\n%s\n' % (kind, '=' * len(kind)))
+        out.write('%-26s %8s %9s %8s  %s\n' % ('property', 'indexed', 'values', 'rows', 'queried'))
+        builtin = 1    # kind index
+        saving = 0
+        for prop in sorted(props):
+            info = props[prop]
+            n = valueCount(kind, prop, props, repeated, overrides)
+            rows = 2 * n if info['indexed'] else 0
+            builtin += rows
+            queried = prop in used.get(kind, ())
+            if info['indexed'] and not queried:
+                saving += rows
+            out.write('%-26s %8s %9d %8d  %s\n' % (
+                prop, 'yes' if info['indexed'] else 'no', n, rows,
+                'yes' if queried else ('NEVER' if info['indexed'] else '-')))
+
+        composite = 0
+        kind_indexes = [i for i in indexes if i['kind'] == kind]
+        if kind_indexes:
+            out.write('\n%-50s %8s  %s\n' % ('composite index', 'rows', 'note'))
+        for index in kind_indexes:
+            rows = PATH_DEPTH.get(kind, 1) if index['ancestor'] else 1
+            for prop in index['properties']:
+                rows *= valueCount(kind, prop, props, repeated, overrides)
+            unused = [p for p in index['properties'] if p not in used.get(kind, ())]
+            label = ('ancestor, ' if index['ancestor'] else '') + ', '.join(index['properties'])
+            composite += rows
+            out.write('%-50s %8d  %s\n' % (label[:50], rows,
+                      'uses never-queried %s' % ', '.join(unused) if unused else ''))
+
+        out.write('\nrows per new %s put: %d built-in + %d composite = %d\n' % (
+            kind, builtin, composite, builtin + composite))
+        if saving:
+            out.write('unindexing never-queried properties saves %d rows per put\n' % saving)
+        totals[kind] = builtin + composite
+
+    for kind, (owner, prop) in sorted(DERIVED.items()):
+        if kind not in totals or owner not in totals:
+            continue
+        n = valueCount(owner, prop, kinds[owner], repeated, overrides)
+        out.write('\nrows per new %s put with its %d %s entities: %d + %d x %d = %d\n' % (
+            owner, n, kind, totals[owner], n, totals[kind],
+            totals[owner] + n * totals[kind]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--repeated', type=int, default=3,
+                        help='assumed number of values of a repeated property')
+    parser.add_argument('overrides', nargs='*', metavar='Kind.prop=N')
+    args = parser.parse_args()
+    overrides = dict((o.split('=')[0], int(o.split('=')[1])) for o in args.overrides)
+
+    kinds = readModels(os.path.join(APP_DIR, 'models.py'))
+    indexes = readIndexes(os.path.join(APP_DIR, 'index.yaml'))
+    modules = [path for path in glob.glob(os.path.join(APP_DIR, '*.py'))
+               if os.path.basename(path) != 'models.py']
+    used = readQueriedProperties(modules, kinds)
+    analyze(kinds, indexes, used, args.repeated, overrides, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
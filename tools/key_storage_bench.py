@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""key_storage_bench.py
+
+Compare the stored size and decode time of a Profile whose attendance
+and wishlist keys are websafe strings (the old layout) with one holding
+native keys.
+
+Both layouts are encoded to the entity protobuf the datastore stores.
+Decode times cover turning that protobuf back into an entity and, for
+the old layout, parsing each string with ndb.Key(urlsafe=...) as the
+endpoints did. The dual-read row decodes an old entity through the new
+model, which is what happens until the Profile has been re-saved. The
+App Engine SDK must be importable, either already on sys.path or
+through --sdk.
+
+usage: python tools/key_storage_bench.py [--sdk PATH] [--keys N] [--runs N]
+
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sdk', help='path to the App Engine Python SDK')
+    parser.add_argument('--keys', type=int, default=20,
+                        help='conferences attended and sessions wishlisted')
+    parser.add_argument('--runs', type=int, default=10000)
+    args = parser.parse_args()
+
+    sys.path.insert(0, APP_DIR)
+    if args.sdk:
+        sys.path.insert(1, args.sdk)
+        import dev_appserver
+        dev_appserver.fix_sys_path()
+    os.environ.setdefault('APPLICATION_ID', 'dev~conference-central')
+    from google.appengine.ext import ndb
+    from models import Profile
+
+    class LegacyProfile(ndb.Model):
+        """Profile as stored before the keys became native."""
+        @classmethod
+        def _get_kind(cls):
+            return 'Profile'
+
+        displayName = ndb.StringProperty()
+        mainEmail = ndb.StringProperty()
+        teeShirtSize = ndb.StringProperty()
+        conferenceKeysToAttend = ndb.StringProperty(repeated=True)
+        sessionKeysWishList = ndb.StringProperty(repeated=True)
+
+    owner = ndb.Key('Profile', 'someone@example.com')
+    conf_keys = [ndb.Key('Conference', 5000000000 + i, parent=owner)
+                 for i in range(args.keys)]
+    session_keys = [ndb.Key('Session', 6000000000 + i, parent=conf_keys[i])
+                    for i in range(args.keys)]
+    fields = dict(displayName='Someone', mainEmail='someone@example.com',
+                  teeShirtSize='M_M')
+
+    legacy_pb = LegacyProfile(
+        id='someone@example.com',
+        conferenceKeysToAttend=[k.urlsafe() for k in conf_keys],
+        sessionKeysWishList=[k.urlsafe() for k in session_keys], **fields)._to_pb()
+    native_pb = Profile(
+        id='someone@example.com', conferenceKeysToAttend=conf_keys,
+        sessionKeysWishList=session_keys, **fields)._to_pb()
+
+    def oldRead():
+        prof = LegacyProfile._from_pb(legacy_pb)
+        [ndb.Key(urlsafe=s) for s in prof.conferenceKeysToAttend]
+        [ndb.Key(urlsafe=s) for s in prof.sessionKeysWishList]
+
+    sys.stdout.write('%-22s %10s %12s\n' % ('layout', 'bytes', 'us/decode'))
+    for label, pb, read in (
+            ('websafe strings', legacy_pb, oldRead),
+            ('native keys', native_pb, lambda: Profile._from_pb(native_pb)),
+            ('dual-read of strings', legacy_pb, lambda: Profile._from_pb(legacy_pb))):
+        took = timeit.timeit(read, number=args.runs)
+        sys.stdout.write('%-22s %10d %12.1f\n' % (
+            label, len(pb.Encode()), took * 1e6 / args.runs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+"""loadtest.py
+
+Hammer a conference API endpoint from several clients at once and report
+per-client status codes, throughput and latency.
+
+One "steady" client calls at a fixed rate while the "abusive" clients
+call as fast as they can. With the rate limiter in place the abusive
+clients should mostly get 429s and the steady client's throughput and
+latency should stay flat.
+
+usage: python tools/loadtest.py --url URL --steady-token T --abuse-token T
+           [--method POST] [--abusers 20] [--seconds 60] [--steady-rate 1]
+
+Tokens are OAuth2 access tokens for the two users, e.g. from
+`gcloud auth print-access-token`.
+
+"""
+
+import argparse
+import collections
+import sys
+import threading
+import time
+
+try:
+    import urllib2 as urlrequest
+except ImportError:
+    import urllib.request as urlrequest
+
+
+def call(url, method, token):
+    """Make one API call; return (status, seconds)."""
+    req = urlrequest.Request(url, data=b'{}' if method != 'GET' else None)
+    req.get_method = lambda: method
+    req.add_header('Content-Type', 'application/json')
+    req.add_header('Authorization', 'Bearer %s' % token)
+    start = time.time()
+    try:
+        status = urlrequest.urlopen(req).getcode()
+    except Exception as e:
+        status = getattr(e, 'code', 0)
+    return status, time.time() - start
+
+
+def worker(name, url, method, token, deadline, interval, results):
+    while time.time() < deadline:
+        status, took = call(url, method, token)
+        results[name].append((status, took))
+        if interval:
+            time.sleep(max(0, interval - took))
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', required=True)
+    parser.add_argument('--method', default='POST')
+    parser.add_argument('--steady-token', required=True)
+    parser.add_argument('--abuse-token', required=True)
+    parser.add_argument('--abusers', type=int, default=20)
+    parser.add_argument('--seconds', type=int, default=60)
+    parser.add_argument('--steady-rate', type=float, default=1.0)
+    args = parser.parse_args()
+
+    deadline = time.time() + args.seconds
+    results = collections.defaultdict(list)
+    threads = [threading.Thread(target=worker, args=(
+        'steady', args.url, args.method, args.steady_token, deadline,
+        1.0 / args.steady_rate, results))]
+    for i in range(args.abusers):
+        threads.append(threading.Thread(target=worker, args=(
+            'abuse', args.url, args.method, args.abuse_token, deadline,
+            0, results)))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for name in ('steady', 'abuse'):
+        calls = results[name]
+        statuses = collections.Counter(status for status, _ in calls)
+        ok = [took for status, took in calls if status < 400]
+        sys.stdout.write('%s: %d calls, %.1f ok/s, p50 %.0fms, p95 %.0fms, %s\n' % (
+            name, len(calls), len(ok) / float(args.seconds),
+            percentile(ok, 0.5) * 1000, percentile(ok, 0.95) * 1000,
+            dict(statuses)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""userid_bench.py
+
+Benchmark resolving a user id from an email on the custom id_type path,
+against local datastore and memcache stubs.
+
+Seeds --users Profiles and UserIdMappings, then times --lookups random
+emails through each path: a Profile query on mainEmail (what the old
+code meant to do), a UserIdMapping get from the datastore, and
+utils.getUserId served from memcache and from process memory. The stubs
+are in-process, so the numbers compare the paths rather than predict
+production latency; the query is the one that grows with the number of
+users. The App Engine SDK must be importable, either already on sys.path
+or through --sdk.
+
+usage: python tools/userid_bench.py [--sdk PATH] [--users N] [--lookups N]
+
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BATCH_SIZE = 500
+
+
+class FakeUser(object):
+    def __init__(self, email):
+        self._email = email
+
+    def email(self):
+        return self._email
+
+
+def emailFor(i):
+    return 'user%d@example.com' % i
+
+
+def seed(users, Profile, UserIdMapping, ndb):
+    for start in range(0, users, BATCH_SIZE):
+        entities = []
+        for i in range(start, min(start + BATCH_SIZE, users)):
+            entities.append(Profile(id='id%d' % i, mainEmail=emailFor(i)))
+            entities.append(UserIdMapping(id=emailFor(i), userId='id%d' % i))
+        ndb.put_multi(entities)
+
+
+def timed(label, emails, lookup):
+    start = time.time()
+    for email in emails:
+        lookup(email)
+    took = time.time() - start
+    sys.stdout.write('%-24s %10.3f ms/lookup\n' % (label, took * 1000 / len(emails)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sdk', help='path to the App Engine Python SDK')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    sys.path.insert(0, APP_DIR)
+    if args.sdk:
+        sys.path.insert(1, args.sdk)
+        import dev_appserver
+        dev_appserver.fix_sys_path()
+    from google.appengine.ext import ndb
+    from google.appengine.ext import testbed
+    from google.appengine.datastore import datastore_stub_util
+
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_datastore_v3_stub(consistency_policy=
+        datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability=1))
+    bed.init_memcache_stub()
+    ndb.get_context().set_cache_policy(False)
+
+    from models import Profile
+    from models import UserIdMapping
+    import utils
+
+    start = time.time()
+    seed(args.users, Profile, UserIdMapping, ndb)
+    sys.stdout.write('seeded %d users in %.1fs\n' % (args.users, time.time() - start))
+
+    emails = [emailFor(random.randrange(args.users)) for _ in range(args.lookups)]
+    users = [FakeUser(email) for email in emails]
+
+    timed('Profile query', emails,
+          lambda email: Profile.query(Profile.mainEmail == email).get(keys_only=True))
+    timed('UserIdMapping get', emails,
+          lambda email: ndb.Key(UserIdMapping, email).get())
+    # first pass fills memcache; clearing the local tier leaves memcache hits
+    for user in users:
+        utils.getUserId(user, id_type='custom')
+    utils.USER_IDS._entries.clear()
+    timed('getUserId, memcache', users,
+          lambda user: (utils.getUserId(user, id_type='custom'),
+                        utils.USER_IDS._entries.clear()))
+    timed('getUserId, in-process', users,
+          lambda user: utils.getUserId(user, id_type='custom'))
+    bed.deactivate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""topicindex.py
+
+Per-topic index entities for conference topic queries
+
+Conference.topics is repeated, so while it was indexed every composite
+index holding it wrote one row per topic on each Conference put, and a
+topic filter could only be combined with the filters some composite
+index happened to cover. Instead every Conference has one
+ConferenceTopic child per topic carrying the fields queries filter on
+that only change when the conference is created or updated. Topic
+queries run against ConferenceTopic and batch-get the conferences.
+
+seatsAvailable changes with every registration and endDate is rarely
+combined with a topic, so they are not carried: queryConferences
+applies those filters in memory to the fetched conferences.
+
+"""
+
+from google.appengine.ext import ndb
+
+from models import ConferenceTopic
+
+# Conference fields copied to each ConferenceTopic
+CARRIED = ('name', 'city', 'month', 'maxAttendees', 'startDate')
+# fields a ConferenceTopic query can filter on
+QUERYABLE = ('name', 'city', 'month', 'maxAttendees', 'startBuckets')
+
+
+def entitiesFor(conf):
+    """Return the ConferenceTopic entities of conf, one per topic."""
+    data = dict((name, getattr(conf, name)) for name in CARRIED)
+    return [ConferenceTopic(parent=conf.key, id=topic, topic=topic, **data)
+            for topic in sorted(set(conf.topics)) if topic]
+
+
+def sync(conf):
+    """Write conf's topic entities and delete those of topics it no
+    longer has. Call it in the transaction that puts conf.
+    """
+    entities = entitiesFor(conf)
+    current = set(entity.key for entity in entities)
+    stale = [key for key in ConferenceTopic.query(ancestor=conf.key).fetch(keys_only=True)
+             if key not in current]
+    ndb.put_multi(entities)
+    if stale:
+        ndb.delete_multi(stale)
+
+
+def fetchConferences(query):
+    """Run a ConferenceTopic query; return its conferences once each, in
+    the order the query first finds them.
+    """
+    c_keys = []
+    seen = set()
+    for key in query.fetch(keys_only=True):
+        if key.parent() not in seen:
+            seen.add(key.parent())
+            c_keys.append(key.parent())
+    return [conf for conf in ndb.get_multi(c_keys) if conf]
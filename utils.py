@@ -4,7 +4,20 @@ import time
 import uuid
 
 from google.appengine.api import urlfetch
-from models import Profile
+from models import UserIdMapping
+
+import lrucache
+
+# a mapping never changes, so instances can keep it for a long time
+USER_IDS = lrucache.TwoTierCache('userIds', max_entries=10000, ttl=3600,
+                                 memcache_ttl=24 * 3600)
+
+
+def _customUserId(email):
+    """Return the user id mapped to email, creating the mapping once."""
+    mapping = UserIdMapping.get_or_insert(email, userId=uuid.uuid1().get_hex())
+    return mapping.userId
+
 
 def getUserId(user, id_type="email"):
     if id_type == "email":
@@ -35,11 +48,7 @@ def getUserId(user, id_type="email"):
         return user.get('user_id', '')
 
     if id_type == "custom":
-        # implement your own user_id creation and getting algorythm
-        # this is just a sample that queries datastore for an existing profile
-        # and generates an id if profile does not exist for an email
-        profile = Conference.query(Conference.mainEmail == user.email())
-        if profile:
-            return profile.id()
-        else:
-            return str(uuid.uuid1().get_hex())
+        # one UserIdMapping per email, created transactionally on first use;
+        # after that a lookup is served from process memory or memcache
+        email = user.email().lower()
+        return USER_IDS.get(email, _customUserId)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+"""waitlist.py
+
+FIFO waitlist for sold-out conferences with asynchronous promotion
+
+Waitlist entries are root entities, outside the Conference entity group,
+so joining a waitlist never contends with registration. Unregistering
+schedules a promotion task whose name is derived from the conference and
+a PROMOTION_WINDOW-second time slot: every unregistration in the same
+slot maps to the same task, so a burst of freed seats is handled by one
+task instead of one per seat. The task moves waitlisted users into the
+conference in batches of PROMOTION_BATCH_SIZE per transaction, oldest
+entry first.
+
+"""
+
+import hashlib
+import time
+from datetime import datetime
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import Profile
+from models import WaitlistEntry
+
+import regstats
+import singleflight
+from tasks import MEMCACHE_CONFERENCE_PREFIX
+from tasks import MEMCACHE_RECOMMENDATIONS_PREFIX
+
+PROMOTION_WINDOW = 10       # seconds of unregistrations handled by one task
+PROMOTION_BATCH_SIZE = 10   # users per transaction; 1 + 2 * 10 entity groups
+MAX_PROMOTION_BATCHES = 50
+
+
+def join(wsck, user_id):
+    """Add user to the end of the conference waitlist; False if already on it."""
+    key = WaitlistEntry.keyFor(wsck, user_id)
+
+    @ndb.transactional()
+    def txn():
+        if key.get():
+            return False
+        WaitlistEntry(key=key, conferenceKey=wsck, userId=user_id,
+                      joined=datetime.utcnow()).put()
+        return True
+    return txn()
+
+
+def leave(wsck, user_id):
+    """Remove user from the conference waitlist; False if not on it."""
+    key = WaitlistEntry.keyFor(wsck, user_id)
+    if not key.get():
+        return False
+    key.delete()
+    return True
+
+
+def schedulePromotion(wsck, now=None):
+    """Enqueue the promotion task for this conference and time slot."""
+    if now is None:
+        now = time.time()
+    slot = int(now // PROMOTION_WINDOW)
+    name = 'promote-%s-%d' % (hashlib.sha1(wsck).hexdigest(), slot)
+    try:
+        taskqueue.add(name=name, url='/tasks/promote_waitlist',
+                      params={'websafeConferenceKey': wsck},
+                      countdown=(slot + 1) * PROMOTION_WINDOW - now)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass    # a task for this slot is already pending or has run
+
+
+@ndb.transactional(xg=True)
+def _promoteBatch(c_key, entries):
+    """Register entries' users while seats last; return (promoted
+    Profiles, whether promotion should stop).
+    """
+    conf = c_key.get()
+    if not conf or conf.deleted or conf.seatsAvailable <= 0:
+        return [], True
+    wsck = c_key.urlsafe()
+    entries = [e for e in ndb.get_multi([e.key for e in entries]) if e]
+    profiles = ndb.get_multi([ndb.Key(Profile, e.userId) for e in entries])
+
+    promoted = []
+    done = []
+    for entry, prof in zip(entries, profiles):
+        if conf.seatsAvailable <= 0:
+            break
+        done.append(entry.key)
+        if not prof or c_key in prof.conferenceKeysToAttend:
+            continue
+        prof.conferenceKeysToAttend.append(c_key)
+        conf.seatsAvailable -= 1
+        promoted.append(prof)
+
+    ndb.put_multi([conf] + promoted)
+    ndb.delete_multi(done)
+    if promoted:
+        regstats.record(wsck, True, count=len(promoted))
+    # stop when full, or when the query only returned already deleted entries
+    return promoted, conf.seatsAvailable <= 0 or not done
+
+
+def promote(wsck):
+    """Move waitlisted users into the conference until it is full or the
+    waitlist is empty; return the user ids promoted.
+    """
+    c_key = ndb.Key(urlsafe=wsck)
+    promoted = []
+    for _ in range(MAX_PROMOTION_BATCHES):
+        entries = WaitlistEntry.query(WaitlistEntry.conferenceKey==wsck) \
+            .order(WaitlistEntry.joined).fetch(PROMOTION_BATCH_SIZE)
+        if not entries:
+            break
+        profiles, stop = _promoteBatch(c_key, entries)
+        promoted.extend(prof.key.id() for prof in profiles)
+        if profiles:
+            singleflight.expire(MEMCACHE_CONFERENCE_PREFIX + wsck)
+            memcache.delete_multi([prof.key.id() for prof in profiles],
+                                  key_prefix=MEMCACHE_RECOMMENDATIONS_PREFIX)
+        if stop:
+            break
+    else:
+        # more work than one task should do; carry on in a fresh one
+        schedulePromotion(wsck)
+    return promoted